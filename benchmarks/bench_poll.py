@@ -0,0 +1,86 @@
+"""
+Compares the two Rust -> Python transfer paths at high event rates.
+
+legacy: poll_state() -> list[str] -> json.loads -> normalize -> WalWriter.append (json.dumps)
+jsonl:  poll_state_jsonl() -> one bytes buffer -> WalWriter.append_raw
+
+The sampler runs with poll_interval_ms=0 so the channel fills up to its
+capacity (10k events) between drains; each round times one full drain + WAL
+write. Requires the built extension (maturin develop).
+
+    python -m benchmarks.bench_poll --rounds 20
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+from mitschreiber._mitschreiber import start_session, stop_session, poll_state, poll_state_jsonl
+from mitschreiber.session import WalWriter
+
+
+def _legacy(session_id: str, writer: WalWriter) -> int:
+    n = 0
+    for raw_evt in poll_state(session_id):
+        evt = json.loads(raw_evt)
+        evt["source"] = "os.context.state"
+        evt["session"] = session_id
+        writer.append(evt)
+        n += 1
+    return n
+
+
+def _jsonl(session_id: str, writer: WalWriter) -> int:
+    raw = poll_state_jsonl(session_id)
+    writer.append_raw(raw)
+    return raw.count(b"\n")
+
+
+def _run(name: str, drain, rounds: int, fill_s: float, wal: Path) -> dict:
+    session_id = f"bench-{uuid.uuid4()}"
+    start_session(session_id, {"poll_interval_ms": 0})
+    events, elapsed = 0, 0.0
+    try:
+        with WalWriter(wal) as writer:
+            for _ in range(rounds):
+                time.sleep(fill_s)
+                t0 = time.perf_counter()
+                events += drain(session_id, writer)
+                elapsed += time.perf_counter() - t0
+    finally:
+        stop_session(session_id)
+    return {
+        "path": name,
+        "events": events,
+        "seconds": round(elapsed, 4),
+        "events_per_s": round(events / elapsed) if elapsed else 0,
+        "us_per_event": round(elapsed / events * 1e6, 3) if events else 0.0,
+    }
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser("bench_poll")
+    p.add_argument("--rounds", type=int, default=20)
+    p.add_argument("--fill", type=float, default=0.2, help="Seconds the sampler fills the channel per round.")
+    args = p.parse_args(argv)
+
+    # Force the stub sampler so the numbers do not depend on an X server.
+    os.environ.pop("DISPLAY", None)
+    with tempfile.TemporaryDirectory() as tmp:
+        results = [
+            _run("legacy", _legacy, args.rounds, args.fill, Path(tmp) / "legacy.jsonl"),
+            _run("jsonl", _jsonl, args.rounds, args.fill, Path(tmp) / "jsonl.jsonl"),
+        ]
+    for r in results:
+        print(json.dumps(r))
+    legacy, fast = results
+    if legacy["us_per_event"] and fast["us_per_event"]:
+        print(f"speedup: {legacy['us_per_event'] / fast['us_per_event']:.1f}x per event")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+WAL append throughput: per-record writes vs group commit, per durability policy.
+
+Each scenario appends the same synthetic os.context.state records; group-commit
+scenarios commit every --batch records (one commit per poll batch in run_session).
+
+    python -m benchmarks.bench_wal --events 20000 --batch 64
+"""
+from __future__ import annotations
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+from mitschreiber.wal import WalWriter
+
+SCENARIOS = [
+    # (name, group_commit, durability, sync_every)
+    ("per-record/flush", False, "flush", 0),
+    ("per-record/fdatasync", False, "fdatasync", 1),
+    ("group/none", True, "none", 0),
+    ("group/flush", True, "flush", 0),
+    ("group/fdatasync", True, "fdatasync", 0),
+]
+
+
+def _records(n: int) -> list[dict]:
+    return [
+        {
+            "ts": f"2025-01-01T12:00:{n % 60:02d}.{n:06d}Z",
+            "app": "vscode" if n % 3 else "firefox",
+            "window": f"file-{n % 50}.py — mitschreiber",
+            "clipboard": None,
+            "source": "os.context.state",
+            "session": "bench",
+        }
+        for n in range(n)
+    ]
+
+
+def run_scenario(path: Path, records: list[dict], group_commit: bool, durability: str,
+                 sync_every: int, batch: int, sync_interval_ms: int = 100) -> dict:
+    t0 = time.perf_counter()
+    with WalWriter(path, group_commit=group_commit, durability=durability,
+                   sync_interval_ms=sync_interval_ms, sync_every=sync_every) as writer:
+        for i, rec in enumerate(records, 1):
+            writer.append(rec)
+            if i % batch == 0:
+                writer.commit()
+    elapsed = time.perf_counter() - t0
+    return {"events": len(records), "seconds": round(elapsed, 4),
+            "events_per_s": round(len(records) / elapsed)}
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser("bench_wal")
+    p.add_argument("--events", type=int, default=20_000)
+    p.add_argument("--batch", type=int, default=64, help="Records per commit in group-commit mode.")
+    args = p.parse_args(argv)
+
+    records = _records(args.events)
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, group, durability, sync_every in SCENARIOS:
+            # Per-record fdatasync is slow by design; keep its run short.
+            n = min(len(records), 1000) if (not group and durability == "fdatasync") else len(records)
+            r = run_scenario(Path(tmp) / f"{name.replace('/', '-')}.jsonl", records[:n],
+                             group, durability, sync_every, args.batch)
+            print(json.dumps({"scenario": name, **r}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Recall versus size for the embed encodings (quantize.py).
+
+Embeds a sample corpus of window titles with the chosen backend, compacts it
+with every encoding / truncation combination and reports per setting:
+bytes per event as JSONL and as binary WAL record, and recall@k of the
+compacted vectors against exact float32 search (queries: held-out titles).
+
+    python -m benchmarks.quantize_eval                        # hash backend, synthetic corpus
+    python -m benchmarks.quantize_eval --embed-backend onnx --embed-model ~/models/minilm
+    python -m benchmarks.quantize_eval --corpus titles.txt --dims 64,128 --json
+
+Needs numpy (pip install mitschreiber[search]). The hash backend has no
+semantics, so its numbers only show quantization noise; judge truncation
+with the real model.
+"""
+from __future__ import annotations
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+from benchmarks.suite import window_title
+
+
+def _recall(truth, approx, k: int) -> float:
+    hits = sum(len(set(t[:k]) & set(a[:k])) for t, a in zip(truth, approx))
+    return hits / (len(truth) * k)
+
+
+def _top_k(np, corpus, queries, k: int):
+    scores = queries @ corpus.T
+    return np.argsort(-scores, axis=1)[:, :k].tolist()
+
+
+def evaluate(
+    texts: Sequence[str],
+    backend,
+    dims: Sequence[Optional[int]] = (None,),
+    encodings: Sequence[str] = ("float32", "float16", "int8"),
+    k: int = 10,
+    queries: int = 100,
+) -> List[Dict[str, Any]]:
+    """
+    One result row per (dim, encoding); the first row is the float32 reference.
+    """
+    import numpy as np
+
+    from mitschreiber import walbin
+    from mitschreiber.quantize import Compaction, dequantize, truncate
+
+    n_queries = min(queries, max(1, len(texts) // 5))
+    vectors = backend.embed(list(texts))
+    corpus_vecs, query_vecs = vectors[n_queries:], vectors[:n_queries]
+    full = np.asarray(corpus_vecs, dtype=np.float32)
+    truth = _top_k(np, full, np.asarray(query_vecs, dtype=np.float32), k)
+
+    rows = []
+    for dim in dims:
+        for encoding in encodings:
+            compaction = Compaction(encoding, dim)
+            encoded = [compaction.apply(v) for v in corpus_vecs]
+            mat = np.asarray([dequantize(values, meta) for values, meta in encoded], dtype=np.float32)
+            mat /= np.maximum(np.linalg.norm(mat, axis=1, keepdims=True), 1e-12)
+            q = np.asarray([truncate(v, dim) if dim else v for v in query_vecs], dtype=np.float32)
+            sample = [
+                {"embedding": values, "meta": dict(meta, model=backend.model_id)} for values, meta in encoded[:200]
+            ]
+            rows.append(
+                {
+                    "encoding": encoding,
+                    "dim": dim or len(corpus_vecs[0]),
+                    "json_bytes": round(sum(len(json.dumps(e)) for e in sample) / len(sample), 1),
+                    "binary_bytes": round(sum(len(walbin.encode_record(e)) for e in sample) / len(sample), 1),
+                    f"recall@{k}": round(_recall(truth, _top_k(np, mat, q, k), k), 4),
+                }
+            )
+    return rows
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser("benchmarks.quantize_eval")
+    p.add_argument("--embed-backend", default="hash", help="Backend to embed the corpus with (default: hash).")
+    p.add_argument("--embed-model", default=None, help="Model name or ONNX model directory.")
+    p.add_argument("--corpus", type=Path, help="Text file, one document per line (default: synthetic titles).")
+    p.add_argument("--size", type=int, default=2000, help="Synthetic corpus size.")
+    p.add_argument("--dims", default="", help="Comma-separated truncation dims besides the full one.")
+    p.add_argument("-k", type=int, default=10)
+    p.add_argument("--json", action="store_true", help="One JSON object per row.")
+    args = p.parse_args(argv)
+
+    from mitschreiber.backends import create_backend
+
+    if args.corpus:
+        texts = [line.strip() for line in args.corpus.read_text(encoding="utf-8").splitlines() if line.strip()]
+    else:
+        texts = [window_title(i * 7919) for i in range(args.size)]
+    dims: List[Optional[int]] = [None] + [int(d) for d in args.dims.split(",") if d]
+    backend = create_backend(args.embed_backend, model=args.embed_model)
+    rows = evaluate(texts, backend, dims=dims, k=args.k)
+
+    if args.json:
+        for row in rows:
+            print(json.dumps(row))
+        return 0
+    ref = rows[0]["json_bytes"]
+    print(f"{backend.model_id}: {len(texts)} texts, recall against exact float32 search", file=sys.stderr)
+    for row in rows:
+        recall = row[f"recall@{args.k}"]
+        print(
+            f"{row['encoding']:>8} dim={row['dim']:<5} json={row['json_bytes']:>8.0f} B "
+            f"({row['json_bytes'] / ref:5.0%})  binary={row['binary_bytes']:>7.0f} B  recall@{args.k}={recall:.3f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,453 @@
+"""
+Benchmark suite for the Python pipeline with regression thresholds.
+
+Drives each stage with a synthetic event stream (no X server, no ML model:
+build_embed_event runs against a deterministic fake backend) and reports per
+stage: events/s, p50/p99 latency per operation and peak traced memory.
+
+    python -m benchmarks.suite                      # run, compare with baseline.json
+    python -m benchmarks.suite --quick --only wal_append,keyphrases
+    python -m benchmarks.suite --save-baseline      # record a new baseline
+
+A stage regresses when its throughput drops or its p50 / peak memory grows by
+more than --tolerance (default 25 %); p99 is noisier and uses
+--p99-tolerance. The exit code is 1 on any regression. Baselines are only
+comparable on the machine they were recorded on; re-record after hardware
+or Python upgrades.
+
+The run_session stage needs the built extension (maturin develop) and uses
+the Rust stub sampler; it is skipped otherwise. Its throughput is bounded by
+the poll interval, so it is compared on CPU time per event instead.
+"""
+from __future__ import annotations
+import argparse
+import gc
+import json
+import platform
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+DEFAULT_BASELINE = Path(__file__).with_name("baseline.json")
+
+APPS = ("firefox", "vscode", "kitty", "thunderbird", "obsidian")
+WORDS = (
+    "mitschreiber rust python session window context embedding privacy sampler chronik "
+    "semantAH heimlern kontext fenster sitzung protokoll vektor suche index segment"
+).split()
+
+
+class Stage:
+    """
+    One benchmark: setup() returns the per-operation callables' shared state,
+    op(state, i) performs one operation worth `events` events.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        op: Callable[[Any, int], Any],
+        setup: Callable[[Path], Any] = lambda tmp: None,
+        teardown: Callable[[Any], None] = lambda state: None,
+        ops: int = 10_000,
+        events_per_op: int = 1,
+    ):
+        self.name = name
+        self.op = op
+        self.setup = setup
+        self.teardown = teardown
+        self.ops = ops
+        self.events_per_op = events_per_op
+
+
+# -- synthetic inputs -----------------------------------------------------
+
+def window_title(i: int) -> str:
+    words = [WORDS[(i * 7 + k * 3) % len(WORDS)] for k in range(3 + i % 5)]
+    return f"{' '.join(words)} – file-{i % 97}.py — {APPS[i % len(APPS)]}"
+
+
+def state_record(i: int) -> Dict[str, Any]:
+    return {
+        "ts": f"2025-01-01T12:{i // 60 % 60:02d}:{i % 60:02d}.{i % 1000:03d}Z",
+        "app": APPS[i % len(APPS)],
+        "window": window_title(i),
+        "clipboard": None,
+        "source": "os.context.state",
+        "session": "bench",
+    }
+
+
+def _fake_backend():
+    """
+    Stands in for a real model: deterministic 384-dim vectors with a fixed
+    per-text cost, so the stage measures mitschreiber's own overhead.
+    """
+    from mitschreiber.backends import EmbeddingBackend
+    from mitschreiber.embedding import _hash32
+
+    class FakeBackend(EmbeddingBackend):
+        name = "fake"
+        model_id = "bench-fake-384"
+        dim = 384
+
+        def embed(self, texts):
+            out = []
+            for text in texts:
+                base = _hash32(text, dim=32)
+                out.append([base[k % 32] for k in range(self.dim)])
+            return out
+
+    return FakeBackend()
+
+
+# -- stages ---------------------------------------------------------------
+
+def _wal_setup(group_commit: bool):
+    def setup(tmp: Path):
+        from mitschreiber.wal import WalWriter
+
+        writer = WalWriter(tmp / "bench.jsonl", group_commit=group_commit, durability="flush")
+        writer.__enter__()
+        return writer, [state_record(i) for i in range(512)]
+    return setup
+
+
+def _wal_append(state, i):
+    writer, records = state
+    writer.append(records[i % len(records)])
+    if writer.group_commit and i % 64 == 63:
+        writer.commit()
+
+
+def _raw_setup(tmp: Path):
+    from mitschreiber.wal import WalWriter
+
+    writer = WalWriter(tmp / "bench-raw.jsonl", group_commit=True, durability="flush")
+    writer.__enter__()
+    batch = b"".join(json.dumps(state_record(i)).encode() + b"\n" for i in range(64))
+    return writer, batch
+
+
+def _raw_append(state, i):
+    writer, batch = state
+    writer.append_raw(batch)
+    writer.commit()
+
+
+def _close_writer(state):
+    state[0].close()
+
+
+def _texts_setup(tmp: Path):
+    return [window_title(i) for i in range(1024)]
+
+
+def _keyphrases(texts, i):
+    from mitschreiber.embed import _keyphrases
+
+    return _keyphrases(texts[i % len(texts)], top_k=5)
+
+
+def _simple_keyphrases(texts, i):
+    from mitschreiber.embedding import simple_keyphrases
+
+    return simple_keyphrases(texts[i % len(texts)])
+
+
+def _tfidf_setup(tmp: Path):
+    from mitschreiber.keyphrases import KeyphraseEngine
+
+    return KeyphraseEngine(), _texts_setup(tmp)
+
+
+def _tfidf_keyphrases(state, i):
+    engine, texts = state
+    return engine.extract_many([texts[(i * 16 + k) % len(texts)] for k in range(16)])
+
+
+def _rollup_setup(tmp: Path):
+    from mitschreiber.rollup import _iso
+
+    base = 1_735_732_800  # 2025-01-01T12:00:00Z
+    records = [dict(state_record(i), ts=_iso(base + i)) for i in range(4096)]
+    return [None, records]
+
+
+def _rollup(state, i):
+    from mitschreiber.rollup import RollupAggregator
+
+    records = state[1]
+    if i % len(records) == 0:
+        state[0] = RollupAggregator("bench")  # the stream restarts in the past
+    return state[0].observe(records[i % len(records)])
+
+
+def _dedup_setup(tmp: Path):
+    from mitschreiber.dedup import NearDuplicateGate
+
+    return NearDuplicateGate(), _texts_setup(tmp)
+
+
+def _dedup(state, i):
+    gate, texts = state
+    return gate.admit("vscode", texts[i % len(texts)])
+
+
+def _redact_batches_setup(tmp: Path):
+    from mitschreiber.redact import Redactor
+
+    batches = []
+    for b in range(16):
+        records = [state_record(b * 64 + k) for k in range(64)]
+        records[b % 64]["clipboard"] = f"login bob{b}@example.org password=hunter{b}"
+        batches.append(b"".join(json.dumps(r).encode() + b"\n" for r in records))
+    return Redactor(), batches
+
+
+def _redact_jsonl(state, i):
+    redactor, batches = state
+    return redactor.redact_jsonl(batches[i % len(batches)])
+
+
+def _redact_clipboard_setup(tmp: Path):
+    from mitschreiber.redact import Redactor
+
+    # 64 KiB pastes (logs, code, prose) with a few secrets in them; too long for the LRU.
+    payloads = []
+    for p in range(8):
+        lines = [f"{window_title(p * 1000 + k)} line {k} status=ok took {k % 97} ms" for k in range(900)]
+        lines[100 + p] += f" contact ops{p}@example.org"
+        lines[500 + p] += " token: ghp_" + "aZ3kQ9vL2mX7pR4tW8yB1nC6dF0gH5jK2sU7"
+        payloads.append("\n".join(lines)[: 64 << 10])
+    return Redactor(), payloads
+
+
+def _redact_clipboard(state, i):
+    redactor, payloads = state
+    return redactor.redact(payloads[i % len(payloads)])
+
+
+def _hash32(texts, i):
+    from mitschreiber.embedding import _hash32
+
+    return _hash32(texts[i % len(texts)])
+
+
+def _fake_model_setup(tmp: Path):
+    return _fake_backend(), _texts_setup(tmp)
+
+
+def _build_embed_event(state, i):
+    from mitschreiber.embed import build_embed_event
+
+    backend, texts = state
+    return build_embed_event(texts[i % len(texts)], "bench", "vscode", "w", backend)
+
+
+def _build_embed_events(state, i):
+    from mitschreiber.embed import build_embed_events
+
+    backend, texts = state
+    items = [(texts[(i * 16 + k) % len(texts)], "bench", "vscode", "w") for k in range(16)]
+    return build_embed_events(items, backend)
+
+
+STAGES: List[Stage] = [
+    Stage("wal_append", _wal_append, _wal_setup(False), _close_writer, ops=20_000),
+    Stage("wal_append_group", _wal_append, _wal_setup(True), _close_writer, ops=50_000),
+    Stage("wal_append_raw", _raw_append, _raw_setup, _close_writer, ops=2_000, events_per_op=64),
+    Stage("keyphrases", _keyphrases, _texts_setup, ops=50_000),
+    Stage("simple_keyphrases", _simple_keyphrases, _texts_setup, ops=50_000),
+    Stage("tfidf_keyphrases", _tfidf_keyphrases, _tfidf_setup, ops=3_000, events_per_op=16),
+    Stage("rollup", _rollup, _rollup_setup, ops=50_000),
+    Stage("dedup_gate", _dedup, _dedup_setup, ops=20_000),
+    Stage("redact_jsonl", _redact_jsonl, _redact_batches_setup, ops=2_000, events_per_op=64),
+    # One event is one 64 KiB paste: MB/s = events_per_s / 16.
+    Stage("redact_clipboard", _redact_clipboard, _redact_clipboard_setup, ops=200),
+    Stage("hash32", _hash32, _texts_setup, ops=50_000),
+    Stage("build_embed_event", _build_embed_event, _fake_model_setup, ops=5_000),
+    Stage("build_embed_events", _build_embed_events, _fake_model_setup, ops=500, events_per_op=16),
+]
+
+
+# -- measurement ----------------------------------------------------------
+
+def _percentile(sorted_values: Sequence[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[k]
+
+
+def run_stage(stage: Stage, scale: float = 1.0) -> Dict[str, Any]:
+    ops = max(10, int(stage.ops * scale))
+    with tempfile.TemporaryDirectory() as tmp:
+        state = stage.setup(Path(tmp))
+        try:
+            for i in range(min(ops, 100)):
+                stage.op(state, i)  # warm-up: imports, caches
+            lat = [0.0] * ops
+            gc.collect()
+            clock = time.perf_counter
+            t_start = clock()
+            for i in range(ops):
+                t0 = clock()
+                stage.op(state, i)
+                lat[i] = clock() - t0
+            elapsed = clock() - t_start
+
+            # Separate, shorter pass: tracemalloc slows everything down.
+            tracemalloc.start()
+            for i in range(min(ops, 1000)):
+                stage.op(state, i)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        finally:
+            stage.teardown(state)
+    lat.sort()
+    events = ops * stage.events_per_op
+    return {
+        "stage": stage.name,
+        "events": events,
+        "events_per_s": round(events / elapsed) if elapsed else 0,
+        "p50_us": round(_percentile(lat, 0.50) * 1e6, 2),
+        "p99_us": round(_percentile(lat, 0.99) * 1e6, 2),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def run_session_stage(seconds: float = 3.0, poll_ms: int = 1) -> Dict[str, Any]:
+    """
+    End-to-end: Rust stub sampler -> poll loop -> segmented WAL, for `seconds`.
+    """
+    try:
+        from mitschreiber.session import run_session
+    except ImportError as exc:
+        return {"stage": "run_session", "skipped": f"extension not available ({exc})"}
+    from mitschreiber.walio import iter_records
+    from mitschreiber.retention import wal_segments
+
+    stop = threading.Event()
+    with tempfile.TemporaryDirectory() as tmp:
+        timer = threading.Timer(seconds, stop.set)
+        cpu0, t0 = time.process_time(), time.perf_counter()
+        timer.start()
+        run_session(
+            "bench", embed=False, clipboard=False, poll_ms=poll_ms,
+            sampler="stub", wal_dir=Path(tmp), stop_event=stop, compression="none",
+        )
+        cpu, elapsed = time.process_time() - cpu0, time.perf_counter() - t0
+        events = sum(1 for p in wal_segments(Path(tmp)) for _ in iter_records(p))
+    return {
+        "stage": "run_session",
+        "events": events,
+        "events_per_s": round(events / elapsed) if elapsed else 0,
+        "cpu_us_per_event": round(cpu / events * 1e6, 2) if events else 0.0,
+    }
+
+
+# -- baselines ------------------------------------------------------------
+
+# metric -> True if higher is better
+_DIRECTIONS = {"events_per_s": True, "p50_us": False, "p99_us": False, "peak_kib": False, "cpu_us_per_event": False}
+
+
+def compare(
+    results: List[Dict[str, Any]],
+    baseline: Dict[str, Any],
+    tolerance: float = 0.25,
+    p99_tolerance: float = 1.0,
+) -> List[str]:
+    """
+    Returns one message per metric that regressed beyond its tolerance.
+    """
+    base = {r["stage"]: r for r in baseline.get("results", [])}
+    regressions = []
+    for r in results:
+        ref = base.get(r["stage"])
+        if ref is None or "skipped" in r or "skipped" in ref:
+            continue
+        for metric, higher_is_better in _DIRECTIONS.items():
+            if metric not in r or not ref.get(metric):
+                continue
+            if r["stage"] == "run_session" and metric == "events_per_s":
+                # Bounded by the poll interval, not by the code under test.
+                continue
+            tol = p99_tolerance if metric == "p99_us" else tolerance
+            old, new = float(ref[metric]), float(r[metric])
+            worse = new < old * (1 - tol) if higher_is_better else new > old * (1 + tol)
+            if worse:
+                change = (new - old) / old * 100
+                regressions.append(f"{r['stage']}.{metric}: {old:g} -> {new:g} ({change:+.0f} %, tolerance {tol:.0%})")
+    return regressions
+
+
+def _environment() -> Dict[str, str]:
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "system": platform.system(),
+    }
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser("benchmarks.suite")
+    p.add_argument("--only", help="Comma-separated stage names (default: all).")
+    p.add_argument("--quick", action="store_true", help="Run a tenth of the operations (smoke run).")
+    p.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    p.add_argument("--save-baseline", action="store_true", help="Write the results as the new baseline.")
+    p.add_argument("--tolerance", type=float, default=0.25)
+    p.add_argument("--p99-tolerance", type=float, default=1.0)
+    p.add_argument("--session-seconds", type=float, default=3.0)
+    args = p.parse_args(argv)
+
+    names = set(args.only.split(",")) if args.only else None
+    known = {s.name for s in STAGES} | {"run_session"}
+    if names and names - known:
+        p.error(f"unknown stage(s): {', '.join(sorted(names - known))}")
+    scale = 0.1 if args.quick else 1.0
+
+    results = []
+    for stage in STAGES:
+        if names is None or stage.name in names:
+            results.append(run_stage(stage, scale))
+            print(json.dumps(results[-1]), flush=True)
+    if names is None or "run_session" in names:
+        results.append(run_session_stage(args.session_seconds * (0.5 if args.quick else 1.0)))
+        print(json.dumps(results[-1]), flush=True)
+
+    if args.save_baseline:
+        if args.baseline.exists():
+            # Keep stages that were not part of this run.
+            old = json.loads(args.baseline.read_text(encoding="utf-8"))
+            ran = {r["stage"] for r in results}
+            results = [r for r in old.get("results", []) if r["stage"] not in ran] + results
+        args.baseline.write_text(
+            json.dumps({"environment": _environment(), "results": results}, indent=2) + "\n", encoding="utf-8"
+        )
+        print(f"baseline written to {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"no baseline at {args.baseline}; record one with --save-baseline", file=sys.stderr)
+        return 0
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    if baseline.get("environment") != _environment():
+        print(f"note: baseline was recorded on {baseline.get('environment')}", file=sys.stderr)
+    regressions = compare(results, baseline, args.tolerance, args.p99_tolerance)
+    for msg in regressions:
+        print(f"REGRESSION {msg}", file=sys.stderr)
+    if regressions:
+        return 1
+    print("no regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,4 +2,4 @@ mod sampler;
 #[cfg(feature = "x11")]
 mod x11;
 
-pub use sampler::{start_session, stop_session, poll_state};
+pub use sampler::{start_session, stop_session, poll_state, poll_state_jsonl, poll_state_wait, session_stats};
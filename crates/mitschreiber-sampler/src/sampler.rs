@@ -1,15 +1,15 @@
 use pyo3::prelude::*;
-use pyo3::types::PyDict;
+use pyo3::types::{PyBytes, PyDict};
 use serde::{Serialize, Deserialize};
 
 use once_cell::sync::Lazy;
 use parking_lot::Mutex;
 use std::collections::HashMap;
-use std::sync::atomic::{AtomicBool, Ordering};
+use std::sync::atomic::{AtomicBool, AtomicU64, Ordering};
 use std::sync::Arc;
 use std::thread::{self, JoinHandle};
-use std::time::Duration;
-use crossbeam_channel::{bounded, Sender, Receiver};
+use std::time::{Duration, Instant};
+use crossbeam_channel::{bounded, Sender, Receiver, RecvTimeoutError, TrySendError};
 
 #[cfg(feature = "x11")]
 use crate::x11::X11Sampler;
@@ -20,10 +20,185 @@ pub struct OsContextState {
     pub app: String,
     pub window: String,
     pub clipboard: Option<String>,
+    /// Set only on the closing record of a context in change-only mode:
+    /// how long the app/window/clipboard combination stayed unchanged.
+    #[serde(default, skip_serializing_if = "Option::is_none")]
+    pub dwell_ms: Option<u64>,
+}
+
+impl OsContextState {
+    /// Two states describe the same context if everything except the timestamp matches.
+    fn same_context(&self, other: &OsContextState) -> bool {
+        self.app == other.app && self.window == other.window && self.clipboard == other.clipboard
+    }
+}
+
+/// WAL layout of an `os.context.state` record: the sampled state plus the
+/// fields Python used to add in `run_session` before re-serializing.
+#[derive(Serialize)]
+struct StateRecord<'a> {
+    #[serde(flatten)]
+    state: &'a OsContextState,
+    source: &'static str,
+    session: &'a str,
+}
+
+/// Appends one normalized, newline-terminated JSON record to `buf`.
+fn write_state_record(buf: &mut Vec<u8>, state: &OsContextState, session_id: &str) -> serde_json::Result<()> {
+    serde_json::to_writer(
+        &mut *buf,
+        &StateRecord { state, source: "os.context.state", session: session_id },
+    )?;
+    buf.push(b'\n');
+    Ok(())
+}
+
+/// Which probed states the sampler thread forwards to the channel.
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+enum EmitMode {
+    /// Every probe is forwarded (legacy behaviour).
+    Every,
+    /// Only context changes plus periodic heartbeats are forwarded.
+    Change,
+}
+
+impl EmitMode {
+    fn parse(s: &str) -> PyResult<Self> {
+        match s {
+            "every" => Ok(EmitMode::Every),
+            "change" => Ok(EmitMode::Change),
+            other => Err(PyErr::new::<pyo3::exceptions::PyValueError, _>(format!(
+                "unknown emit_mode '{}' (expected 'every' or 'change')",
+                other
+            ))),
+        }
+    }
+}
+
+/// Which probe implementation a session uses.
+#[derive(Clone, Copy, Debug, PartialEq)]
+enum SamplerKind {
+    /// Event-driven X11 when compiled in and a display is reachable, else
+    /// polling X11, else the stub.
+    Auto,
+    /// X11 re-read every interval, no event subscription.
+    Poll,
+    /// Always the synthetic stub (benchmarks, tests, headless runs).
+    Stub,
+}
+
+impl SamplerKind {
+    fn parse(s: &str) -> PyResult<Self> {
+        match s {
+            "auto" => Ok(SamplerKind::Auto),
+            "poll" => Ok(SamplerKind::Poll),
+            "stub" => Ok(SamplerKind::Stub),
+            other => Err(PyErr::new::<pyo3::exceptions::PyValueError, _>(format!(
+                "unknown sampler '{}' (expected 'auto', 'poll' or 'stub')",
+                other
+            ))),
+        }
+    }
+}
+
+/// Change detection inside the sampler thread.
+///
+/// Emits a state when the context changes, a heartbeat copy of the current
+/// state every `heartbeat` while nothing changes, and a closing record
+/// (the previous context with `dwell_ms` set) right before each change.
+struct ChangeFilter {
+    heartbeat: Option<Duration>,
+    // The state that opened the current context and when it was seen.
+    current: Option<(OsContextState, Instant)>,
+    last_emit: Instant,
+}
+
+impl ChangeFilter {
+    fn new(heartbeat: Option<Duration>) -> Self {
+        Self { heartbeat, current: None, last_emit: Instant::now() }
+    }
+
+    fn feed(&mut self, state: OsContextState, now: Instant, mut emit: impl FnMut(OsContextState)) {
+        match self.current.take() {
+            None => {
+                self.current = Some((state.clone(), now));
+                self.last_emit = now;
+                emit(state);
+            }
+            Some((opened, since)) if opened.same_context(&state) => {
+                if let Some(hb) = self.heartbeat {
+                    if now.duration_since(self.last_emit) >= hb {
+                        self.last_emit = now;
+                        emit(state);
+                    }
+                }
+                self.current = Some((opened, since));
+            }
+            Some((opened, since)) => {
+                let dwell = now.duration_since(since).as_millis() as u64;
+                let closing = OsContextState {
+                    ts: state.ts.clone(),
+                    dwell_ms: Some(dwell),
+                    ..opened
+                };
+                emit(closing);
+                self.current = Some((state.clone(), now));
+                self.last_emit = now;
+                emit(state);
+            }
+        }
+    }
+}
+
+/// Poll interval of the sampler thread: the configured rate while the user
+/// is active, doubling per idle tick up to `max`.
+#[derive(Debug)]
+struct Backoff {
+    min: Duration,
+    max: Duration,
+    current: Duration,
+}
+
+impl Backoff {
+    fn new(min: Duration, max: Duration) -> Self {
+        Self { min, max: max.max(min), current: min }
+    }
+
+    fn enabled(&self) -> bool {
+        self.max > self.min
+    }
+
+    fn current(&self) -> Duration {
+        self.current
+    }
+
+    /// Snaps back to `min` on activity, else backs off exponentially.
+    fn observe(&mut self, active: bool) -> Duration {
+        self.current = if active { self.min } else { (self.current * 2).min(self.max) };
+        self.current
+    }
+}
+
+/// True once `stop_session` dropped the session's stop sender.
+#[cfg(feature = "x11")]
+fn stopped(stop: &Receiver<()>) -> bool {
+    matches!(stop.try_recv(), Err(crossbeam_channel::TryRecvError::Disconnected))
 }
 
 trait Sampler: Send {
     fn probe(&mut self, counter: u64) -> OsContextState;
+
+    /// Blocks until the next probe is due; false as soon as `stop` fires.
+    /// Polling samplers wait `interval`; event-driven ones return early when
+    /// the context changes.
+    fn wait(&mut self, interval: Duration, stop: &Receiver<()>) -> bool {
+        matches!(stop.recv_timeout(interval), Err(RecvTimeoutError::Timeout))
+    }
+
+    /// Time since the last keyboard/mouse input, where the platform reports it.
+    fn input_idle(&mut self) -> Option<Duration> {
+        None
+    }
 }
 
 struct StubSampler;
@@ -37,6 +212,7 @@ impl Sampler for StubSampler {
             app: app.to_string(),
             window: window.to_string(),
             clipboard: None,
+            dwell_ms: None,
         }
     }
 }
@@ -49,11 +225,179 @@ impl Sampler for X11SamplerWrapper {
     fn probe(&mut self, _counter: u64) -> OsContextState {
         self.0.get_state()
     }
+
+    fn input_idle(&mut self) -> Option<Duration> {
+        self.0.input_idle()
+    }
+}
+
+/// X11 in event mode: reacts to PropertyNotify within the interval and
+/// serves the cached state when nothing changed.
+#[cfg(feature = "x11")]
+struct X11EventSampler(X11Sampler);
+
+#[cfg(feature = "x11")]
+impl Sampler for X11EventSampler {
+    fn probe(&mut self, _counter: u64) -> OsContextState {
+        self.0.current_state()
+    }
+
+    fn wait(&mut self, interval: Duration, stop: &Receiver<()>) -> bool {
+        // Applies pending events to the cache; probe() then reads it. Events that
+        // change nothing (_NET_WM_USER_TIME on every keypress, stacking, icons)
+        // must not cut the interval short, or typing would emit a state per key.
+        let deadline = Instant::now() + interval;
+        loop {
+            let remaining = deadline.saturating_duration_since(Instant::now());
+            if remaining.is_zero() {
+                break;
+            }
+            if self.0.next_state(remaining, stop).is_some() || stopped(stop) {
+                break;
+            }
+        }
+        !stopped(stop)
+    }
+
+    fn input_idle(&mut self) -> Option<Duration> {
+        self.0.input_idle()
+    }
+}
+
+/// Default capacity of the per-session channel between sampler thread and Python.
+const QUEUE_CAPACITY: usize = 10_000;
+
+/// What happens to a state that finds the channel full.
+#[derive(Clone, Copy, Debug, PartialEq)]
+enum Overflow {
+    /// Discard the new state; the queue keeps the oldest (stale after a stall).
+    DropNewest,
+    /// Ring buffer: evict the oldest queued state to make room.
+    DropOldest,
+    /// Like DropOldest, and a state identical to the last queued one is not
+    /// queued at all while that one is still waiting.
+    Coalesce,
+}
+
+impl Overflow {
+    fn parse(s: &str) -> PyResult<Self> {
+        match s {
+            "drop-newest" => Ok(Overflow::DropNewest),
+            "drop-oldest" => Ok(Overflow::DropOldest),
+            "coalesce" => Ok(Overflow::Coalesce),
+            other => Err(PyErr::new::<pyo3::exceptions::PyValueError, _>(format!(
+                "unknown overflow policy '{}' (expected 'drop-newest', 'drop-oldest' or 'coalesce')",
+                other
+            ))),
+        }
+    }
+
+    fn name(self) -> &'static str {
+        match self {
+            Overflow::DropNewest => "drop-newest",
+            Overflow::DropOldest => "drop-oldest",
+            Overflow::Coalesce => "coalesce",
+        }
+    }
+}
+
+/// Counters written by the sampler thread and read by `session_stats`.
+#[derive(Default)]
+struct SamplerStats {
+    probes: AtomicU64,
+    emitted: AtomicU64,
+    drops: AtomicU64,
+    /// States not queued because they repeated the waiting one (coalesce).
+    coalesced: AtomicU64,
+    /// Deepest the channel has been since start.
+    high_water: AtomicU64,
+    probe_ns_total: AtomicU64,
+    probe_ns_max: AtomicU64,
+    /// Effective poll interval after idle backoff.
+    interval_ms: AtomicU64,
+}
+
+impl SamplerStats {
+    fn record_probe(&self, took: Duration) {
+        let ns = took.as_nanos() as u64;
+        self.probes.fetch_add(1, Ordering::Relaxed);
+        self.probe_ns_total.fetch_add(ns, Ordering::Relaxed);
+        self.probe_ns_max.fetch_max(ns, Ordering::Relaxed);
+    }
+}
+
+/// Sending side of a session channel: applies the overflow policy and
+/// keeps the queue counters.
+struct Outbox {
+    tx: Sender<OsContextState>,
+    // A receiver clone, used only to evict the oldest state (drop-oldest, coalesce).
+    evict: Option<Receiver<OsContextState>>,
+    policy: Overflow,
+    // Last queued state, for coalescing.
+    last: Option<OsContextState>,
+    stats: Arc<SamplerStats>,
+}
+
+impl Outbox {
+    fn new(tx: Sender<OsContextState>, rx: &Receiver<OsContextState>, policy: Overflow, stats: Arc<SamplerStats>) -> Self {
+        let evict = (policy != Overflow::DropNewest).then(|| rx.clone());
+        Self { tx, evict, policy, last: None, stats }
+    }
+
+    /// Queues `state` without ever blocking; false once the receiver is gone.
+    ///
+    /// Blocking on a full channel would deadlock stop_session(): the thread
+    /// would be stuck in send() while stop_session() holds the Receiver alive
+    /// and waits in join(). Losses are counted in session_stats().
+    fn push(&mut self, state: OsContextState) -> bool {
+        if self.policy == Overflow::Coalesce && !self.tx.is_empty() {
+            // The queue is FIFO, so the last queued state is still waiting.
+            if let Some(last) = &self.last {
+                if last.same_context(&state) && last.dwell_ms == state.dwell_ms {
+                    self.stats.coalesced.fetch_add(1, Ordering::Relaxed);
+                    return true;
+                }
+            }
+        }
+        let remember = (self.policy == Overflow::Coalesce).then(|| state.clone());
+        let mut state = state;
+        // Two attempts: the consumer may race us for the slot we just freed.
+        for _ in 0..2 {
+            match self.tx.try_send(state) {
+                Ok(()) => {
+                    self.stats.emitted.fetch_add(1, Ordering::Relaxed);
+                    self.stats.high_water.fetch_max(self.tx.len() as u64, Ordering::Relaxed);
+                    self.last = remember;
+                    return true;
+                }
+                Err(TrySendError::Full(rejected)) => {
+                    self.stats.drops.fetch_add(1, Ordering::Relaxed);
+                    match &self.evict {
+                        // The evicted state is the loss; retry with the new one.
+                        Some(rx) if rx.try_recv().is_ok() => state = rejected,
+                        Some(_) => {
+                            // Drained meanwhile: nothing was lost after all.
+                            self.stats.drops.fetch_sub(1, Ordering::Relaxed);
+                            state = rejected;
+                        }
+                        None => return true,
+                    }
+                }
+                Err(TrySendError::Disconnected(_)) => return false,
+            }
+        }
+        true
+    }
 }
 
 /// Per-session controller, holding the communication channel
 struct Session {
     alive: Arc<AtomicBool>,
+    capacity: usize,
+    overflow: Overflow,
+    // Dropped by stop_session to wake the sampler thread out of its wait.
+    stop: Option<Sender<()>>,
+    stats: Arc<SamplerStats>,
     // The receiver is now stored here to be polled
     rx: Receiver<OsContextState>,
     // The handle to the background thread
@@ -72,6 +416,44 @@ pub fn start_session(_py: Python, session_id: &str, cfg: &PyDict) -> PyResult<()
         .map(|v| v.extract::<u64>())
         .transpose()?
         .unwrap_or(500);
+    // Upper bound for the idle backoff; equal to poll_interval_ms (the default) disables it.
+    let max_poll_interval_ms = cfg
+        .get_item("max_poll_interval_ms")?
+        .map(|v| v.extract::<u64>())
+        .transpose()?
+        .unwrap_or(poll_interval_ms);
+    if max_poll_interval_ms < poll_interval_ms {
+        return Err(PyErr::new::<pyo3::exceptions::PyValueError, _>(format!(
+            "max_poll_interval_ms ({}) must not be below poll_interval_ms ({})",
+            max_poll_interval_ms, poll_interval_ms
+        )));
+    }
+    let sampler_kind = match cfg.get_item("sampler")? {
+        Some(v) => SamplerKind::parse(v.extract::<&str>()?)?,
+        None => SamplerKind::Auto,
+    };
+    let emit_mode = match cfg.get_item("emit_mode")? {
+        Some(v) => EmitMode::parse(v.extract::<&str>()?)?,
+        None => EmitMode::Every,
+    };
+    // 0 disables heartbeats in change-only mode.
+    let heartbeat_ms = cfg
+        .get_item("heartbeat_ms")?
+        .map(|v| v.extract::<u64>())
+        .transpose()?
+        .unwrap_or(60_000);
+    let capacity = cfg
+        .get_item("queue_capacity")?
+        .map(|v| v.extract::<usize>())
+        .transpose()?
+        .unwrap_or(QUEUE_CAPACITY);
+    if capacity == 0 {
+        return Err(PyErr::new::<pyo3::exceptions::PyValueError, _>("queue_capacity must be positive"));
+    }
+    let overflow = match cfg.get_item("overflow")? {
+        Some(v) => Overflow::parse(v.extract::<&str>()?)?,
+        None => Overflow::DropOldest,
+    };
 
     let mut sessions = SESSIONS.lock();
     if sessions.contains_key(&sid) {
@@ -79,22 +461,34 @@ pub fn start_session(_py: Python, session_id: &str, cfg: &PyDict) -> PyResult<()
     }
 
     // Use a bounded channel to prevent memory leaks if the consumer (Python) is too slow
-    // or stalled. Dropping new events is preferable to OOM.
-    let (tx, rx): (Sender<OsContextState>, Receiver<OsContextState>) = bounded(10_000);
+    // or stalled. Dropping events (see Overflow) is preferable to OOM.
+    let (tx, rx): (Sender<OsContextState>, Receiver<OsContextState>) = bounded(capacity);
     let alive = Arc::new(AtomicBool::new(true));
     let thread_alive = Arc::clone(&alive);
+    let (stop_tx, stop_rx) = bounded::<()>(0);
+    let stats = Arc::new(SamplerStats::default());
+    let thread_stats = Arc::clone(&stats);
+    let mut outbox = Outbox::new(tx, &rx, overflow, Arc::clone(&stats));
     let thread_sid = sid.clone(); // for drop diagnostics inside the thread
 
     // Background thread owns the sender
     let handle = thread::spawn(move || {
         let mut counter: u64 = 0;
-        let mut drops: u64 = 0;
 
         #[allow(unused_mut)]
-        let mut sampler: Box<dyn Sampler> = {
+        let mut sampler: Box<dyn Sampler> = if sampler_kind == SamplerKind::Stub {
+            Box::new(StubSampler)
+        } else {
             #[cfg(feature = "x11")]
             {
                 match X11Sampler::new() {
+                    Ok(mut s) if sampler_kind == SamplerKind::Auto => match s.watch() {
+                        Ok(()) => Box::new(X11EventSampler(s)),
+                        Err(e) => {
+                            eprintln!("Warning: X11 event subscription failed, polling instead. Error: {}", e);
+                            Box::new(X11SamplerWrapper(s))
+                        }
+                    },
                     Ok(s) => Box::new(X11SamplerWrapper(s)),
                     Err(e) => {
                         // Use println/eprintln as simple logging fallback if env_logger not init
@@ -109,27 +503,47 @@ pub fn start_session(_py: Python, session_id: &str, cfg: &PyDict) -> PyResult<()
             }
         };
 
-        let poll_interval = Duration::from_millis(poll_interval_ms);
-        while thread_alive.load(Ordering::SeqCst) {
+        let mut schedule = Backoff::new(
+            Duration::from_millis(poll_interval_ms),
+            Duration::from_millis(max_poll_interval_ms),
+        );
+        let mut last_context: Option<OsContextState> = None;
+        let mut filter = match emit_mode {
+            EmitMode::Every => None,
+            EmitMode::Change => Some(ChangeFilter::new(
+                (heartbeat_ms > 0).then(|| Duration::from_millis(heartbeat_ms)),
+            )),
+        };
+        let mut disconnected = false;
+        let probe = |sampler: &mut Box<dyn Sampler>, counter: u64| {
+            let started = Instant::now();
             let state = sampler.probe(counter);
-            match tx.try_send(state) {
-                Ok(()) => {}
-                Err(crossbeam_channel::TrySendError::Full(_)) => {
-                    // Intentionally lossy under sustained queue pressure: freshness over
-                    // completeness. Blocking here instead would deadlock stop_session():
-                    // the thread would be stuck in send() while stop_session() holds the
-                    // Receiver alive and waits in join() — neither side can make progress.
-                    // TODO: expose `drops` as a Prometheus counter once metrics infra exists.
-                    drops = drops.saturating_add(1);
-                }
-                Err(crossbeam_channel::TrySendError::Disconnected(_)) => {
-                    // Receiver dropped – stop the thread.
-                    break;
-                }
+            thread_stats.record_probe(started.elapsed());
+            state
+        };
+        let mut state = probe(&mut sampler, counter);
+        while thread_alive.load(Ordering::SeqCst) && !disconnected {
+            if schedule.enabled() {
+                // Active: the context changed, or there was input during the last interval.
+                let changed = last_context.as_ref().map_or(true, |last| !last.same_context(&state));
+                let typing = sampler.input_idle().map_or(false, |idle| idle < schedule.current());
+                schedule.observe(changed || typing);
+                last_context = Some(state.clone());
+            }
+            thread_stats.interval_ms.store(schedule.current().as_millis() as u64, Ordering::Relaxed);
+            // Receiver dropped – stop the thread.
+            let mut send = |state: OsContextState| disconnected |= !outbox.push(state);
+            match filter.as_mut() {
+                Some(f) => f.feed(state, Instant::now(), &mut send),
+                None => send(state),
             }
             counter = counter.wrapping_add(1);
-            thread::sleep(poll_interval);
+            if !sampler.wait(schedule.current(), &stop_rx) {
+                break;
+            }
+            state = probe(&mut sampler, counter);
         }
+        let drops = thread_stats.drops.load(Ordering::Relaxed);
         if drops > 0 {
             eprintln!(
                 "mitschreiber sampler [{}]: {} event(s) dropped under queue pressure (freshness-over-completeness)",
@@ -142,6 +556,10 @@ pub fn start_session(_py: Python, session_id: &str, cfg: &PyDict) -> PyResult<()
         sid.clone(),
         Session {
             alive,
+            capacity,
+            overflow,
+            stop: Some(stop_tx),
+            stats,
             rx,
             handle: Some(handle),
         },
@@ -155,6 +573,7 @@ pub fn start_session(_py: Python, session_id: &str, cfg: &PyDict) -> PyResult<()
 pub fn stop_session(_py: Python, session_id: &str) -> PyResult<()> {
     if let Some(mut session) = SESSIONS.lock().remove(session_id) {
         session.alive.store(false, Ordering::SeqCst);
+        drop(session.stop.take());
         if let Some(handle) = session.handle.take() {
             // It's fine to block here for a moment, to ensure clean shutdown.
             handle.join().ok();
@@ -182,6 +601,97 @@ pub fn poll_state(_py: Python, session_id: &str) -> PyResult<Vec<String>> {
     }
 }
 
+/// Drains buffered states as one bytes buffer of newline-delimited JSON records
+/// with `source`/`session` already filled in, ready to be appended to the WAL
+/// without a per-event parse/dump round trip in Python.
+#[pyfunction]
+#[pyo3(signature = (session_id, max_events=None))]
+pub fn poll_state_jsonl<'py>(py: Python<'py>, session_id: &str, max_events: Option<usize>) -> PyResult<&'py PyBytes> {
+    // Clone the receiver so serialization does not happen under the global lock.
+    let rx = match SESSIONS.lock().get(session_id) {
+        Some(session) => session.rx.clone(),
+        None => return Ok(PyBytes::new(py, b"")),
+    };
+    let mut buf = Vec::new();
+    for state in rx.try_iter().take(max_events.unwrap_or(usize::MAX)) {
+        write_state_record(&mut buf, &state, session_id)
+            .map_err(|e| PyErr::new::<pyo3::exceptions::PyRuntimeError, _>(format!("JSON serialization error: {}", e)))?;
+    }
+    Ok(PyBytes::new(py, &buf))
+}
+
+/// Blocks (with the GIL released) until at least one state is available or
+/// `timeout_ms` expires, then drains up to `max_events` states as a JSONL
+/// buffer like `poll_state_jsonl`. Returns an empty buffer on timeout (a
+/// stopped sampler thread behaves like a timeout, so callers never spin) and
+/// immediately for unknown sessions.
+///
+/// Keep `timeout_ms` short: Python signal handlers (Ctrl+C, `stop`) only run
+/// after this call returns.
+#[pyfunction]
+#[pyo3(signature = (session_id, timeout_ms, max_events=None))]
+pub fn poll_state_wait<'py>(
+    py: Python<'py>,
+    session_id: &str,
+    timeout_ms: u64,
+    max_events: Option<usize>,
+) -> PyResult<&'py PyBytes> {
+    let rx = match SESSIONS.lock().get(session_id) {
+        Some(session) => session.rx.clone(),
+        None => return Ok(PyBytes::new(py, b"")),
+    };
+    let max_events = max_events.unwrap_or(usize::MAX).max(1);
+    let buf = py
+        .allow_threads(|| -> serde_json::Result<Vec<u8>> {
+            let mut buf = Vec::new();
+            match rx.recv_timeout(Duration::from_millis(timeout_ms)) {
+                Ok(first) => {
+                    write_state_record(&mut buf, &first, session_id)?;
+                    for state in rx.try_iter().take(max_events - 1) {
+                        write_state_record(&mut buf, &state, session_id)?;
+                    }
+                }
+                Err(RecvTimeoutError::Timeout) => {}
+                Err(RecvTimeoutError::Disconnected) => thread::sleep(Duration::from_millis(timeout_ms)),
+            }
+            Ok(buf)
+        })
+        .map_err(|e| PyErr::new::<pyo3::exceptions::PyRuntimeError, _>(format!("JSON serialization error: {}", e)))?;
+    Ok(PyBytes::new(py, &buf))
+}
+
+/// Returns the sampler counters of a running session as a dict, or None for
+/// unknown sessions. Cheap enough to call per scrape.
+///
+/// `probes`, `emitted`, `drops` (states lost to the overflow policy) and
+/// `coalesced` count since start; `depth`, `high_water`, `capacity` and
+/// `overflow` describe the channel; `probe_us_avg`/`probe_us_max` time the
+/// probes; `interval_ms` is the poll interval after idle backoff.
+#[pyfunction]
+pub fn session_stats<'py>(py: Python<'py>, session_id: &str) -> PyResult<Option<&'py PyDict>> {
+    let sessions = SESSIONS.lock();
+    let session = match sessions.get(session_id) {
+        Some(session) => session,
+        None => return Ok(None),
+    };
+    let stats = PyDict::new(py);
+    let counters = &session.stats;
+    let probes = counters.probes.load(Ordering::Relaxed);
+    stats.set_item("probes", probes)?;
+    stats.set_item("emitted", counters.emitted.load(Ordering::Relaxed))?;
+    stats.set_item("drops", counters.drops.load(Ordering::Relaxed))?;
+    stats.set_item("coalesced", counters.coalesced.load(Ordering::Relaxed))?;
+    stats.set_item("depth", session.rx.len())?;
+    stats.set_item("high_water", counters.high_water.load(Ordering::Relaxed))?;
+    stats.set_item("capacity", session.capacity)?;
+    stats.set_item("overflow", session.overflow.name())?;
+    let probe_ns = counters.probe_ns_total.load(Ordering::Relaxed);
+    stats.set_item("probe_us_avg", if probes > 0 { probe_ns as f64 / probes as f64 / 1e3 } else { 0.0 })?;
+    stats.set_item("probe_us_max", counters.probe_ns_max.load(Ordering::Relaxed) as f64 / 1e3)?;
+    stats.set_item("interval_ms", session.stats.interval_ms.load(Ordering::Relaxed))?;
+    Ok(Some(stats))
+}
+
 #[cfg(test)]
 mod tests {
     use super::*;
@@ -220,6 +730,61 @@ mod tests {
         });
     }
 
+    #[test]
+    fn poll_state_wait_returns_on_timeout_and_on_data() {
+        let sid = "test-session-wait";
+        pyo3::Python::with_gil(|py| {
+            // Unknown session: returns immediately with an empty buffer.
+            assert!(poll_state_wait(py, "no-such-session", 1_000, None).unwrap().as_bytes().is_empty());
+
+            let cfg = PyDict::new(py);
+            cfg.set_item("poll_interval_ms", 10u64).unwrap();
+            start_session(py, sid, cfg).unwrap();
+
+            let start = std::time::Instant::now();
+            let buf = poll_state_wait(py, sid, 2_000, Some(1)).unwrap().as_bytes().to_vec();
+            assert!(start.elapsed() < std::time::Duration::from_millis(1_000), "wait did not return on data");
+            assert_eq!(buf.iter().filter(|&&b| b == b'\n').count(), 1, "max_events not honoured");
+
+            stop_session(py, sid).unwrap();
+        });
+    }
+
+    #[test]
+    fn sampler_kind_parses_known_values_only() {
+        assert_eq!(SamplerKind::parse("auto").unwrap(), SamplerKind::Auto);
+        assert_eq!(SamplerKind::parse("poll").unwrap(), SamplerKind::Poll);
+        assert_eq!(SamplerKind::parse("stub").unwrap(), SamplerKind::Stub);
+        assert!(SamplerKind::parse("wayland").is_err());
+    }
+
+    #[test]
+    fn session_stats_counts_probes_and_depth() {
+        let sid = "test-session-stats";
+        pyo3::Python::with_gil(|py| {
+            assert!(session_stats(py, "no-such-session").unwrap().is_none());
+
+            let cfg = PyDict::new(py);
+            cfg.set_item("poll_interval_ms", 5u64).unwrap();
+            cfg.set_item("sampler", "stub").unwrap();
+            start_session(py, sid, cfg).unwrap();
+            std::thread::sleep(std::time::Duration::from_millis(50));
+
+            let stats = session_stats(py, sid).unwrap().expect("running session has stats");
+            let get = |key: &str| stats.get_item(key).unwrap().unwrap().extract::<u64>().unwrap();
+            assert!(get("probes") > 0);
+            assert_eq!(get("drops"), 0);
+            assert_eq!(get("capacity"), QUEUE_CAPACITY as u64);
+            assert!(get("depth") <= get("emitted") && get("emitted") <= get("probes"));
+            assert_eq!(get("interval_ms"), 5);
+            assert!(get("high_water") >= get("depth"));
+            let avg = stats.get_item("probe_us_avg").unwrap().unwrap().extract::<f64>().unwrap();
+            assert!(avg > 0.0);
+
+            stop_session(py, sid).unwrap();
+        });
+    }
+
     /// Regression test for the old `tx.send()` deadlock:
     /// when the channel is full the producer must not block.
     ///
@@ -247,6 +812,7 @@ mod tests {
             app: "test".to_string(),
             window: "test".to_string(),
             clipboard: None,
+            dwell_ms: None,
         })
         .unwrap();
 
@@ -289,6 +855,7 @@ mod tests {
             app: "a".to_string(),
             window: "b".to_string(),
             clipboard: None,
+            dwell_ms: None,
         };
         assert!(tx.try_send(state.clone()).is_ok(), "first send should succeed");
         let second = tx.try_send(state);
@@ -328,4 +895,206 @@ mod tests {
             "thread did not exit after receiver was dropped"
         );
     }
+
+    #[test]
+    fn backoff_doubles_while_idle_and_snaps_back() {
+        let ms = Duration::from_millis;
+        let mut b = Backoff::new(ms(100), ms(1000));
+        assert!(b.enabled());
+        let idle: Vec<u128> = (0..5).map(|_| b.observe(false).as_millis()).collect();
+        assert_eq!(idle, vec![200, 400, 800, 1000, 1000]);
+        assert_eq!(b.observe(true), ms(100));
+        assert!(!Backoff::new(ms(100), ms(50)).enabled(), "max below min means no backoff");
+    }
+
+    #[test]
+    fn stop_interrupts_a_long_idle_wait() {
+        let sid = "test-session-backoff-stop";
+        pyo3::Python::with_gil(|py| {
+            let cfg = PyDict::new(py);
+            cfg.set_item("poll_interval_ms", 5_000u64).unwrap();
+            cfg.set_item("max_poll_interval_ms", 60_000u64).unwrap();
+            cfg.set_item("sampler", "stub").unwrap();
+            start_session(py, sid, cfg).unwrap();
+            std::thread::sleep(Duration::from_millis(20));
+            let t0 = Instant::now();
+            stop_session(py, sid).unwrap();
+            assert!(t0.elapsed() < Duration::from_secs(1), "stop waited for the poll interval");
+
+            let bad = PyDict::new(py);
+            bad.set_item("poll_interval_ms", 500u64).unwrap();
+            bad.set_item("max_poll_interval_ms", 100u64).unwrap();
+            assert!(start_session(py, "test-session-backoff-bad", bad).is_err());
+        });
+    }
+
+    fn outbox(capacity: usize, policy: Overflow) -> (Outbox, Receiver<OsContextState>) {
+        let (tx, rx) = bounded(capacity);
+        let out = Outbox::new(tx, &rx, policy, Arc::new(SamplerStats::default()));
+        (out, rx)
+    }
+
+    #[test]
+    fn overflow_parses_known_policies_only() {
+        for name in ["drop-newest", "drop-oldest", "coalesce"] {
+            assert_eq!(Overflow::parse(name).unwrap().name(), name);
+        }
+        assert!(Overflow::parse("block").is_err());
+    }
+
+    #[test]
+    fn drop_newest_keeps_the_stale_head() {
+        let (mut out, rx) = outbox(2, Overflow::DropNewest);
+        for w in ["a", "b", "c"] {
+            assert!(out.push(state("app", w)));
+        }
+        let windows: Vec<String> = rx.try_iter().map(|s| s.window).collect();
+        assert_eq!(windows, vec!["a", "b"]);
+        assert_eq!(out.stats.drops.load(Ordering::Relaxed), 1);
+        assert_eq!(out.stats.high_water.load(Ordering::Relaxed), 2);
+    }
+
+    #[test]
+    fn drop_oldest_keeps_the_freshest_states() {
+        let (mut out, rx) = outbox(2, Overflow::DropOldest);
+        for w in ["a", "b", "c", "d"] {
+            assert!(out.push(state("app", w)));
+        }
+        let windows: Vec<String> = rx.try_iter().map(|s| s.window).collect();
+        assert_eq!(windows, vec!["c", "d"]);
+        assert_eq!(out.stats.drops.load(Ordering::Relaxed), 2);
+        assert_eq!(out.stats.emitted.load(Ordering::Relaxed), 4);
+    }
+
+    #[test]
+    fn coalesce_skips_repeats_of_the_waiting_state() {
+        let (mut out, rx) = outbox(4, Overflow::Coalesce);
+        out.push(state("app", "a"));
+        out.push(state("app", "a"));
+        out.push(state("app", "b"));
+        out.push(state("app", "b"));
+        assert_eq!(out.stats.coalesced.load(Ordering::Relaxed), 2);
+        assert_eq!(rx.try_iter().count(), 2);
+        // Once the queue is drained, a repeat is news again (heartbeat).
+        out.push(state("app", "b"));
+        assert_eq!(rx.len(), 1);
+    }
+
+    #[test]
+    fn push_reports_a_dropped_receiver() {
+        let (tx, rx) = bounded(1);
+        let mut out = Outbox::new(tx, &rx, Overflow::DropNewest, Arc::new(SamplerStats::default()));
+        drop(rx);
+        assert!(!out.push(state("app", "a")));
+    }
+
+    fn state(app: &str, window: &str) -> OsContextState {
+        OsContextState {
+            ts: "2024-01-01T00:00:00Z".to_string(),
+            app: app.to_string(),
+            window: window.to_string(),
+            clipboard: None,
+            dwell_ms: None,
+        }
+    }
+
+    #[test]
+    fn change_filter_suppresses_identical_states() {
+        let mut filter = ChangeFilter::new(None);
+        let t0 = Instant::now();
+        let mut out = Vec::new();
+        for i in 0..100 {
+            filter.feed(state("vscode", "main.rs"), t0 + Duration::from_millis(i * 500), |s| out.push(s));
+        }
+        assert_eq!(out.len(), 1, "only the opening state should be emitted");
+        assert_eq!(out[0].dwell_ms, None);
+    }
+
+    #[test]
+    fn change_filter_emits_closing_state_with_dwell() {
+        let mut filter = ChangeFilter::new(None);
+        let t0 = Instant::now();
+        let mut out = Vec::new();
+        filter.feed(state("vscode", "main.rs"), t0, |s| out.push(s));
+        filter.feed(state("vscode", "main.rs"), t0 + Duration::from_millis(500), |s| out.push(s));
+        filter.feed(state("firefox", "docs"), t0 + Duration::from_millis(1500), |s| out.push(s));
+
+        assert_eq!(out.len(), 3);
+        assert_eq!(out[1].app, "vscode");
+        assert_eq!(out[1].dwell_ms, Some(1500));
+        assert_eq!(out[2].app, "firefox");
+        assert_eq!(out[2].dwell_ms, None);
+    }
+
+    #[test]
+    fn change_filter_emits_heartbeats() {
+        let mut filter = ChangeFilter::new(Some(Duration::from_secs(60)));
+        let t0 = Instant::now();
+        let mut out = Vec::new();
+        // 10 minutes at 500 ms without a change: opening state + 10 heartbeats.
+        for i in 0..=1200u64 {
+            filter.feed(state("vscode", "main.rs"), t0 + Duration::from_millis(i * 500), |s| out.push(s));
+        }
+        assert_eq!(out.len(), 11);
+        assert!(out.iter().all(|s| s.dwell_ms.is_none()));
+    }
+
+    #[test]
+    fn state_record_is_normalized_jsonl() {
+        let mut buf = Vec::new();
+        write_state_record(&mut buf, &state("vscode", "main.rs"), "sid-1").unwrap();
+        write_state_record(&mut buf, &state("firefox", "docs"), "sid-1").unwrap();
+        let text = String::from_utf8(buf).unwrap();
+        let lines: Vec<&str> = text.lines().collect();
+        assert_eq!(lines.len(), 2);
+        assert!(text.ends_with('\n'));
+        let v: serde_json::Value = serde_json::from_str(lines[0]).unwrap();
+        assert_eq!(v["source"], "os.context.state");
+        assert_eq!(v["session"], "sid-1");
+        assert_eq!(v["app"], "vscode");
+        assert_eq!(v["ts"], "2024-01-01T00:00:00Z");
+    }
+
+    #[test]
+    fn dwell_is_not_serialized_when_absent() {
+        let json = serde_json::to_string(&state("a", "b")).unwrap();
+        assert!(!json.contains("dwell_ms"), "unexpected field in {}", json);
+    }
+
+    #[cfg(feature = "x11")]
+    #[test]
+    #[ignore = "needs an X server (Xvfb)"]
+    fn x11_wait_ignores_unrelated_property_changes() {
+        use crate::x11::tests::{activate, set_title, spawn_window};
+        use x11rb::connection::Connection;
+        use x11rb::protocol::xproto::{AtomEnum, ConnectionExt, PropMode};
+        use x11rb::rust_connection::RustConnection;
+
+        let (conn, screen) = RustConnection::connect(None).unwrap();
+        let root = conn.setup().roots[screen].root;
+        let window = spawn_window(&conn, root, "typing");
+        activate(&conn, root, window);
+        let mut x11 = X11Sampler::new().unwrap();
+        x11.watch().unwrap();
+        let mut sampler = X11EventSampler(x11);
+        let (_tx, stop) = bounded::<()>(1);
+
+        // What GTK/Firefox do on every keypress: no new context, no early wake.
+        let user_time = conn.intern_atom(false, b"_NET_WM_USER_TIME").unwrap().reply().unwrap().atom;
+        let t0 = Instant::now();
+        for stamp in 0..5u32 {
+            conn.change_property32(PropMode::REPLACE, window, user_time, AtomEnum::CARDINAL, &[stamp]).unwrap();
+            conn.flush().unwrap();
+            thread::sleep(Duration::from_millis(20));
+        }
+        assert!(sampler.wait(Duration::from_millis(400), &stop));
+        assert!(t0.elapsed() >= Duration::from_millis(400), "woke early after {:?}", t0.elapsed());
+
+        // A real change still ends the wait right away.
+        set_title(&conn, window, "typing, renamed");
+        let t0 = Instant::now();
+        assert!(sampler.wait(Duration::from_secs(5), &stop));
+        assert!(t0.elapsed() < Duration::from_secs(2));
+        assert_eq!(sampler.probe(0).window, "typing, renamed");
+    }
 }
@@ -1,8 +1,22 @@
-use x11rb::connection::Connection;
+use x11rb::connection::{Connection, RequestConnection};
 use x11rb::rust_connection::RustConnection;
-use x11rb::protocol::xproto::{ConnectionExt, AtomEnum};
+use x11rb::protocol::screensaver::{self, ConnectionExt as _};
+use x11rb::protocol::Event;
+use x11rb::protocol::xproto::{
+    AtomEnum, ChangeWindowAttributesAux, ClientMessageEvent, ConnectionExt, CreateWindowAux, EventMask,
+    Window, WindowClass,
+};
 use crate::sampler::OsContextState;
+use crossbeam_channel::{select, unbounded, Receiver};
+use std::collections::{HashMap, VecDeque};
 use std::error::Error;
+use std::sync::atomic::{AtomicBool, Ordering};
+use std::sync::Arc;
+use std::thread::{self, JoinHandle};
+use std::time::Duration;
+
+/// Windows whose properties stay cached (and watched) in event mode.
+const WINDOW_CACHE_CAPACITY: usize = 64;
 
 /// Parses a raw `WM_CLASS` property value into an application name.
 ///
@@ -18,125 +32,376 @@ fn parse_wm_class(raw: &[u8]) -> String {
         .unwrap_or_default()
 }
 
+/// The atoms the sampler needs, interned once per connection.
+#[derive(Debug, Clone, Copy)]
+struct Atoms {
+    net_active_window: u32,
+    net_wm_name: u32,
+    wm_name: u32,
+    wm_class: u32,
+    utf8_string: u32,
+}
+
+/// App and title of one window.
+#[derive(Debug, Clone, Default, PartialEq)]
+struct WindowProps {
+    app: String,
+    title: String,
+}
+
+impl WindowProps {
+    /// Prefers `_NET_WM_NAME` (UTF-8) over the legacy `WM_NAME` for the title.
+    fn from_values(net_wm_name: &[u8], wm_name: &[u8], wm_class: &[u8]) -> Self {
+        let title = if !net_wm_name.is_empty() { net_wm_name } else { wm_name };
+        Self {
+            app: parse_wm_class(wm_class),
+            title: String::from_utf8_lossy(title).into_owned(),
+        }
+    }
+
+    fn to_state(&self) -> OsContextState {
+        let or_unknown = |s: &str| if s.is_empty() { "Unknown".to_string() } else { s.to_string() };
+        OsContextState {
+            ts: chrono::Utc::now().to_rfc3339(),
+            app: or_unknown(&self.app),
+            window: or_unknown(&self.title),
+            clipboard: None,
+            dwell_ms: None,
+        }
+    }
+}
+
+/// What a `PropertyNotify` means for the sampler.
+#[derive(Debug, PartialEq)]
+enum Change {
+    /// `_NET_ACTIVE_WINDOW` on the root changed: focus moved.
+    Focus,
+    /// Title or class of this window changed.
+    Props(u32),
+    Ignore,
+}
+
+fn classify(atoms: &Atoms, root: u32, window: u32, atom: u32) -> Change {
+    if window == root {
+        if atom == atoms.net_active_window { Change::Focus } else { Change::Ignore }
+    } else if atom == atoms.net_wm_name || atom == atoms.wm_name || atom == atoms.wm_class {
+        Change::Props(window)
+    } else {
+        Change::Ignore
+    }
+}
+
+/// LRU set of watched windows with their cached properties.
+///
+/// Every window in here has `PropertyChangeMask` selected, so an entry is
+/// valid until a `PropertyNotify` invalidates it (`None` = re-read on next
+/// focus). Evicted windows are handed back so their events can be deselected.
+struct WindowCache {
+    capacity: usize,
+    entries: HashMap<u32, Option<WindowProps>>,
+    order: VecDeque<u32>,
+}
+
+impl WindowCache {
+    fn new(capacity: usize) -> Self {
+        Self { capacity: capacity.max(1), entries: HashMap::new(), order: VecDeque::new() }
+    }
+
+    fn contains(&self, window: u32) -> bool {
+        self.entries.contains_key(&window)
+    }
+
+    /// Marks `window` most recently used, adding it if needed; returns the evicted window.
+    fn touch(&mut self, window: u32) -> Option<u32> {
+        if self.entries.contains_key(&window) {
+            self.order.retain(|&w| w != window);
+            self.order.push_back(window);
+            return None;
+        }
+        self.entries.insert(window, None);
+        self.order.push_back(window);
+        if self.order.len() > self.capacity {
+            let evicted = self.order.pop_front()?;
+            self.entries.remove(&evicted);
+            return Some(evicted);
+        }
+        None
+    }
+
+    fn props(&self, window: u32) -> Option<&WindowProps> {
+        self.entries.get(&window).and_then(|p| p.as_ref())
+    }
+
+    fn store(&mut self, window: u32, props: WindowProps) {
+        if let Some(slot) = self.entries.get_mut(&window) {
+            *slot = Some(props);
+        }
+    }
+
+    fn invalidate(&mut self, window: u32) {
+        if let Some(slot) = self.entries.get_mut(&window) {
+            *slot = None;
+        }
+    }
+
+    fn forget(&mut self, window: u32) {
+        if self.entries.remove(&window).is_some() {
+            self.order.retain(|&w| w != window);
+        }
+    }
+}
+
+/// Thread blocking in `wait_for_event`, forwarding events to the sampler.
+///
+/// Shut down by setting `stop` and sending a ClientMessage to `wake_window`
+/// (an InputOnly window we own) so the blocking call returns.
+struct EventPump {
+    rx: Receiver<Event>,
+    wake_window: Window,
+    stop: Arc<AtomicBool>,
+    handle: Option<JoinHandle<()>>,
+}
+
 pub struct X11Sampler {
-    conn: RustConnection,
-    root: u32,
-    atom_net_active_window: u32,
-    atom_net_wm_name: u32,
-    atom_wm_name: u32,
-    atom_wm_class: u32,
-    atom_utf8_string: u32,
+    conn: Arc<RustConnection>,
+    root: Window,
+    atoms: Atoms,
+    active: Option<Window>,
+    cache: WindowCache,
+    events: Option<EventPump>,
+    // MIT-SCREEN-SAVER is present: input idle time is available.
+    screensaver: bool,
 }
 
 impl X11Sampler {
     pub fn new() -> Result<Self, Box<dyn Error>> {
         let (conn, screen_num) = RustConnection::connect(None)?;
         let root = conn.setup().roots[screen_num].root;
+        let screensaver = conn.extension_information(screensaver::X11_EXTENSION_NAME)?.is_some();
 
-        let atom_net_active_window = conn.intern_atom(false, b"_NET_ACTIVE_WINDOW")?.reply()?.atom;
-        let atom_net_wm_name = conn.intern_atom(false, b"_NET_WM_NAME")?.reply()?.atom;
-        let atom_wm_name = conn.intern_atom(false, b"WM_NAME")?.reply()?.atom;
-        let atom_wm_class = conn.intern_atom(false, b"WM_CLASS")?.reply()?.atom;
-        let atom_utf8_string = conn.intern_atom(false, b"UTF8_STRING")?.reply()?.atom;
+        // Send all InternAtom requests first, then collect: one round trip instead of five.
+        let names: [&[u8]; 5] = [b"_NET_ACTIVE_WINDOW", b"_NET_WM_NAME", b"WM_NAME", b"WM_CLASS", b"UTF8_STRING"];
+        let cookies = names
+            .iter()
+            .map(|name| conn.intern_atom(false, name))
+            .collect::<Result<Vec<_>, _>>()?;
+        let mut interned = Vec::with_capacity(names.len());
+        for cookie in cookies {
+            interned.push(cookie.reply()?.atom);
+        }
+        let atoms = Atoms {
+            net_active_window: interned[0],
+            net_wm_name: interned[1],
+            wm_name: interned[2],
+            wm_class: interned[3],
+            utf8_string: interned[4],
+        };
 
         Ok(Self {
-            conn,
+            conn: Arc::new(conn),
             root,
-            atom_net_active_window,
-            atom_net_wm_name,
-            atom_wm_name,
-            atom_wm_class,
-            atom_utf8_string,
+            atoms,
+            active: None,
+            cache: WindowCache::new(WINDOW_CACHE_CAPACITY),
+            events: None,
+            screensaver,
         })
     }
 
+    fn read_active(&self) -> Result<Option<Window>, Box<dyn Error>> {
+        let reply = self
+            .conn
+            .get_property(false, self.root, self.atoms.net_active_window, AtomEnum::WINDOW, 0, 1)?
+            .reply()?;
+        Ok(reply.value32().and_then(|mut v| v.next()).filter(|&w| w != 0))
+    }
+
+    /// Reads title and class of `window`, pipelining the three GetProperty
+    /// requests so they cost a single round trip.
+    fn fetch_props(&self, window: Window) -> Result<WindowProps, Box<dyn Error>> {
+        let conn = &*self.conn;
+        let net_wm_name =
+            conn.get_property(false, window, self.atoms.net_wm_name, self.atoms.utf8_string, 0, 1024)?;
+        let wm_name = conn.get_property(false, window, self.atoms.wm_name, AtomEnum::ANY, 0, 1024)?;
+        let wm_class = conn.get_property(false, window, self.atoms.wm_class, AtomEnum::STRING, 0, 1024)?;
+        let (net_wm_name, wm_name, wm_class) = (net_wm_name.reply()?, wm_name.reply()?, wm_class.reply()?);
+        Ok(WindowProps::from_values(&net_wm_name.value, &wm_name.value, &wm_class.value))
+    }
+
+    /// Time since the last keyboard/mouse input (MIT-SCREEN-SAVER), if the server reports it.
+    pub fn input_idle(&self) -> Option<Duration> {
+        if !self.screensaver {
+            return None;
+        }
+        let reply = self.conn.screensaver_query_info(self.root).ok()?.reply().ok()?;
+        Some(Duration::from_millis(u64::from(reply.ms_since_user_input)))
+    }
+
+    /// Polling mode: reads the active window and its properties (two round trips).
     pub fn get_state(&self) -> OsContextState {
-        let ts = chrono::Utc::now().to_rfc3339();
-
-        let mut app = String::new();
-        let mut window = String::new();
-
-        // Helper to perform property get
-        let get_active = || -> Result<(String, String), Box<dyn Error>> {
-            let reply = self.conn.get_property(
-                false,
-                self.root,
-                self.atom_net_active_window,
-                AtomEnum::WINDOW,
-                0,
-                1
-            )?.reply()?;
-
-            if let Some(active_window) = reply.value32().and_then(|mut v| v.next()) {
-                let mut w_title = String::new();
-
-                // 1. Try _NET_WM_NAME (UTF8)
-                let reply_utf8 = self.conn.get_property(
-                    false,
-                    active_window,
-                    self.atom_net_wm_name,
-                    self.atom_utf8_string,
-                    0,
-                    1024
-                )?.reply()?;
-
-                if !reply_utf8.value.is_empty() {
-                    w_title = String::from_utf8_lossy(&reply_utf8.value).to_string();
-                } else {
-                    // 2. Try WM_NAME (Legacy)
-                    let reply_legacy = self.conn.get_property(
-                        false,
-                        active_window,
-                        self.atom_wm_name,
-                        AtomEnum::ANY,
-                        0,
-                        1024
-                    )?.reply()?;
-                    if !reply_legacy.value.is_empty() {
-                        w_title = String::from_utf8_lossy(&reply_legacy.value).to_string();
-                    }
+        let props = match self.read_active() {
+            Ok(Some(window)) => self.fetch_props(window).unwrap_or_default(),
+            _ => WindowProps::default(),
+        };
+        props.to_state()
+    }
+
+    /// Switches to event mode: selects `PropertyChangeMask` on the root and
+    /// starts the event thread. Afterwards use `next_state`/`current_state`.
+    pub fn watch(&mut self) -> Result<(), Box<dyn Error>> {
+        if self.events.is_some() {
+            return Ok(());
+        }
+        let conn = &*self.conn;
+        conn.change_window_attributes(
+            self.root,
+            &ChangeWindowAttributesAux::new().event_mask(EventMask::PROPERTY_CHANGE),
+        )?
+        .check()?;
+        let wake_window = conn.generate_id()?;
+        conn.create_window(
+            x11rb::COPY_DEPTH_FROM_PARENT,
+            wake_window,
+            self.root,
+            -1,
+            -1,
+            1,
+            1,
+            0,
+            WindowClass::INPUT_ONLY,
+            x11rb::COPY_FROM_PARENT,
+            &CreateWindowAux::new(),
+        )?
+        .check()?;
+
+        let (tx, rx) = unbounded();
+        let stop = Arc::new(AtomicBool::new(false));
+        let thread_stop = Arc::clone(&stop);
+        let thread_conn = Arc::clone(&self.conn);
+        let handle = thread::spawn(move || {
+            // Ends on shutdown (wake message), connection loss, or a dropped receiver.
+            while let Ok(event) = thread_conn.wait_for_event() {
+                if thread_stop.load(Ordering::SeqCst) || tx.send(event).is_err() {
+                    break;
                 }
+            }
+        });
+        self.events = Some(EventPump { rx, wake_window, stop, handle: Some(handle) });
+
+        let active = self.read_active().unwrap_or(None);
+        self.focus(active);
+        Ok(())
+    }
+
+    fn select(&self, window: Window, mask: EventMask) {
+        // Fire and forget: the window may already be gone, which is harmless.
+        if let Ok(cookie) = self
+            .conn
+            .change_window_attributes(window, &ChangeWindowAttributesAux::new().event_mask(mask))
+        {
+            cookie.ignore_error();
+        }
+    }
+
+    /// Makes `window` the active one, watching it and filling its cache entry.
+    fn focus(&mut self, window: Option<Window>) {
+        self.active = window;
+        let window = match window {
+            Some(w) => w,
+            None => return,
+        };
+        if !self.cache.contains(window) {
+            // Select before reading, so no change can slip in between.
+            self.select(window, EventMask::PROPERTY_CHANGE | EventMask::STRUCTURE_NOTIFY);
+        }
+        if let Some(evicted) = self.cache.touch(window) {
+            self.select(evicted, EventMask::NO_EVENT);
+        }
+        if self.cache.props(window).is_none() {
+            let props = self.fetch_props(window).unwrap_or_default();
+            self.cache.store(window, props);
+        }
+    }
 
-                // 3. Get WM_CLASS
-                let reply_class = self.conn.get_property(
-                    false,
-                    active_window,
-                    self.atom_wm_class,
-                    AtomEnum::STRING,
-                    0,
-                    1024
-                )?.reply()?;
-
-                // WM_CLASS contains [instance, class] separated by NUL.
-                // Use the last non-empty part (class when both present, instance when only one).
-                let w_app = parse_wm_class(&reply_class.value);
-
-                Ok((w_app, w_title))
-            } else {
-                Ok(("".to_string(), "".to_string()))
+    /// The active window's state from the cache, without any X request.
+    pub fn current_state(&self) -> OsContextState {
+        self.active
+            .and_then(|w| self.cache.props(w))
+            .cloned()
+            .unwrap_or_default()
+            .to_state()
+    }
+
+    /// Event mode: waits up to `timeout` for a focus or title change and
+    /// returns the new state, or None if nothing relevant happened or `stop`
+    /// fired (a message or a disconnect). Bursts of events are coalesced into
+    /// one update.
+    pub fn next_state(&mut self, timeout: Duration, stop: &Receiver<()>) -> Option<OsContextState> {
+        let events: Vec<Event> = {
+            let pump = self.events.as_ref()?;
+            select! {
+                recv(pump.rx) -> first => match first {
+                    Ok(first) => std::iter::once(first).chain(pump.rx.try_iter()).collect(),
+                    Err(_) => {
+                        // Connection lost; behave like a quiet display from now on.
+                        let _ = stop.recv_timeout(timeout);
+                        return None;
+                    }
+                },
+                recv(stop) -> _ => return None,
+                default(timeout) => return None,
             }
         };
 
-        if let Ok((a, w)) = get_active() {
-            if !a.is_empty() { app = a; }
-            if !w.is_empty() { window = w; }
+        let mut focus_changed = false;
+        let mut dirty = Vec::new();
+        for event in events {
+            match event {
+                Event::PropertyNotify(ev) => match classify(&self.atoms, self.root, ev.window, ev.atom) {
+                    Change::Focus => focus_changed = true,
+                    Change::Props(window) => dirty.push(window),
+                    Change::Ignore => {}
+                },
+                Event::DestroyNotify(ev) => self.cache.forget(ev.window),
+                _ => {}
+            }
         }
 
-        if app.is_empty() { app = "Unknown".to_string(); }
-        if window.is_empty() { window = "Unknown".to_string(); }
+        let mut changed = false;
+        for window in dirty {
+            self.cache.invalidate(window);
+            changed |= Some(window) == self.active;
+        }
+        if focus_changed {
+            let active = self.read_active().unwrap_or(None);
+            changed |= active != self.active;
+            self.focus(active);
+        } else if changed {
+            let active = self.active;
+            self.focus(active);
+        }
+        changed.then(|| self.current_state())
+    }
+}
 
-        OsContextState {
-            ts,
-            app,
-            window,
-            clipboard: None,
+impl Drop for X11Sampler {
+    fn drop(&mut self) {
+        if let Some(mut pump) = self.events.take() {
+            pump.stop.store(true, Ordering::SeqCst);
+            let wake = ClientMessageEvent::new(32, pump.wake_window, self.atoms.net_active_window, [0u32; 5]);
+            let _ = self.conn.send_event(false, pump.wake_window, EventMask::NO_EVENT, wake);
+            let _ = self.conn.destroy_window(pump.wake_window);
+            let _ = self.conn.flush();
+            if let Some(handle) = pump.handle.take() {
+                handle.join().ok();
+            }
         }
     }
 }
 
 #[cfg(test)]
-mod tests {
-    use super::parse_wm_class;
+pub(crate) mod tests {
+    use super::*;
 
     #[test]
     fn wm_class_two_parts_returns_class() {
@@ -156,4 +421,125 @@ mod tests {
         assert_eq!(parse_wm_class(b""), "");
         assert_eq!(parse_wm_class(b"\0\0"), "");
     }
+
+    #[test]
+    fn props_prefer_net_wm_name_and_fall_back_to_unknown() {
+        let props = WindowProps::from_values(b"Caf\xc3\xa9", b"legacy", b"kitty\0Kitty\0");
+        assert_eq!(props, WindowProps { app: "Kitty".into(), title: "Café".into() });
+        assert_eq!(WindowProps::from_values(b"", b"legacy", b"").title, "legacy");
+        let state = WindowProps::default().to_state();
+        assert_eq!((state.app.as_str(), state.window.as_str()), ("Unknown", "Unknown"));
+    }
+
+    #[test]
+    fn classify_routes_focus_and_title_changes() {
+        let atoms = Atoms { net_active_window: 1, net_wm_name: 2, wm_name: 39, wm_class: 67, utf8_string: 5 };
+        let root = 100;
+        assert_eq!(classify(&atoms, root, root, 1), Change::Focus);
+        assert_eq!(classify(&atoms, root, root, 2), Change::Ignore);
+        assert_eq!(classify(&atoms, root, 7, 2), Change::Props(7));
+        assert_eq!(classify(&atoms, root, 7, 67), Change::Props(7));
+        assert_eq!(classify(&atoms, root, 7, 1), Change::Ignore);
+    }
+
+    #[test]
+    fn window_cache_is_lru_bounded_and_invalidates() {
+        let mut cache = WindowCache::new(2);
+        assert_eq!(cache.touch(1), None);
+        cache.store(1, WindowProps { app: "a".into(), title: "t".into() });
+        assert_eq!(cache.touch(2), None);
+        assert_eq!(cache.touch(1), None); // 1 is now most recent
+        assert_eq!(cache.touch(3), Some(2));
+        assert!(cache.props(1).is_some() && !cache.contains(2));
+
+        cache.invalidate(1);
+        assert!(cache.contains(1) && cache.props(1).is_none());
+        cache.forget(1);
+        assert!(!cache.contains(1));
+        assert_eq!(cache.touch(4), None);
+    }
+
+    // The tests below need an X server: `xvfb-run cargo test -p mitschreiber-sampler -- --ignored`.
+    // They play window manager themselves by setting _NET_ACTIVE_WINDOW on the root.
+
+    pub(crate) fn spawn_window(conn: &RustConnection, root: Window, title: &str) -> Window {
+        let window = conn.generate_id().unwrap();
+        conn.create_window(
+            x11rb::COPY_DEPTH_FROM_PARENT,
+            window,
+            root,
+            0,
+            0,
+            10,
+            10,
+            0,
+            WindowClass::INPUT_OUTPUT,
+            x11rb::COPY_FROM_PARENT,
+            &CreateWindowAux::new(),
+        )
+        .unwrap();
+        set_title(conn, window, title);
+        conn.change_property8(x11rb::protocol::xproto::PropMode::REPLACE, window, AtomEnum::WM_CLASS, AtomEnum::STRING, b"test\0Test\0")
+            .unwrap();
+        window
+    }
+
+    pub(crate) fn set_title(conn: &RustConnection, window: Window, title: &str) {
+        let utf8 = conn.intern_atom(false, b"UTF8_STRING").unwrap().reply().unwrap().atom;
+        let net_wm_name = conn.intern_atom(false, b"_NET_WM_NAME").unwrap().reply().unwrap().atom;
+        conn.change_property8(x11rb::protocol::xproto::PropMode::REPLACE, window, net_wm_name, utf8, title.as_bytes())
+            .unwrap();
+        conn.flush().unwrap();
+    }
+
+    pub(crate) fn activate(conn: &RustConnection, root: Window, window: Window) {
+        let active = conn.intern_atom(false, b"_NET_ACTIVE_WINDOW").unwrap().reply().unwrap().atom;
+        conn.change_property32(x11rb::protocol::xproto::PropMode::REPLACE, root, active, AtomEnum::WINDOW, &[window])
+            .unwrap();
+        conn.flush().unwrap();
+    }
+
+    #[test]
+    #[ignore = "needs an X server (Xvfb)"]
+    fn events_report_focus_and_title_changes() {
+        let (conn, screen) = RustConnection::connect(None).unwrap();
+        let root = conn.setup().roots[screen].root;
+        let first = spawn_window(&conn, root, "first");
+        let second = spawn_window(&conn, root, "second");
+        activate(&conn, root, first);
+
+        let mut sampler = X11Sampler::new().unwrap();
+        sampler.watch().unwrap();
+        let stop = crossbeam_channel::never();
+        assert_eq!(sampler.current_state().window, "first");
+        assert!(sampler.next_state(Duration::from_millis(50), &stop).is_none(), "idle display must stay quiet");
+
+        activate(&conn, root, second);
+        let state = sampler.next_state(Duration::from_secs(2), &stop).expect("focus change");
+        assert_eq!((state.app.as_str(), state.window.as_str()), ("Test", "second"));
+
+        set_title(&conn, second, "renamed");
+        assert_eq!(sampler.next_state(Duration::from_secs(2), &stop).expect("title change").window, "renamed");
+
+        // Background window changes only invalidate the cache; refocusing re-reads them.
+        set_title(&conn, first, "first, renamed");
+        assert!(sampler.next_state(Duration::from_millis(200), &stop).is_none());
+        activate(&conn, root, first);
+        assert_eq!(sampler.next_state(Duration::from_secs(2), &stop).unwrap().window, "first, renamed");
+    }
+
+    #[test]
+    #[ignore = "needs an X server (Xvfb)"]
+    fn polling_matches_event_state() {
+        let (conn, screen) = RustConnection::connect(None).unwrap();
+        let root = conn.setup().roots[screen].root;
+        let window = spawn_window(&conn, root, "polled");
+        activate(&conn, root, window);
+
+        let sampler = X11Sampler::new().unwrap();
+        let state = sampler.get_state();
+        assert_eq!((state.app.as_str(), state.window.as_str()), ("Test", "polled"));
+        // Xvfb ships MIT-SCREEN-SAVER; nobody touched the virtual keyboard.
+        assert!(sampler.input_idle().is_some());
+    }
 }
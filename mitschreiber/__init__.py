@@ -1,3 +1,18 @@
-from ._mitschreiber import start_session, stop_session, poll_state
+"""
+mitschreiber: local desktop-context capture.
 
-__all__ = ["start_session", "stop_session", "poll_state"]
+The native sampler is imported on first use, so control commands
+(`mitschreiber status` / `stop`) start without loading the extension.
+"""
+
+__all__ = ["start_session", "stop_session", "poll_state", "poll_state_jsonl", "poll_state_wait", "session_stats"]
+
+
+def __getattr__(name):
+    if name in __all__:
+        from . import _mitschreiber
+
+        value = getattr(_mitschreiber, name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
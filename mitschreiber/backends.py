@@ -0,0 +1,391 @@
+"""
+Pluggable embedding backends.
+
+    hash                   deterministic BLAKE2b pseudo-embeddings (embedding.py), zero deps
+    sentence-transformers  PyTorch models via sentence-transformers (extra: embed)
+    onnx                   ONNX Runtime CPU inference with a built-in WordPiece
+                           tokenizer, no PyTorch (extra: onnx)
+
+The backend is chosen by `mitschreiber start --embed-backend` or
+MITSCHREIBER_EMBED_BACKEND (default: sentence-transformers); the model by
+--embed-model / MITSCHREIBER_EMBED_MODEL. Each backend reports a model_id that
+is written to meta.model, keys the embedding cache and names the vector
+index, so vectors of different backends never mix.
+
+An ONNX model directory holds model.onnx (or onnx/model.onnx) and the
+vocab.txt of its BERT-style tokenizer, e.g. an export of
+sentence-transformers/all-MiniLM-L6-v2 via `optimum-cli export onnx`.
+"""
+from __future__ import annotations
+import math
+import os
+import sys
+import threading
+import unicodedata
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from .embedding import _hash32
+
+BACKEND_ENV = "MITSCHREIBER_EMBED_BACKEND"
+MODEL_ENV = "MITSCHREIBER_EMBED_MODEL"
+THREADS_ENV = "MITSCHREIBER_EMBED_THREADS"
+
+DEFAULT_BACKEND = "sentence-transformers"
+DEFAULT_ST_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+class EmbeddingBackend:
+    """
+    Turns texts into L2-normalized vectors. Implementations load their model
+    lazily so that selecting a backend costs nothing until the first batch.
+    """
+
+    name = ""
+    model_id = ""
+    # Options that configure process-wide state (shared by every instance):
+    # they do not tell backends apart, see configure().
+    process_wide: Tuple[str, ...] = ()
+
+    def load(self) -> "EmbeddingBackend":
+        """
+        Loads the model now (surfaces missing dependencies at startup).
+        """
+        return self
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+
+_BACKENDS: Dict[str, Callable[..., EmbeddingBackend]] = {}
+
+
+def register_backend(name: str):
+    def deco(factory):
+        _BACKENDS[name] = factory
+        return factory
+    return deco
+
+
+def available_backends() -> List[str]:
+    return sorted(_BACKENDS)
+
+
+def create_backend(name: str, **options) -> EmbeddingBackend:
+    try:
+        factory = _BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"unknown embedding backend {name!r} (available: {', '.join(available_backends())})") from None
+    return factory(**{k: v for k, v in options.items() if v is not None})
+
+
+def _normalize(vec: Sequence[float]) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vec))
+    return [float(x) / norm for x in vec] if norm else [float(x) for x in vec]
+
+
+@register_backend("hash")
+class HashBackend(EmbeddingBackend):
+    name = "hash"
+
+    def __init__(
+        self,
+        dim: int = 32,
+        model: Optional[str] = None,
+        threads: Optional[int] = None,
+        inter_op_threads: Optional[int] = None,
+    ):
+        if not 0 < dim <= 64:
+            raise ValueError(f"hash backend dim must be between 1 and 64 (got {dim})")
+        self.dim = dim
+        self.model_id = "hash32-demo" if dim == 32 else f"hash{dim}-demo"
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        return [_normalize(_hash32(text, dim=self.dim)) for text in texts]
+
+
+# torch's thread pools belong to the process, not to a backend: sizes set so far.
+_torch_threads: Dict[str, int] = {}
+_torch_lock = threading.Lock()
+
+
+def _set_torch_threads(threads: Optional[int], inter_op_threads: Optional[int]):
+    """
+    Sizes torch's thread pools once per process. A later backend asking for
+    other sizes keeps the current ones, with a warning.
+    """
+    wanted = [(k, n) for k, n in (("threads", threads), ("inter_op_threads", inter_op_threads)) if n]
+    if not wanted:
+        return
+    import torch
+
+    setters = {"threads": torch.set_num_threads, "inter_op_threads": torch.set_num_interop_threads}
+    with _torch_lock:
+        for key, n in wanted:
+            have = _torch_threads.get(key)
+            if have is None:
+                try:
+                    setters[key](n)
+                except RuntimeError as exc:
+                    # set_num_interop_threads refuses once torch has run parallel work.
+                    print(f"mitschreiber: cannot set torch {key} to {n} ({exc}); keeping the default", file=sys.stderr)
+                    continue
+                _torch_threads[key] = n
+            elif have != n:
+                print(
+                    f"mitschreiber: torch {key} is per process and already {have}; ignoring {n}",
+                    file=sys.stderr,
+                )
+
+
+@register_backend("sentence-transformers")
+class SentenceTransformersBackend(EmbeddingBackend):
+    name = "sentence-transformers"
+    process_wide = ("threads", "inter_op_threads")
+
+    def __init__(
+        self, model: str = DEFAULT_ST_MODEL, threads: Optional[int] = None, inter_op_threads: Optional[int] = None
+    ):
+        self.model_id = model
+        self.threads = threads
+        self.inter_op_threads = inter_op_threads
+        self._model = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import SentenceTransformer
+                _set_torch_threads(self.threads, self.inter_op_threads)
+                self._model = SentenceTransformer(self.model_id)
+        return self
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        self.load()
+        vecs = self._model.encode(
+            list(texts), batch_size=len(texts), normalize_embeddings=True, convert_to_numpy=False
+        )
+        return [[float(x) for x in vec] for vec in vecs]
+
+
+class WordPieceTokenizer:
+    """
+    BERT-style tokenization (basic split + greedy longest-match WordPiece)
+    from a vocab.txt, enough for sentence-embedding models without pulling
+    in a tokenizer library. Pieces are memoized per word: window titles repeat.
+    """
+
+    def __init__(self, vocab_path: Path, lowercase: bool = True, max_word_chars: int = 100):
+        with open(vocab_path, encoding="utf-8") as fp:
+            self.vocab = {line.rstrip("\n"): i for i, line in enumerate(fp)}
+        self.lowercase = lowercase
+        self.max_word_chars = max_word_chars
+        self.unk = self.vocab["[UNK]"]
+        self.cls = self.vocab["[CLS]"]
+        self.sep = self.vocab["[SEP]"]
+        self.pad = self.vocab.get("[PAD]", 0)
+        self._pieces: Dict[str, Tuple[int, ...]] = {}
+
+    def _basic(self, text: str) -> List[str]:
+        if self.lowercase:
+            text = unicodedata.normalize("NFD", text.lower())
+            text = "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+        words, cur = [], []
+        for ch in text:
+            cat = unicodedata.category(ch)
+            if ch.isspace():
+                if cur:
+                    words.append("".join(cur))
+                    cur = []
+            elif cat.startswith("C"):
+                continue
+            elif cat.startswith("P") or (ch.isascii() and not ch.isalnum()) or 0x4E00 <= ord(ch) <= 0x9FFF:
+                # Punctuation, ASCII symbols and CJK ideographs are tokens of their own.
+                if cur:
+                    words.append("".join(cur))
+                    cur = []
+                words.append(ch)
+            else:
+                cur.append(ch)
+        if cur:
+            words.append("".join(cur))
+        return words
+
+    def _wordpiece(self, word: str) -> Tuple[int, ...]:
+        pieces = self._pieces.get(word)
+        if pieces is not None:
+            return pieces
+        if len(word) > self.max_word_chars:
+            pieces = (self.unk,)
+        else:
+            out, start = [], 0
+            while start < len(word):
+                end, match = len(word), None
+                while start < end:
+                    sub = word[start:end] if start == 0 else "##" + word[start:end]
+                    match = self.vocab.get(sub)
+                    if match is not None:
+                        break
+                    end -= 1
+                if match is None:
+                    out = [self.unk]
+                    break
+                out.append(match)
+                start = end
+            pieces = tuple(out)
+        if len(self._pieces) < 100_000:
+            self._pieces[word] = pieces
+        return pieces
+
+    def encode(self, text: str, max_length: int = 256) -> List[int]:
+        ids = [self.cls]
+        for word in self._basic(text):
+            ids.extend(self._wordpiece(word))
+        return ids[: max_length - 1] + [self.sep]
+
+
+@register_backend("onnx")
+class OnnxBackend(EmbeddingBackend):
+    name = "onnx"
+
+    def __init__(
+        self,
+        model: str,
+        threads: Optional[int] = None,
+        inter_op_threads: Optional[int] = None,
+        max_length: int = 256,
+        batch_size: int = 32,
+        pooling: str = "mean",
+        model_id: Optional[str] = None,
+    ):
+        if pooling not in ("mean", "cls"):
+            raise ValueError(f"pooling must be 'mean' or 'cls' (got {pooling!r})")
+        path = Path(model).expanduser()
+        self.model_dir = path.parent if path.suffix == ".onnx" else path
+        if path.suffix == ".onnx":
+            self.model_path = path
+        else:
+            candidates = [path / "model.onnx", path / "onnx" / "model.onnx"]
+            self.model_path = next((p for p in candidates if p.exists()), candidates[0])
+        self.model_id = model_id or f"onnx/{self.model_dir.name}"
+        self.threads = threads
+        self.inter_op_threads = inter_op_threads
+        self.max_length = max_length
+        self.batch_size = batch_size
+        self.pooling = pooling
+        self._session = None
+        self._inputs: List[str] = []
+        self.tokenizer: Optional[WordPieceTokenizer] = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if self._session is None:
+                import onnxruntime as ort  # optional dependency: pip install mitschreiber[onnx]
+
+                opts = ort.SessionOptions()
+                opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+                if self.threads:
+                    opts.intra_op_num_threads = self.threads
+                if self.inter_op_threads:
+                    opts.inter_op_num_threads = self.inter_op_threads
+                    opts.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+                vocab = self.model_dir / "vocab.txt"
+                if not vocab.exists():
+                    vocab = self.model_path.parent / "vocab.txt"
+                self.tokenizer = WordPieceTokenizer(vocab)
+                self._session = ort.InferenceSession(
+                    str(self.model_path), sess_options=opts, providers=["CPUExecutionProvider"]
+                )
+                self._inputs = [i.name for i in self._session.get_inputs()]
+        return self
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        import numpy as np
+
+        self.load()
+        encoded = [self.tokenizer.encode(t, self.max_length) for t in texts]
+        # Length-sorted batches keep padding (wasted compute) small.
+        order = sorted(range(len(encoded)), key=lambda i: len(encoded[i]))
+        out: List[Optional[List[float]]] = [None] * len(encoded)
+        for start in range(0, len(order), self.batch_size):
+            idx = order[start:start + self.batch_size]
+            width = max(len(encoded[i]) for i in idx)
+            ids = np.full((len(idx), width), self.tokenizer.pad, dtype=np.int64)
+            mask = np.zeros((len(idx), width), dtype=np.int64)
+            for row, i in enumerate(idx):
+                ids[row, : len(encoded[i])] = encoded[i]
+                mask[row, : len(encoded[i])] = 1
+            feeds = {}
+            for name in self._inputs:
+                if name == "input_ids":
+                    feeds[name] = ids
+                elif name == "attention_mask":
+                    feeds[name] = mask
+                elif name == "token_type_ids":
+                    feeds[name] = np.zeros_like(ids)
+            hidden = self._session.run(None, feeds)[0]
+            if hidden.ndim == 3:
+                if self.pooling == "cls":
+                    pooled = hidden[:, 0]
+                else:
+                    m = mask[:, :, None].astype(hidden.dtype)
+                    pooled = (hidden * m).sum(axis=1) / np.maximum(m.sum(axis=1), 1e-9)
+            else:
+                # The export already pools (sentence_embedding output).
+                pooled = hidden
+            norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+            pooled = pooled / np.maximum(norms, 1e-12)
+            for row, i in enumerate(idx):
+                out[i] = pooled[row].astype(float).tolist()
+        return out
+
+
+# Backends by (name, options): sessions asking for the same model share one
+# loaded instance; each session still holds its own reference.
+_shared: Dict[tuple, EmbeddingBackend] = {}
+_shared_lock = threading.Lock()
+
+
+def _env_int(name: str) -> Optional[int]:
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+
+def configure(name: Optional[str] = None, **options) -> EmbeddingBackend:
+    """
+    Returns the backend for `name` and options (name/model fall back to the
+    environment). Asking again for the same backend and options returns the
+    existing, already loaded one: a daemon hosting many sessions loads each
+    model once, and sessions with different backends never affect each other.
+    Process-wide options (torch thread pools) do not make a separate backend:
+    the first request sets them, later differing ones are reported and ignored.
+    """
+    name = name or os.environ.get(BACKEND_ENV) or DEFAULT_BACKEND
+    if options.get("model") is None:
+        options["model"] = os.environ.get(MODEL_ENV) or None
+    if options.get("threads") is None:
+        options["threads"] = _env_int(THREADS_ENV)
+    if name == "onnx" and not options.get("model"):
+        raise ValueError(f"the onnx backend needs a model directory (--embed-model or {MODEL_ENV})")
+    shared = getattr(_BACKENDS.get(name), "process_wide", ())
+    key = (name, tuple(sorted((k, v) for k, v in options.items() if v is not None and k not in shared)))
+    with _shared_lock:
+        backend = _shared.get(key)
+    if backend is not None:
+        for k in shared:
+            if options.get(k) is not None and options[k] != getattr(backend, k, None):
+                print(
+                    f"mitschreiber: {name} {k} are per process and were set by an earlier session; "
+                    f"ignoring {options[k]}",
+                    file=sys.stderr,
+                )
+        return backend
+    backend = create_backend(name, **options)
+    with _shared_lock:
+        # Another session may have created it meanwhile: keep the first one.
+        return _shared.setdefault(key, backend)
@@ -1,13 +1,54 @@
 # mitschreiber/cli.py
 from __future__ import annotations
-import argparse, json, os, signal, sys, uuid
+import argparse, json, os, shutil, signal, sys, uuid
 import psutil
+from datetime import date, datetime, time as dtime
 from pathlib import Path
-from .session import run_session, SESSIONS_DIR
+from .paths import WAL_DIR, SESS_DIR as SESSIONS_DIR
+
+# status/stop are bound to hotkeys: everything heavier than the parser
+# (native sampler, embedding stack, WAL writer, numpy) is imported by the command
+# that needs it. Parser choices are therefore literals; tests/test_startup.py
+# checks them against wal.py and backends.py.
+EMBED_BACKENDS = ("sentence-transformers", "onnx", "hash")
+DURABILITY_MODES = ("none", "flush", "fdatasync")
+COMPRESSION_MODES = ("gzip", "zstd", "none")
+WAL_FORMATS = ("jsonl", "binary")
+
+def run_session(*args, **kwargs):
+    from .session import run_session as _run_session
+
+    return _run_session(*args, **kwargs)
 
 def _active_path() -> Path:
     return SESSIONS_DIR / "active.json"
 
+def _socket_path() -> Path:
+    return SESSIONS_DIR / "control.sock"
+
+def _daemon_request(req: dict, timeout: float = 5.0):
+    """
+    Asks a running daemon; None when there is none (checked via the socket file first, no import).
+    A daemon that accepts but fails to answer (timeout, permissions, garbled reply) ends the
+    command with one error line and exit status 2.
+    """
+    path = _socket_path()
+    if not path.exists():
+        return None
+    from .daemon import DaemonError, request
+
+    try:
+        return request(path, req, timeout=timeout)
+    except (OSError, DaemonError, ValueError) as exc:
+        print(f"mitschreiber: daemon at {path} did not answer: {exc or type(exc).__name__}", file=sys.stderr)
+        raise SystemExit(2) from None
+
+def _active_session_id():
+    try:
+        return json.loads(_active_path().read_text(encoding="utf-8")).get("session_id")
+    except (OSError, ValueError, AttributeError):
+        return None
+
 def _positive_int(value: str) -> int:
     try:
         parsed = int(value)
@@ -17,7 +58,121 @@ def _positive_int(value: str) -> int:
         raise argparse.ArgumentTypeError("must be a positive integer (greater than zero)")
     return parsed
 
+def _positive_float(value: str) -> float:
+    try:
+        parsed = float(value)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError("must be a positive number") from exc
+    if parsed <= 0:
+        raise argparse.ArgumentTypeError("must be a positive number (greater than zero)")
+    return parsed
+
+def _similarity_arg(value: str):
+    if value.strip().lower() in ("off", "none", "0"):
+        return None
+    try:
+        parsed = float(value)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError("must be a similarity in (0, 1] or 'off'") from exc
+    if not 0.0 < parsed <= 1.0:
+        raise argparse.ArgumentTypeError("must be a similarity in (0, 1] or 'off'")
+    return parsed
+
+def _terms_file(value: str) -> list:
+    """
+    Reads --redact-terms: one word or name per line; blank lines and # comments are skipped.
+    """
+    try:
+        with open(value, encoding="utf-8") as f:
+            lines = [line.strip() for line in f]
+    except OSError as exc:
+        raise argparse.ArgumentTypeError(f"cannot read {value}: {exc.strerror}") from exc
+    return [line for line in lines if line and not line.startswith("#")]
+
+def _mb_to_bytes(mb):
+    return int(mb * 1024 * 1024) if mb is not None else None
+
+def _add_retention_args(parser):
+    parser.add_argument(
+        "--retention-days",
+        type=_positive_float,
+        default=None,
+        help="Delete WAL segments older than this many days.",
+    )
+    parser.add_argument(
+        "--retention-size-mb",
+        type=_positive_float,
+        default=None,
+        help="Delete the oldest WAL segments while all sessions together exceed this size.",
+    )
+
+def _when(value: str) -> float:
+    """
+    Parses --since/--until: 'HH:MM' (today), 'YYYY-MM-DD' or an ISO datetime.
+    Values without a UTC offset are local time. Returns epoch seconds.
+    """
+    try:
+        if len(value) <= 5 and ":" in value:
+            dt = datetime.combine(date.today(), dtime.fromisoformat(value))
+        else:
+            dt = datetime.fromisoformat(value)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError("expected HH:MM, YYYY-MM-DD or an ISO datetime") from exc
+    # Naive datetimes are interpreted as local time by timestamp().
+    return dt.timestamp()
+
+def _session_options(args) -> dict:
+    return dict(
+        embed=bool(args.embed),
+        clipboard=bool(args.clipboard),
+        poll_ms=int(args.poll_interval),
+        max_poll_ms=args.max_poll_interval,
+        queue_capacity=int(args.queue_capacity),
+        queue_overflow=args.queue_overflow,
+        embed_batch=int(args.embed_batch_size),
+        embed_delay_ms=int(args.embed_max_delay),
+        embed_cache_size=int(args.embed_cache_size),
+        embed_cache_persist=bool(args.embed_cache_persist),
+        change_only=bool(args.change_only),
+        heartbeat_ms=int(args.heartbeat),
+        sampler=args.sampler,
+        durability=args.durability,
+        sync_interval_ms=int(args.sync_interval),
+        segment_bytes=_mb_to_bytes(args.segment_size_mb),
+        segment_age_s=float(args.segment_minutes) * 60.0,
+        compression=args.compress,
+        retention_days=args.retention_days,
+        retention_bytes=_mb_to_bytes(args.retention_size_mb),
+        wal_format=args.wal_format,
+        ship=bool(args.ship),
+        embed_backend=args.embed_backend,
+        embed_model=args.model,
+        embed_threads=args.embed_threads,
+        embed_inter_op_threads=args.embed_inter_op_threads,
+        keyphrase_persist=bool(args.keyphrase_persist),
+        embed_encoding=args.embed_encoding,
+        embed_dim=args.embed_dim,
+        embed_dedup=args.embed_dedup,
+        embed_dedup_memory=int(args.embed_dedup_memory),
+        rollup_windows=args.rollup,
+        redact=not args.no_redact,
+        redact_terms=args.redact_terms or [],
+    )
+
 def cmd_start(args):
+    options = _session_options(args)
+    if not args.foreground and args.metrics_port is None:
+        # A running daemon hosts the session: no process or model startup.
+        from .daemon import START_TIMEOUT_S
+
+        reply = _daemon_request({"op": "start", "options": options}, timeout=START_TIMEOUT_S + 10)
+        if reply is not None:
+            if not reply.get("ok"):
+                print(reply.get("error", "daemon refused the session"), file=sys.stderr)
+                return 2
+            print(f"Session {reply['session_id']} started in daemon.")
+            return 0
+
     sid = str(uuid.uuid4())
     active = {
         "session_id": sid,
@@ -26,6 +181,8 @@ def cmd_start(args):
             "embed": bool(args.embed),
             "clipboard": bool(args.clipboard),
             "poll_interval_ms": int(args.poll_interval),
+            "change_only": bool(args.change_only),
+            "ship": bool(args.ship),
         }
     }
     SESSIONS_DIR.mkdir(parents=True, exist_ok=True)
@@ -33,12 +190,7 @@ def cmd_start(args):
     print(f"Session {sid} active (embed={args.embed}, clipboard={args.clipboard}, poll={args.poll_interval}ms)")
     try:
         # Übergibt in den Event-Loop (blockiert bis Ctrl+C)
-        run_session(
-            session_id=sid,
-            embed=args.embed,
-            clipboard=args.clipboard,
-            poll_ms=int(args.poll_interval),
-        )
+        run_session(session_id=sid, metrics_port=args.metrics_port, **options)
     except ValueError as exc:
         print(str(exc), file=sys.stderr)
         return 2
@@ -48,6 +200,13 @@ def cmd_start(args):
         print("Session stopped.")
 
 def cmd_status(_):
+    reply = _daemon_request({"op": "status"})
+    if reply is not None:
+        print(json.dumps(reply, indent=2))
+        # start --foreground / --metrics-port sessions run beside the daemon, in active.json.
+        if not _active_path().exists():
+            return
+        print("Foreground session:")
     active = _active_path()
     try:
         if not active.exists():
@@ -85,7 +244,24 @@ def cmd_status(_):
     except FileNotFoundError:
         print("No active session.")
 
-def cmd_stop(_):
+def cmd_stop(args):
+    reply = _daemon_request({"op": "stop", "session_id": args.session}, timeout=60.0)
+    if reply is not None:
+        # A foreground session (start --foreground / --metrics-port) is not the daemon's:
+        # stop it as well when stopping all, or when it is the one asked for.
+        foreground = _active_path().exists() and args.session in (None, _active_session_id())
+        if not reply.get("ok"):
+            if args.session is None or not foreground:
+                print(reply.get("error", "daemon refused to stop"), file=sys.stderr)
+                return 2
+        else:
+            stopped = reply.get("stopped") or []
+            if stopped:
+                print(f"Stopped {len(stopped)} session(s) in daemon.")
+            if args.session is not None or not foreground:
+                if not stopped:
+                    print("No active session.")
+                return
     active = _active_path()
     try:
         if not active.exists():
@@ -141,27 +317,507 @@ def cmd_stop(_):
     # (which is harmless with missing_ok=True) or worse, cmd_start is still running and the file is gone,
     # confusing status checks.
 
+def _raise_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+def cmd_daemon(_):
+    from .daemon import Daemon, DaemonError
+
+    try:
+        daemon = Daemon(_socket_path()).bind()
+    except DaemonError as exc:
+        print(str(exc), file=sys.stderr)
+        return 2
+    # systemd stops services with SIGTERM: shut sessions down as cleanly as on Ctrl+C.
+    signal.signal(signal.SIGTERM, _raise_interrupt)
+    print(f"Daemon {os.getpid()} listening on {daemon.socket_path}")
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print("Daemon stopped.")
+
+def cmd_prune(args):
+    if args.retention_days is None and args.retention_size_mb is None:
+        print("Nothing to do: pass --retention-days and/or --retention-size-mb.", file=sys.stderr)
+        return 2
+    from .retention import enforce_retention
+
+    removed = enforce_retention(
+        WAL_DIR,
+        max_age_days=args.retention_days,
+        max_bytes=_mb_to_bytes(args.retention_size_mb),
+    )
+    for p in removed:
+        print(f"removed {p.name}")
+    print(f"{len(removed)} segment(s) removed.")
+    if args.retention_days is not None:
+        from .embed_cache import DEFAULT_CACHE_PATH, EmbeddingCache
+
+        if DEFAULT_CACHE_PATH.exists():
+            cache = EmbeddingCache(path=DEFAULT_CACHE_PATH)
+            try:
+                print(f"{cache.prune(args.retention_days)} cached embedding(s) removed.")
+            finally:
+                cache.close()
+
+def cmd_convert(args):
+    from . import walbin
+    from .walio import is_binary, open_segment
+
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for name in args.files:
+            path = Path(name)
+            with open_segment(path) as src:
+                if is_binary(path):
+                    walbin.to_jsonl(src, out)
+                else:
+                    shutil.copyfileobj(src, out)
+    finally:
+        if args.output:
+            out.close()
+        else:
+            out.flush()
+
+def cmd_export(args):
+    try:
+        import pyarrow  # noqa: F401 -- optional dependency: pip install mitschreiber[export]
+    except ImportError:
+        print("export needs pyarrow: pip install 'mitschreiber[export]'", file=sys.stderr)
+        return 2
+    from .export import export_wal
+    from .paths import EXPORT_DIR
+
+    out = Path(args.output) if args.output else EXPORT_DIR
+    summary = export_wal(WAL_DIR, out, jobs=args.jobs, batch_rows=args.batch_rows, force=args.force)
+    for failure in summary["failed"]:
+        print(f"failed: {failure}", file=sys.stderr)
+    rows = ", ".join(f"{n} {table}" for table, n in sorted(summary["rows"].items())) or "no rows"
+    print(f"{summary['exported']} file(s) exported ({rows}), {summary['unchanged']} unchanged, to {out}")
+    return 1 if summary["failed"] else 0
+
+def cmd_query(args):
+    from .query import query
+
+    out = sys.stdout
+    for rec in query(
+        WAL_DIR,
+        since=args.since,
+        until=args.until,
+        app=args.app,
+        source=args.source,
+        session=args.session,
+    ):
+        out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+    out.flush()
+
+def _rollup_arg(value: str):
+    from .rollup import parse_windows
+
+    try:
+        return parse_windows(value)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(str(exc)) from exc
+
+def _window_arg(value: str) -> int:
+    windows = _rollup_arg(value)
+    if len(windows) != 1:
+        raise argparse.ArgumentTypeError("expected one window, e.g. 15m")
+    return windows[0]
+
+def _hms(seconds: float) -> str:
+    s = int(round(seconds))
+    return f"{s // 3600}:{s // 60 % 60:02d}:{s % 60:02d}"
+
+def cmd_report(args):
+    from .query import query
+    from .rollup import ROLLUP_SOURCE, report, rollup_segments
+
+    # Rollups carry their window end as ts; one that ends exactly at --until still counts.
+    records = query(
+        WAL_DIR,
+        since=args.since,
+        until=None if args.until is None else args.until + 1,
+        source=ROLLUP_SOURCE,
+        session=args.session,
+        files=rollup_segments(WAL_DIR),
+    )
+    resolution, rows = report(records, since=args.since, until=args.until, by=args.by, resolution=args.resolution)
+    if args.json:
+        for row in rows[: args.top]:
+            print(json.dumps(dict(row, resolution_s=resolution), ensure_ascii=False))
+        return 0
+    if not rows:
+        print("No rollups in range.")
+        return 0
+    total = sum(r["seconds"] for r in rows)
+    for row in rows[: args.top]:
+        label = row["app"] if args.by == "app" else f"{row['app']} | {row['window']}"
+        print(f"{_hms(row['seconds']):>9}  {row['seconds'] / total:6.1%}  {label}")
+    print(f"{_hms(total):>9}  total ({len(rows)} {args.by}s, {resolution}s windows)")
+    return 0
+
+def cmd_ship(args):
+    from .sink import ChronikSink, SinkError
+
+    try:
+        sink = ChronikSink.from_env(
+            wal_dir=WAL_DIR,
+            batch_records=int(args.batch_size),
+            max_delay_ms=int(args.max_delay),
+        )
+        if args.follow:
+            sink.start()
+            try:
+                while sink.thread.is_alive():
+                    sink.thread.join(0.5)
+            except KeyboardInterrupt:
+                pass
+            finally:
+                sink.stop()
+            stats = sink.stats()
+        else:
+            stats = sink.ship()
+    except (ValueError, SinkError) as exc:
+        print(str(exc), file=sys.stderr)
+        return 2
+    print(f"{stats['sent_records']} record(s) shipped in {stats['sent_batches']} batch(es), {stats['rejected']} rejected.")
+
+def _open_index(args):
+    from .backends import configure
+    from .vindex import VectorIndex
+
+    # Constructing a backend is cheap; the model loads on first use.
+    backend = configure(args.embed_backend, model=args.model)
+    index = VectorIndex.for_model(backend.model_id)
+    if not args.no_update:
+        index.update(WAL_DIR)
+    return backend, index
+
+def cmd_index(args):
+    try:
+        _, index = _open_index(args)
+    except ValueError as exc:
+        print(str(exc), file=sys.stderr)
+        return 2
+    if args.ivf:
+        nlist = index.build_ivf(nlist=args.nlist)
+        print(f"IVF built: {nlist} lists over {len(index)} vectors.")
+    print(f"{len(index)} vectors indexed ({index.model}, dim={index.dim}) in {index.dir}")
+
+def cmd_search(args):
+    try:
+        backend, index = _open_index(args)
+    except ValueError as exc:
+        print(str(exc), file=sys.stderr)
+        return 2
+    if not len(index):
+        print(f"Index for {backend.model_id} is empty: run a session with --embed first.", file=sys.stderr)
+        return 1
+    if index.model != backend.model_id:
+        print(f"Index was built with {index.model}, not {backend.model_id}.", file=sys.stderr)
+        return 2
+    # Same backend and model as the indexed events, so query and rows share one space.
+    query = backend.embed([args.text])[0]
+    if index.dim and len(query) > index.dim:
+        # The session emitted truncated vectors (--embed-dim); cut the query the same way.
+        from .quantize import truncate
+
+        query = truncate(query, index.dim)
+    hits = index.search(query, k=args.k, nprobe=args.nprobe)
+    for hit in hits:
+        if args.json:
+            print(json.dumps(hit, ensure_ascii=False))
+        else:
+            kp = ", ".join(hit.get("keyphrases") or [])
+            print(f"{hit['score']:.3f}  {hit.get('ts')}  {hit.get('app')}  {hit.get('window')}  [{kp}]")
+
+def _add_backend_args(parser, model_flag="--embed-model"):
+    parser.add_argument(
+        "--embed-backend",
+        choices=EMBED_BACKENDS,
+        default=None,
+        help="Embedding backend (default: MITSCHREIBER_EMBED_BACKEND or sentence-transformers).",
+    )
+    parser.add_argument(
+        model_flag,
+        dest="model",
+        help="Model name, or model directory for onnx (default: MITSCHREIBER_EMBED_MODEL).",
+    )
+
+def _add_index_args(parser):
+    _add_backend_args(parser, "--model")
+    parser.add_argument(
+        "--no-update",
+        action="store_true",
+        help="Do not read new embed events from the WAL before running.",
+    )
+
 def main(argv=None):
     p = argparse.ArgumentParser("mitschreiber")
     sub = p.add_subparsers(dest="cmd", required=True)
 
     s_start = sub.add_parser("start")
+    s_start.add_argument(
+        "--foreground",
+        action="store_true",
+        help="Capture in this process even if a daemon is running (implied by --metrics-port).",
+    )
     s_start.add_argument("--embed", action="store_true")
     s_start.add_argument("--clipboard", action="store_true")
+    s_start.add_argument(
+        "--no-redact",
+        action="store_true",
+        help="Write titles and clipboard text unredacted (by default secrets and PII are replaced before the WAL).",
+    )
+    s_start.add_argument(
+        "--redact-terms",
+        type=_terms_file,
+        default=None,
+        metavar="FILE",
+        help="Also redact the words or names in FILE (one per line, case-insensitive).",
+    )
     s_start.add_argument(
         "--poll-interval",
         type=_positive_int,
         default=500,
         help="Polling interval in milliseconds (positive integer).",
     )
+    s_start.add_argument(
+        "--max-poll-interval",
+        type=_positive_int,
+        default=None,
+        help="Back off up to this many milliseconds while the user is idle (default: fixed --poll-interval).",
+    )
+    s_start.add_argument(
+        "--queue-capacity",
+        type=_positive_int,
+        default=10_000,
+        help="States buffered between sampler and writer.",
+    )
+    s_start.add_argument(
+        "--queue-overflow",
+        choices=("drop-oldest", "drop-newest", "coalesce"),
+        default="drop-oldest",
+        help="What a full queue loses: drop-oldest (keep fresh data), drop-newest, or coalesce repeated states.",
+    )
+    s_start.add_argument(
+        "--rollup",
+        type=_rollup_arg,
+        default="1m,15m,1h",
+        help="Dwell-time rollup windows written to the WAL, e.g. 1m,15m,1h ('off' disables).",
+    )
+    s_start.add_argument(
+        "--sampler",
+        choices=("auto", "poll", "stub"),
+        default="auto",
+        help="auto: X11 events (focus/title changes as they happen), poll: re-read X11 every interval, stub: synthetic.",
+    )
+    s_start.add_argument(
+        "--change-only",
+        action="store_true",
+        help="Emit states only when app/window/clipboard change (plus heartbeats).",
+    )
+    s_start.add_argument(
+        "--heartbeat",
+        type=int,
+        default=60_000,
+        help="Heartbeat interval in milliseconds for --change-only (0 disables heartbeats).",
+    )
+    s_start.add_argument(
+        "--durability",
+        choices=DURABILITY_MODES,
+        default="flush",
+        help="WAL durability: none (buffered), flush (to the OS per batch), fdatasync (periodic disk sync).",
+    )
+    s_start.add_argument(
+        "--sync-interval",
+        type=_positive_int,
+        default=1000,
+        help="Maximum milliseconds between fdatasync calls with --durability fdatasync.",
+    )
+    s_start.add_argument(
+        "--segment-size-mb",
+        type=_positive_float,
+        default=64,
+        help="Roll over to a new WAL segment after this many MiB.",
+    )
+    s_start.add_argument(
+        "--segment-minutes",
+        type=_positive_float,
+        default=60,
+        help="Roll over to a new WAL segment after this many minutes.",
+    )
+    s_start.add_argument(
+        "--compress",
+        choices=COMPRESSION_MODES,
+        default="gzip",
+        help="Compression for sealed WAL segments (zstd needs the 'zstd' extra).",
+    )
+    _add_retention_args(s_start)
+    s_start.add_argument(
+        "--wal-format",
+        choices=WAL_FORMATS,
+        default="jsonl",
+        help="WAL encoding: jsonl, or compact binary .mwal (convert back with 'mitschreiber convert').",
+    )
+    s_start.add_argument(
+        "--ship",
+        action="store_true",
+        help="Ship WAL records to CHRONIK_INGEST_URL in the background (token: CHRONIK_TOKEN).",
+    )
+    s_start.add_argument(
+        "--metrics-port",
+        type=_positive_int,
+        default=None,
+        help="Serve Prometheus metrics at http://127.0.0.1:PORT/metrics (off by default).",
+    )
+    _add_backend_args(s_start)
+    s_start.add_argument(
+        "--embed-threads",
+        type=_positive_int,
+        default=None,
+        help="CPU threads for the embedding model (onnx: intra-op threads; torch: per process, set by the first session).",
+    )
+    s_start.add_argument(
+        "--embed-inter-op-threads",
+        type=_positive_int,
+        default=None,
+        help="Threads running independent graph nodes in parallel (onnx, torch).",
+    )
+    s_start.add_argument(
+        "--embed-batch-size",
+        type=_positive_int,
+        default=16,
+        help="Maximum number of texts per embedding model call.",
+    )
+    s_start.add_argument(
+        "--embed-max-delay",
+        type=_positive_int,
+        default=250,
+        help="Maximum time in milliseconds a text waits for its embedding batch to fill.",
+    )
+    s_start.add_argument(
+        "--embed-cache-size",
+        type=int,
+        default=4096,
+        help="Number of embeddings kept in the in-memory LRU cache (0 disables the cache).",
+    )
+    s_start.add_argument(
+        "--embed-cache-persist",
+        action="store_true",
+        help="Persist cached embeddings under the data directory so restarts start warm.",
+    )
+    s_start.add_argument(
+        "--embed-encoding",
+        choices=("float32", "float16", "int8"),
+        default="float32",
+        help="Precision of emitted vectors; int8 stores its scale in meta.scale.",
+    )
+    s_start.add_argument(
+        "--embed-dim",
+        type=_positive_int,
+        default=None,
+        help="Truncate vectors to the first N dimensions and renormalize (8-4096).",
+    )
+    s_start.add_argument(
+        "--embed-dedup",
+        type=_similarity_arg,
+        default=0.9,
+        help="Skip texts at least this similar (SimHash, 0-1) to a recent text of the same app; 'off' embeds all.",
+    )
+    s_start.add_argument(
+        "--embed-dedup-memory",
+        type=_positive_int,
+        default=8,
+        help="Recent texts per app the dedup gate compares against.",
+    )
+    s_start.add_argument(
+        "--keyphrase-persist",
+        action="store_true",
+        help="Keep keyphrase document frequencies (hashed counters, no text) across sessions.",
+    )
     s_start.set_defaults(fn=cmd_start)
 
     s_status = sub.add_parser("status")
     s_status.set_defaults(fn=cmd_status)
 
     s_stop = sub.add_parser("stop")
+    s_stop.add_argument("--session", default=None, help="Daemon session id to stop (default: all).")
     s_stop.set_defaults(fn=cmd_stop)
 
+    s_daemon = sub.add_parser("daemon", help="Host sessions in one long-lived process, controlled over a Unix socket.")
+    s_daemon.set_defaults(fn=cmd_daemon)
+
+    s_prune = sub.add_parser("prune", help="Apply a WAL retention budget now (--retention-days also prunes the embedding cache).")
+    _add_retention_args(s_prune)
+    s_prune.set_defaults(fn=cmd_prune)
+
+    s_convert = sub.add_parser("convert", help="Convert WAL files (binary or compressed) to JSONL.")
+    s_convert.add_argument("files", nargs="+", help="WAL files (.mwal/.jsonl, optionally .gz/.zst).")
+    s_convert.add_argument("-o", "--output", help="Output file (default: stdout).")
+    s_convert.set_defaults(fn=cmd_convert)
+
+    s_export = sub.add_parser("export", help="Export the WAL to Parquet tables (needs the 'export' extra).")
+    s_export.add_argument("-o", "--output", help="Output directory (default: ~/.local/share/mitschreiber/export).")
+    s_export.add_argument("--jobs", type=_positive_int, help="Worker processes (default: one per CPU).")
+    s_export.add_argument("--batch-rows", type=_positive_int, default=8192, help="Rows per Parquet row group.")
+    s_export.add_argument("--force", action="store_true", help="Re-export files that are unchanged.")
+    s_export.set_defaults(fn=cmd_export)
+
+    s_query = sub.add_parser("query", help="Stream WAL records in a time range as JSONL.")
+    s_query.add_argument("--since", type=_when, help="Start (inclusive): HH:MM, YYYY-MM-DD or ISO datetime.")
+    s_query.add_argument("--until", type=_when, help="End (exclusive): HH:MM, YYYY-MM-DD or ISO datetime.")
+    s_query.add_argument("--app", help="Only records of this app.")
+    s_query.add_argument("--source", help="Only records of this source, e.g. os.context.state.")
+    s_query.add_argument("--session", help="Only records of this session id.")
+    s_query.set_defaults(fn=cmd_query)
+
+    s_report = sub.add_parser("report", help="Time per app or window, from the dwell-time rollups.")
+    s_report.add_argument("--since", type=_when, help="Start: HH:MM, YYYY-MM-DD or ISO datetime.")
+    s_report.add_argument("--until", type=_when, help="End: HH:MM, YYYY-MM-DD or ISO datetime.")
+    s_report.add_argument("--by", choices=("app", "window"), default="app")
+    s_report.add_argument(
+        "--resolution",
+        type=_window_arg,
+        help="Rollup window to sum, e.g. 15m (default: the coarsest one aligned with --since/--until).",
+    )
+    s_report.add_argument("--session", help="Only rollups of this session id.")
+    s_report.add_argument("--top", type=_positive_int, default=20, help="Rows to print.")
+    s_report.add_argument("--json", action="store_true", help="One JSON object per row.")
+    s_report.set_defaults(fn=cmd_report)
+
+    s_ship = sub.add_parser("ship", help="Ship WAL records not yet acknowledged by chronik.")
+    s_ship.add_argument("--follow", action="store_true", help="Keep tailing the WAL until Ctrl+C.")
+    s_ship.add_argument("--batch-size", type=_positive_int, default=500, help="Maximum records per POST.")
+    s_ship.add_argument(
+        "--max-delay",
+        type=_positive_int,
+        default=1000,
+        help="Maximum milliseconds a record waits for its batch to fill (with --follow).",
+    )
+    s_ship.set_defaults(fn=cmd_ship)
+
+    s_index = sub.add_parser("index", help="Update the local vector index from the WAL.")
+    _add_index_args(s_index)
+    s_index.add_argument("--ivf", action="store_true", help="(Re)build the IVF for approximate search.")
+    s_index.add_argument("--nlist", type=_positive_int, help="Number of IVF lists (default: sqrt(vectors)).")
+    s_index.set_defaults(fn=cmd_index)
+
+    s_search = sub.add_parser("search", help="Semantic search over embedded context (needs the 'search' extra).")
+    s_search.add_argument("text", help="Query text, embedded with the same model as the index.")
+    s_search.add_argument("-k", type=_positive_int, default=10, help="Number of results.")
+    s_search.add_argument(
+        "--nprobe",
+        type=_positive_int,
+        default=None,
+        help="Use the IVF and scan this many lists (default: exact search).",
+    )
+    s_search.add_argument("--json", action="store_true", help="Print results as JSONL.")
+    _add_index_args(s_search)
+    s_search.set_defaults(fn=cmd_search)
+
     args = p.parse_args(argv)
     return args.fn(args)
 
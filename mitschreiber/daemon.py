@@ -0,0 +1,347 @@
+"""
+Long-lived capture daemon with a Unix-socket control plane.
+
+`mitschreiber daemon` hosts any number of sessions in one process (the Rust
+sampler keeps one entry per session id), so the embedding model is loaded
+once and starting a session costs a thread, not a process. `start`, `stop`
+and `status` talk to it over SESS_DIR/control.sock (mode 0600) and fall back
+to the foreground mode when no daemon answers.
+
+Protocol: one JSON object per line in each direction.
+
+    {"op": "ping"}                          -> {"ok": true, "pid": ..., "uptime_s": ...}
+    {"op": "start", "options": {...}}       -> {"ok": true, "session_id": "..."}
+    {"op": "stop", "session_id": null}      -> {"ok": true, "stopped": [...]}   (null: all)
+    {"op": "status"}                        -> {"ok": true, "sessions": [...]}
+    {"op": "shutdown"}                      -> {"ok": true}
+
+Errors answer {"ok": false, "error": "..."}. Status reports per session the
+sampler counters (probes, emitted, drops, queue depth), events/s over the
+last RATE_WINDOW_S seconds, and the embed worker and sink statistics.
+
+A session that dies after it started (sampler error, disk full) logs its
+traceback to stderr and stays in status with "state": "failed" and the error
+until a stop for it acknowledges it.
+"""
+from __future__ import annotations
+import collections
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+import traceback
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from .paths import SESS_DIR
+
+CONTROL_SOCKET = SESS_DIR / "control.sock"
+
+RATE_WINDOW_S = 10.0
+START_TIMEOUT_S = 120.0
+STOP_TIMEOUT_S = 30.0
+
+# run_session keywords a client may set; everything else is the daemon's business.
+START_OPTIONS = frozenset(
+    {
+        "embed", "clipboard", "poll_ms", "max_poll_ms", "queue_capacity", "queue_overflow", "embed_batch", "embed_delay_ms", "embed_queue",
+        "embed_cache_size", "embed_cache_persist", "change_only", "heartbeat_ms", "durability",
+        "sync_interval_ms", "segment_bytes", "segment_age_s", "compression", "retention_days",
+        "retention_bytes", "wal_format", "ship", "sampler", "embed_backend", "embed_model",
+        "embed_threads", "embed_inter_op_threads", "keyphrase_persist", "embed_encoding", "embed_dim",
+        "embed_dedup", "embed_dedup_memory", "rollup_windows", "redact", "redact_terms",
+    }
+)
+
+
+class DaemonError(Exception):
+    pass
+
+
+class _Session:
+    def __init__(self, session_id: str, options: Dict[str, Any]):
+        self.session_id = session_id
+        self.options = options
+        self.started = time.time()
+        self.stop_event = threading.Event()
+        self.ready = threading.Event()
+        # Set by on_start: capture ran, so a later error is a failure, not a refused start.
+        self.capturing = False
+        self.handles: Dict[str, Any] = {}
+        self.error: Optional[BaseException] = None
+        self.thread: Optional[threading.Thread] = None
+        self.samples: Deque[Tuple[float, int]] = collections.deque()
+
+    @property
+    def alive(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    @property
+    def failed(self) -> bool:
+        # Started, then died: kept for status until a stop acknowledges it.
+        return self.error is not None and self.capturing and not self.alive
+
+
+def _sampler_stats(session_id: str) -> Optional[Dict[str, Any]]:
+    from ._mitschreiber import session_stats
+
+    stats = session_stats(session_id)
+    return dict(stats) if stats else None
+
+
+class Daemon:
+    def __init__(
+        self,
+        socket_path: Path = CONTROL_SOCKET,
+        runner: Optional[Callable[..., None]] = None,
+        defaults: Optional[Dict[str, Any]] = None,
+        stats: Callable[[str], Optional[Dict[str, Any]]] = _sampler_stats,
+    ):
+        self.socket_path = Path(socket_path)
+        self.runner = runner
+        self.defaults = dict(defaults or {})
+        self.stats_fn = stats
+        self.started = time.time()
+        self._sessions: Dict[str, _Session] = {}
+        self._lock = threading.Lock()
+        self._server: Optional[socketserver.UnixStreamServer] = None
+        self._ticker: Optional[threading.Thread] = None
+        self._closed = threading.Event()
+        self._close_lock = threading.Lock()
+
+    # -- lifecycle ----------------------------------------------------------
+
+    def bind(self) -> "Daemon":
+        """
+        Creates the socket; refuses to replace one a live daemon answers on.
+        """
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True, mode=0o700)
+        if self.socket_path.exists():
+            if request(self.socket_path, {"op": "ping"}, timeout=1.0) is not None:
+                raise DaemonError(f"a daemon is already listening on {self.socket_path}")
+            self.socket_path.unlink()  # left behind by a crashed daemon
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    if not line.strip():
+                        continue
+                    try:
+                        reply = daemon.handle(json.loads(line))
+                    except Exception as exc:  # one bad request must not take the daemon down
+                        reply = {"ok": False, "error": str(exc)}
+                    self.wfile.write(json.dumps(reply).encode("utf-8") + b"\n")
+                    self.wfile.flush()
+
+        old_umask = os.umask(0o177)
+        try:
+            self._server = socketserver.ThreadingUnixStreamServer(str(self.socket_path), Handler)
+        finally:
+            os.umask(old_umask)
+        self._server.daemon_threads = True
+        self._ticker = threading.Thread(target=self._tick, name="mitschreiber-daemon-rate", daemon=True)
+        self._ticker.start()
+        return self
+
+    def serve_forever(self):
+        if self._server is None:
+            self.bind()
+        try:
+            self._server.serve_forever(poll_interval=0.2)
+        finally:
+            self.close()
+
+    def start(self) -> "Daemon":
+        """
+        Serves from a background thread (tests, embedding).
+        """
+        if self._server is None:
+            self.bind()
+        threading.Thread(target=self.serve_forever, name="mitschreiber-daemon", daemon=True).start()
+        return self
+
+    def shutdown(self):
+        # Called from a handler thread: serve_forever() returns and close() runs there.
+        threading.Thread(target=self._server.shutdown, daemon=True).start()
+
+    def close(self):
+        # serve_forever() and __exit__ may both get here; the loser waits for the winner.
+        with self._close_lock:
+            if self._closed.is_set():
+                return
+            self._closed.set()
+            self.stop_sessions(None)
+            if self._server is not None:
+                self._server.server_close()
+            self.socket_path.unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._server is not None:
+            self._server.shutdown()
+        self.close()
+
+    # -- sessions -----------------------------------------------------------
+
+    def start_session(self, options: Dict[str, Any]) -> str:
+        unknown = set(options) - START_OPTIONS
+        if unknown:
+            raise ValueError(f"unknown session option(s): {', '.join(sorted(unknown))}")
+        runner = self.runner
+        if runner is None:
+            from .session import run_session as runner
+        sess = _Session(str(uuid.uuid4()), dict(self.defaults, **options))
+        kwargs = dict(sess.options)
+        kwargs.setdefault("embed", False)
+        kwargs.setdefault("clipboard", False)
+        kwargs.setdefault("poll_ms", 1000)
+
+        def on_start(handles):
+            sess.handles = handles
+            sess.capturing = True
+            sess.ready.set()
+
+        def run():
+            try:
+                runner(sess.session_id, stop_event=sess.stop_event, on_start=on_start, **kwargs)
+            except BaseException as exc:
+                sess.error = exc
+                if sess.capturing:
+                    print(f"mitschreiber daemon: session {sess.session_id} failed:", file=sys.stderr)
+                    traceback.print_exception(type(exc), exc, exc.__traceback__, file=sys.stderr)
+            finally:
+                sess.ready.set()
+                if sess.error is None or not sess.capturing:
+                    # Stopped normally, or failed to start: start_session reports that error.
+                    with self._lock:
+                        self._sessions.pop(sess.session_id, None)
+
+        with self._lock:
+            self._sessions[sess.session_id] = sess
+        sess.thread = threading.Thread(target=run, name=f"mitschreiber-session-{sess.session_id[:8]}", daemon=True)
+        sess.thread.start()
+        if not sess.ready.wait(START_TIMEOUT_S):
+            raise DaemonError("session did not start in time")
+        if sess.error is not None and not sess.capturing:
+            raise DaemonError(f"session failed to start: {sess.error}")
+        return sess.session_id
+
+    def stop_sessions(self, session_id: Optional[str]) -> List[str]:
+        with self._lock:
+            if session_id is None:
+                targets = list(self._sessions.values())
+            elif session_id in self._sessions:
+                targets = [self._sessions[session_id]]
+            else:
+                raise DaemonError(f"no such session: {session_id}")
+        for sess in targets:
+            sess.stop_event.set()
+        for sess in targets:
+            if sess.thread is not None:
+                sess.thread.join(STOP_TIMEOUT_S)
+        with self._lock:
+            for sess in targets:
+                if sess.failed:
+                    self._sessions.pop(sess.session_id, None)
+        return [sess.session_id for sess in targets]
+
+    def _tick(self):
+        while not self._closed.wait(1.0):
+            now = time.monotonic()
+            with self._lock:
+                sessions = list(self._sessions.values())
+            for sess in sessions:
+                stats = self.stats_fn(sess.session_id) if sess.ready.is_set() else None
+                if stats:
+                    sess.samples.append((now, int(stats.get("emitted", 0))))
+                while sess.samples and now - sess.samples[0][0] > RATE_WINDOW_S:
+                    sess.samples.popleft()
+
+    def _session_status(self, sess: _Session) -> Dict[str, Any]:
+        out: Dict[str, Any] = {
+            "session_id": sess.session_id,
+            "started": sess.started,
+            "uptime_s": round(time.time() - sess.started, 1),
+            "options": sess.options,
+            "state": "failed" if sess.failed else "running",
+        }
+        if sess.failed:
+            out["error"] = f"{type(sess.error).__name__}: {sess.error}"
+        sampler = self.stats_fn(sess.session_id)
+        if sampler:
+            out["sampler"] = sampler
+            samples = list(sess.samples)
+            if samples:
+                t0, e0 = samples[0]
+                dt = time.monotonic() - t0
+                out["events_per_s"] = round((int(sampler.get("emitted", 0)) - e0) / dt, 2) if dt > 0 else 0.0
+        worker = sess.handles.get("worker")
+        if worker is not None:
+            out["embed"] = worker.stats()
+            dedup = sess.handles.get("dedup")
+            if dedup is not None:
+                out["embed"]["dedup"] = dedup.stats()
+        redactor = sess.handles.get("redact")
+        if redactor is not None:
+            out["redact"] = redactor.stats()
+        sink = sess.handles.get("sink")
+        if sink is not None:
+            out["sink"] = sink.stats()
+        return out
+
+    # -- protocol -----------------------------------------------------------
+
+    def handle(self, req: Dict[str, Any]) -> Dict[str, Any]:
+        op = req.get("op")
+        try:
+            if op == "ping":
+                return {"ok": True, "pid": os.getpid(), "uptime_s": round(time.time() - self.started, 1)}
+            if op == "start":
+                return {"ok": True, "session_id": self.start_session(req.get("options") or {})}
+            if op == "stop":
+                return {"ok": True, "stopped": self.stop_sessions(req.get("session_id"))}
+            if op == "status":
+                with self._lock:
+                    sessions = [s for s in self._sessions.values() if s.ready.is_set()]
+                return {
+                    "ok": True,
+                    "pid": os.getpid(),
+                    "uptime_s": round(time.time() - self.started, 1),
+                    "sessions": [self._session_status(s) for s in sessions],
+                }
+            if op == "shutdown":
+                self.shutdown()
+                return {"ok": True}
+        except (DaemonError, ValueError) as exc:
+            return {"ok": False, "error": str(exc)}
+        return {"ok": False, "error": f"unknown op {op!r}"}
+
+
+def request(socket_path: Path, req: Dict[str, Any], timeout: float = 5.0) -> Optional[Dict[str, Any]]:
+    """
+    Sends one request; None when no daemon listens (no socket, refused, stale).
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        try:
+            sock.connect(str(socket_path))
+        except (FileNotFoundError, ConnectionRefusedError, socket.timeout):
+            return None
+        sock.sendall(json.dumps(req).encode("utf-8") + b"\n")
+        buf = b""
+        while not buf.endswith(b"\n"):
+            chunk = sock.recv(65536)
+            if not chunk:
+                raise DaemonError("daemon closed the connection")
+            buf += chunk
+        return json.loads(buf)
+    finally:
+        sock.close()
@@ -0,0 +1,127 @@
+"""
+Near-duplicate gate in front of the embedding model.
+
+Window titles change in trivial ways all day: a clock ticks, an unread count
+goes up, an editor adds a "●" dirty marker. Each variant has a new sha256, so
+the embedding cache misses and the model runs again for an event that says
+nothing new. The gate normalizes the text (case, clocks, bracketed counts,
+dirty markers, whitespace), fingerprints it with a 128-bit SimHash over
+character trigrams and compares it with the last `memory` admitted texts of
+the same app that contain the same numbers. At `threshold` similarity
+(1 - hamming distance / 128) or above, the text is skipped: no model call, no
+embed event. Any other number is kept and must match exactly: "Rechnung
+2024-03.pdf" and "Rechnung 2024-04.pdf" (or two ticket or PR numbers) are
+different documents however similar the rest of the title is.
+
+Memory is bounded: `memory` fingerprints per app (two ints each) for at most
+`max_apps` apps, least recently used app evicted first. Skipped texts are not
+remembered, so a title that drifts step by step is embedded again once it is
+far enough from the last admitted one. Not thread-safe: a gate belongs to one
+embed worker.
+"""
+from __future__ import annotations
+import hashlib
+import re
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Tuple
+
+DEFAULT_THRESHOLD = 0.9
+DEFAULT_MEMORY = 8
+
+_BITS = 128
+_CLOCK_RE = re.compile(r"\b\d{1,2}:\d{2}(?::\d{2})?(?:\s*[ap]\.?m\.?)?(?!\d)", re.IGNORECASE)
+_COUNT_RE = re.compile(r"[(\[]\d+\+?[)\]]")
+_MARKER_RE = re.compile(r"[●•◉⬤✱]|(?:^|\s)\*+|\*+(?:\s|$)")
+_DIGITS_RE = re.compile(r"\d+")
+_SPACE_RE = re.compile(r"\s+")
+
+# bytes.translate tables that map a byte to 1 if bit k is set, else 0; summing
+# the translated column counts that bit over all shingle hashes at C speed.
+_BIT_TABLES = [bytes((b >> k) & 1 for b in range(256)) for k in range(8)]
+
+
+def normalize(text: str) -> str:
+    """
+    Drops what changes without changing the context: clock times, unread
+    counts like "(3)" or "[12]", dirty markers, case and extra whitespace.
+    Other numbers stay (document, ticket, invoice numbers).
+    """
+    text = _CLOCK_RE.sub(" ", text)
+    text = _COUNT_RE.sub(" ", text)
+    text = _MARKER_RE.sub(" ", text)
+    return _SPACE_RE.sub(" ", text).strip().casefold()
+
+
+def simhash(text: str) -> int:
+    """
+    128-bit SimHash of the character trigrams of `text` (unweighted).
+    """
+    if len(text) < 3:
+        shingles = [text]
+    else:
+        shingles = [text[i : i + 3] for i in range(len(text) - 2)]
+    # A stable hash, not hash(): the same titles must give the same decisions in every run.
+    digests = b"".join(hashlib.blake2b(s.encode("utf-8"), digest_size=_BITS // 8).digest() for s in shingles)
+    half = len(shingles) / 2
+    fp = 0
+    width = _BITS // 8
+    for j in range(width):
+        column = digests[j::width]
+        for k in range(8):
+            if sum(column.translate(_BIT_TABLES[k])) > half:
+                fp |= 1 << (j * 8 + k)
+    return fp
+
+
+class NearDuplicateGate:
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, memory: int = DEFAULT_MEMORY, max_apps: int = 256):
+        if not 0.0 < threshold <= 1.0:
+            raise ValueError(f"threshold must be in (0, 1] (got {threshold})")
+        if memory <= 0:
+            raise ValueError(f"memory must be positive (got {memory})")
+        if max_apps <= 0:
+            raise ValueError(f"max_apps must be positive (got {max_apps})")
+        self.threshold = threshold
+        self.memory = memory
+        self.max_apps = max_apps
+        # Largest hamming distance that still counts as a near-duplicate.
+        self.max_distance = int((1.0 - threshold) * _BITS + 1e-9)
+        # Per app: (hash of the normalized text, hash of its numbers, SimHash).
+        self._recent: "OrderedDict[str, Deque[Tuple[int, int, int]]]" = OrderedDict()
+        self.checked = 0
+        self.skipped = 0
+
+    def admit(self, app: str, text: str) -> bool:
+        """
+        True if `text` should be embedded; False for a near-duplicate of a
+        recently admitted text of the same app.
+        """
+        if not text:
+            return True
+        self.checked += 1
+        recent = self._recent.get(app)
+        if recent is None:
+            recent = self._recent[app] = deque(maxlen=self.memory)
+            if len(self._recent) > self.max_apps:
+                self._recent.popitem(last=False)
+        else:
+            self._recent.move_to_end(app)
+        norm = normalize(text)
+        key = hash(norm)
+        # Exact repeats (after normalization) are the common case: no SimHash needed.
+        if any(seen == key for seen, _, _ in recent):
+            self.skipped += 1
+            return False
+        nums = hash(tuple(_DIGITS_RE.findall(norm)))
+        fp = simhash(norm)
+        if any(
+            seen_nums == nums and (fp ^ seen_fp).bit_count() <= self.max_distance
+            for _, seen_nums, seen_fp in recent
+        ):
+            self.skipped += 1
+            return False
+        recent.append((key, nums, fp))
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        return {"checked": self.checked, "skipped": self.skipped, "apps": len(self._recent)}
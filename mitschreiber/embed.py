@@ -1,40 +1,30 @@
 """
-Production embedding module using sentence-transformers for ML-based embeddings.
+Production embedding module: builds os.context.text.embed events.
 
-This module provides real semantic embeddings using transformer models.
-Requires the 'embed' extra dependency: pip install mitschreiber[embed]
+Vectors come from the session's backend (backends.py): sentence-transformers
+by default (pip install mitschreiber[embed]), or ONNX Runtime / hash. The
+backend is passed in by the caller, so sessions with different models can
+run side by side in one process.
 
 For zero-dependency demo/testing, see embedding.py instead.
-For the simple inline implementation, see session.py's _emit_embed().
 """
 from __future__ import annotations
 import hashlib
 import os
-import re
-from functools import lru_cache
-from typing import List, Tuple, Dict, Any
+from typing import List, Tuple, Dict, Any, Optional, Sequence
 from .util import now_iso
+from .embed_cache import EmbeddingCache
+from .keyphrases import KeyphraseEngine, tokenize
+from .quantize import Compaction
+from .backends import DEFAULT_ST_MODEL, MODEL_ENV, EmbeddingBackend
 
-# Soft-Dependency: sentence-transformers
-DEFAULT_MODEL = os.getenv("MITSCHREIBER_EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+# Model of the default sentence-transformers backend.
+DEFAULT_MODEL = os.getenv(MODEL_ENV, DEFAULT_ST_MODEL)
 
-WORD_RE = re.compile(r"[A-Za-zÀ-ÿ0-9_]+", re.UNICODE)
-STOPWORDS = {
-    "the","and","or","a","an","of","for","to","in","on",
-    "mit","und","oder","der","die","das","ein","eine","ist",
-}
-
-
-@lru_cache(maxsize=1)
-def _load_model():
-    from sentence_transformers import SentenceTransformer
-    return SentenceTransformer(DEFAULT_MODEL)
 
 def _keyphrases(text: str, top_k: int = 5) -> List[str]:
     counts = {}
-    for w in WORD_RE.findall(text.lower()):
-        if len(w) <= 3 or w in STOPWORDS:
-            continue
+    for w in tokenize(text, min_len=4):
         counts[w] = counts.get(w, 0) + 1
     items = sorted(counts.items(), key=lambda kv: (-kv[1], kv[0]))
     return [w for (w, _) in items[:top_k]]
@@ -42,20 +32,32 @@ def _keyphrases(text: str, top_k: int = 5) -> List[str]:
 def _sha256_hex(s: str) -> str:
     return hashlib.sha256(s.encode("utf-8")).hexdigest()
 
-def _embed(text: str) -> List[float]:
-    model = _load_model()
-    vec = model.encode(text, normalize_embeddings=True, convert_to_numpy=False)
-    return [float(x) for x in vec]
+def _embed(backend: EmbeddingBackend, text: str) -> List[float]:
+    return backend.embed([text])[0]
 
-def build_embed_event(text: str, session: str, app: str, window: str) -> Tuple[Dict[str, Any], str]:
+def _embed_batch(backend: EmbeddingBackend, texts: Sequence[str]) -> List[List[float]]:
     """
-    Baut ein os.context.text.embed-Event und liefert (event, text_hash).
+    Encodes all texts with a single backend call (one forward pass per batch).
     """
-    text_hash = _sha256_hex(text)
-    kp = _keyphrases(text, top_k=5)
-    embedding = _embed(text)
+    if not texts:
+        return []
+    return backend.embed(texts)
 
-    evt = {
+def _make_event(
+    text_hash: str,
+    kp: List[str],
+    embedding: List[float],
+    session: str,
+    app: str,
+    window: str,
+    model: str,
+    compaction: Optional[Compaction] = None,
+) -> Dict[str, Any]:
+    meta: Dict[str, Any] = {"model": model}
+    if compaction is not None and compaction.enabled:
+        embedding, extra = compaction.apply(embedding)
+        meta.update(extra)
+    return {
         "ts": now_iso(),
         "source": "os.context.text.embed",
         "session": session,
@@ -65,6 +67,70 @@ def build_embed_event(text: str, session: str, app: str, window: str) -> Tuple[D
         "embedding": embedding,
         "hash_id": f"sha256:{text_hash}",
         "privacy": {"raw_retained": False},
-        "meta": {"model": DEFAULT_MODEL},
+        "meta": meta,
     }
-    return evt, text_hash
+
+def build_embed_event(
+    text: str,
+    session: str,
+    app: str,
+    window: str,
+    backend: EmbeddingBackend,
+    cache: Optional[EmbeddingCache] = None,
+    keyphraser: Optional[KeyphraseEngine] = None,
+    compaction: Optional[Compaction] = None,
+) -> Tuple[Dict[str, Any], str]:
+    """
+    Baut ein os.context.text.embed-Event und liefert (event, text_hash).
+    """
+    text_hash = _sha256_hex(text)
+    kp = keyphraser.extract(text) if keyphraser is not None else _keyphrases(text, top_k=5)
+    model = backend.model_id
+    embedding = cache.get(model, text_hash) if cache is not None else None
+    if embedding is None:
+        embedding = _embed(backend, text)
+        if cache is not None:
+            cache.put(model, text_hash, embedding)
+    return _make_event(text_hash, kp, embedding, session, app, window, model, compaction), text_hash
+
+def build_embed_events(
+    items: Sequence[Tuple[str, str, str, str]],
+    backend: EmbeddingBackend,
+    cache: Optional[EmbeddingCache] = None,
+    keyphraser: Optional[KeyphraseEngine] = None,
+    compaction: Optional[Compaction] = None,
+) -> List[Tuple[Dict[str, Any], str]]:
+    """
+    Batch variant of build_embed_event: items are (text, session, app, window).
+    Cache hits skip the model; the remaining distinct texts are encoded in one call.
+    With a keyphraser, keyphrases are TF-IDF scored over the session (one pass per batch).
+    A compaction (quantize.py) shrinks the emitted vectors; the cache keeps full ones.
+    `backend.model_id` tags the events (meta.model) and keys the cache.
+    """
+    model = backend.model_id
+    hashes = [_sha256_hex(text) for (text, _, _, _) in items]
+    vectors: Dict[str, List[float]] = {}
+    pending: Dict[str, str] = {}
+    for (text, _, _, _), text_hash in zip(items, hashes):
+        if text_hash in vectors or text_hash in pending:
+            continue
+        cached = cache.get(model, text_hash) if cache is not None else None
+        if cached is not None:
+            vectors[text_hash] = cached
+        else:
+            pending[text_hash] = text
+
+    if pending:
+        fresh = list(zip(pending.keys(), _embed_batch(backend, list(pending.values()))))
+        vectors.update(fresh)
+        if cache is not None:
+            cache.put_many(model, fresh)
+
+    if keyphraser is not None:
+        kps = keyphraser.extract_many([text for (text, _, _, _) in items])
+    else:
+        kps = [_keyphrases(text, top_k=5) for (text, _, _, _) in items]
+    out = []
+    for (text, session, app, window), text_hash, kp in zip(items, hashes, kps):
+        out.append((_make_event(text_hash, kp, vectors[text_hash], session, app, window, model, compaction), text_hash))
+    return out
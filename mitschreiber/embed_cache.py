@@ -0,0 +1,185 @@
+"""
+Content-addressed embedding cache.
+
+Window titles and app names repeat all day; the cache maps (model, sha256(text))
+to the embedding so repeated texts skip the model call. An in-memory LRU bounds
+RAM use; an optional SQLite store under DATA_HOME keeps entries across restarts.
+
+The store holds float32 vectors and when each was last used. It is bounded
+too: beyond `max_disk_entries` rows the least recently used are deleted, and
+prune() drops entries unused for longer than the WAL retention (run_session
+and `mitschreiber prune` call it), so no vector outlives its events for long.
+"""
+from __future__ import annotations
+import sqlite3
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .paths import CACHE_DIR
+
+DEFAULT_CACHE_PATH = CACHE_DIR / "embeddings.sqlite3"
+# About 75 MB of 384-d float32 vectors.
+DEFAULT_MAX_DISK_ENTRIES = 50_000
+
+# Bumped when the table changes; an older store is dropped (it is only a cache).
+_SCHEMA_VERSION = 2
+# Vectors are little-endian float32 on disk; array('f') is native-endian.
+_SWAP = sys.byteorder != "little"
+
+_Key = Tuple[str, str]
+
+
+def _pack(vec: List[float]) -> bytes:
+    blob = array("f", vec)
+    if _SWAP:
+        blob.byteswap()
+    return blob.tobytes()
+
+
+def _unpack(data: bytes) -> List[float]:
+    blob = array("f")
+    blob.frombytes(data)
+    if _SWAP:
+        blob.byteswap()
+    return blob.tolist()
+
+
+class EmbeddingCache:
+    def __init__(
+        self,
+        max_entries: int = 4096,
+        path: Optional[Path] = None,
+        max_disk_entries: int = DEFAULT_MAX_DISK_ENTRIES,
+    ):
+        if max_entries <= 0:
+            raise ValueError(f"max_entries must be positive (got {max_entries})")
+        if max_disk_entries <= 0:
+            raise ValueError(f"max_disk_entries must be positive (got {max_disk_entries})")
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.path = path
+        self._mem: "OrderedDict[_Key, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Used from the embedding worker thread; access is serialized by self._lock.
+            self._db = sqlite3.connect(str(path), check_same_thread=False)
+            if self._db.execute("PRAGMA user_version").fetchone()[0] != _SCHEMA_VERSION:
+                # Older stores kept float64 vectors and no use time.
+                self._db.execute("DROP TABLE IF EXISTS embeddings")
+                self._db.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " model TEXT NOT NULL, hash TEXT NOT NULL, vec BLOB NOT NULL,"
+                " last_used INTEGER NOT NULL, PRIMARY KEY (model, hash))"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+            self._db.commit()
+            self._rows = self._count()
+
+    def get(self, model: str, text_hash: str) -> Optional[List[float]]:
+        key = (model, text_hash)
+        with self._lock:
+            vec = self._mem.get(key)
+            if vec is not None:
+                self._mem.move_to_end(key)
+                self.hits += 1
+                return vec
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT vec FROM embeddings WHERE model = ? AND hash = ?", key
+                ).fetchone()
+                if row is not None:
+                    vec = _unpack(row[0])
+                    self._db.execute(
+                        "UPDATE embeddings SET last_used = ? WHERE model = ? AND hash = ?",
+                        (int(time.time()), *key),
+                    )
+                    self._db.commit()
+                    self._remember(key, vec)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return vec
+            self.misses += 1
+            return None
+
+    def put(self, model: str, text_hash: str, vec: List[float]):
+        self.put_many(model, [(text_hash, vec)])
+
+    def put_many(self, model: str, entries: List[Tuple[str, List[float]]]):
+        """
+        Stores a batch of (text_hash, vec) pairs with a single disk commit.
+        """
+        with self._lock:
+            for text_hash, vec in entries:
+                self._remember((model, text_hash), vec)
+            if self._db is not None and entries:
+                now = int(time.time())
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model, hash, vec, last_used) VALUES (?, ?, ?, ?)",
+                    [(model, text_hash, _pack(vec), now) for (text_hash, vec) in entries],
+                )
+                # An upper bound: replaced rows are counted again until the next recount.
+                self._rows += len(entries)
+                if self._rows > self.max_disk_entries:
+                    self._evict()
+                self._db.commit()
+
+    def _count(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _evict(self):
+        self._rows = self._count()
+        excess = self._rows - self.max_disk_entries
+        if excess > 0:
+            # Some slack, so a full store is not trimmed on every batch.
+            excess += self.max_disk_entries // 10
+            self._db.execute(
+                "DELETE FROM embeddings WHERE rowid IN"
+                " (SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                (excess,),
+            )
+            self._rows = self._count()
+
+    def prune(self, max_age_days: float) -> int:
+        """
+        Deletes stored entries not used for `max_age_days`; returns how many.
+        """
+        with self._lock:
+            if self._db is None:
+                return 0
+            cutoff = int(time.time() - max_age_days * 86400)
+            removed = self._db.execute("DELETE FROM embeddings WHERE last_used < ?", (cutoff,)).rowcount
+            self._db.commit()
+            self._rows = self._count()
+            return removed
+
+    def _remember(self, key: _Key, vec: List[float]):
+        self._mem[key] = vec
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "entries": len(self._mem),
+            }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
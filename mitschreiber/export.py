@@ -0,0 +1,339 @@
+"""
+Bulk export of WAL files to Parquet (needs pyarrow: pip install mitschreiber[export]).
+
+Each WAL file is converted by one worker of a process pool, streaming
+records into row groups of `batch_rows`, so memory stays bounded whatever
+the file size. Output, one file per WAL file and table:
+
+    <out>/state/<segment>.parquet          ts, session, app, window, clipboard, dwell_ms
+    <out>/embed/dim=<n>/<segment>.parquet  ts, session, app, window, hash_id, model,
+                                           keyphrases, embedding (fixed_size_list<float32>[n])
+    <out>/rollup/<segment>.parquet         ts, session, window_s, start, end, total_s, apps, windows
+
+Embeddings are dequantized (int8/float16 events) to float32. The layout
+reads as one dataset per table, e.g. pyarrow.dataset.dataset(out / "state").
+
+Exports are incremental: <out>/manifest.json records size and mtime of each
+exported WAL file, and unchanged files are skipped on the next run.
+"""
+from __future__ import annotations
+import array
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from .paths import EXPORT_DIR
+from .quantize import dequantize
+from .retention import wal_segments
+from .util import parse_ts
+from .walio import iter_records, segment_key
+
+MANIFEST = "manifest.json"
+BATCH_ROWS = 8192
+
+_TABLE_OF = {
+    "os.context.state": "state",
+    "os.context.text.embed": "embed",
+    "os.context.rollup": "rollup",
+}
+
+
+def _ts_us(value: Any) -> Optional[int]:
+    if not value:
+        return None
+    try:
+        return int(round(parse_ts(value) * 1_000_000))
+    except (TypeError, ValueError):
+        return None
+
+
+def _schemas(pa) -> Dict[str, Any]:
+    ts = pa.timestamp("us", tz="UTC")
+    return {
+        "state": pa.schema(
+            [
+                ("ts", ts),
+                ("session", pa.string()),
+                ("app", pa.string()),
+                ("window", pa.string()),
+                ("clipboard", pa.string()),
+                ("dwell_ms", pa.int64()),
+            ]
+        ),
+        "embed": pa.schema(
+            [
+                ("ts", ts),
+                ("session", pa.string()),
+                ("app", pa.string()),
+                ("window", pa.string()),
+                ("hash_id", pa.string()),
+                ("model", pa.string()),
+                ("keyphrases", pa.list_(pa.string())),
+            ]
+        ),
+        "rollup": pa.schema(
+            [
+                ("ts", ts),
+                ("session", pa.string()),
+                ("window_s", pa.int32()),
+                ("start", ts),
+                ("end", ts),
+                ("total_s", pa.float64()),
+                ("apps", pa.list_(pa.struct([("app", pa.string()), ("seconds", pa.float64())]))),
+                (
+                    "windows",
+                    pa.list_(
+                        pa.struct([("app", pa.string()), ("window", pa.string()), ("seconds", pa.float64())])
+                    ),
+                ),
+            ]
+        ),
+    }
+
+
+def _row(table: str, rec: Dict[str, Any]) -> Dict[str, Any]:
+    row = {"ts": _ts_us(rec.get("ts")), "session": rec.get("session")}
+    if table == "state":
+        row.update(
+            app=rec.get("app"), window=rec.get("window"), clipboard=rec.get("clipboard"), dwell_ms=rec.get("dwell_ms")
+        )
+    elif table == "embed":
+        meta = rec.get("meta") or {}
+        row.update(
+            app=rec.get("app"),
+            window=rec.get("window"),
+            hash_id=rec.get("hash_id"),
+            model=meta.get("model"),
+            keyphrases=rec.get("keyphrases"),
+        )
+    else:
+        row.update(
+            window_s=rec.get("window_s"),
+            start=_ts_us(rec.get("start")),
+            end=_ts_us(rec.get("end")),
+            total_s=rec.get("total_s"),
+            apps=rec.get("apps"),
+            windows=rec.get("windows"),
+        )
+    return row
+
+
+class _TableWriter:
+    """
+    Buffers up to batch_rows rows of one output file and writes them as a row
+    group; the file appears under its final name only once it is complete.
+    """
+
+    def __init__(self, pa, pq, path: Path, schema, batch_rows: int, dim: Optional[int] = None):
+        self.pa, self.pq = pa, pq
+        self.path = path
+        self.dim = dim
+        if dim is not None:
+            schema = schema.append(pa.field("embedding", pa.list_(pa.float32(), dim)))
+        self.schema = schema
+        self.batch_rows = batch_rows
+        self.columns: Dict[str, list] = {name: [] for name in schema.names if name != "embedding"}
+        self.vectors = array.array("f")
+        self.rows = 0
+        self._buffered = 0
+        self._writer = None
+        self._tmp = path.with_name(path.name + ".tmp")
+
+    def add(self, row: Dict[str, Any], vector: Optional[List[float]] = None):
+        for name, values in self.columns.items():
+            values.append(row.get(name))
+        if self.dim is not None:
+            self.vectors.extend(vector)
+        self._buffered += 1
+        if self._buffered >= self.batch_rows:
+            self._flush()
+
+    def _flush(self):
+        if not self._buffered:
+            return
+        pa = self.pa
+        arrays = [pa.array(self.columns[f.name], type=f.type) for f in self.schema if f.name != "embedding"]
+        if self.dim is not None:
+            # Raw float32 buffer straight into Arrow: no per-element conversion.
+            values = pa.Array.from_buffers(pa.float32(), len(self.vectors), [None, pa.py_buffer(self.vectors)])
+            arrays.append(pa.FixedSizeListArray.from_arrays(values, self.dim))
+        batch = pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+        if self._writer is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._writer = self.pq.ParquetWriter(str(self._tmp), self.schema, compression="zstd")
+        self._writer.write_batch(batch)
+        self.rows += self._buffered
+        self._buffered = 0
+        for values in self.columns.values():
+            values.clear()
+        self.vectors = array.array("f")
+
+    def close(self):
+        self._flush()
+        if self._writer is not None:
+            self._writer.close()
+            os.replace(self._tmp, self.path)
+
+    def abort(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._tmp.unlink(missing_ok=True)
+
+
+def _stem(path: Path) -> str:
+    key = segment_key(path)
+    for suffix in (".jsonl", ".mwal"):
+        if key.endswith(suffix):
+            return key[: -len(suffix)]
+    return key
+
+
+def export_segment(path: str, out_dir: str, batch_rows: int = BATCH_ROWS) -> Dict[str, Any]:
+    """
+    Converts one WAL file; runs in a pool worker. Returns its manifest entry.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    src, out = Path(path), Path(out_dir)
+    stat = src.stat()
+    stem = _stem(src)
+    schemas = _schemas(pa)
+    writers: Dict[Any, _TableWriter] = {}
+    skipped = 0
+    try:
+        for rec in iter_records(src):
+            table = _TABLE_OF.get(rec.get("source"))
+            if table is None:
+                skipped += 1
+                continue
+            vector = None
+            key: Any = table
+            if table == "embed":
+                vector = dequantize(rec.get("embedding") or [], rec.get("meta"))
+                if not vector:
+                    skipped += 1
+                    continue
+                key = ("embed", len(vector))
+            writer = writers.get(key)
+            if writer is None:
+                if table == "embed":
+                    target = out / "embed" / f"dim={len(vector)}" / f"{stem}.parquet"
+                    writer = _TableWriter(pa, pq, target, schemas["embed"], batch_rows, dim=len(vector))
+                else:
+                    target = out / table / f"{stem}.parquet"
+                    writer = _TableWriter(pa, pq, target, schemas[table], batch_rows)
+                writers[key] = writer
+            writer.add(_row(table, rec), vector)
+        for writer in writers.values():
+            writer.close()
+    except BaseException:
+        for writer in writers.values():
+            writer.abort()
+        raise
+
+    rows: Dict[str, int] = {}
+    for key, writer in writers.items():
+        table = key if isinstance(key, str) else key[0]
+        rows[table] = rows.get(table, 0) + writer.rows
+    return {
+        "key": segment_key(src),
+        "name": src.name,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "outputs": sorted(str(w.path.relative_to(out)) for w in writers.values() if w.rows),
+        "rows": rows,
+        "skipped": skipped,
+    }
+
+
+def load_manifest(out_dir: Path) -> Dict[str, Dict[str, Any]]:
+    try:
+        return json.loads((out_dir / MANIFEST).read_text(encoding="utf-8")).get("segments", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(out_dir: Path, segments: Dict[str, Dict[str, Any]]):
+    tmp = out_dir / (MANIFEST + ".tmp")
+    tmp.write_text(json.dumps({"version": 1, "segments": segments}, indent=1, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, out_dir / MANIFEST)
+
+
+def pending(files: Iterable[Path], manifest: Dict[str, Dict[str, Any]], out_dir: Path) -> List[Path]:
+    """
+    WAL files that are new or changed since their last export.
+    """
+    todo = []
+    for path in files:
+        entry = manifest.get(segment_key(path))
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue  # removed by retention meanwhile
+        unchanged = (
+            entry is not None
+            and entry.get("name") == path.name
+            and entry.get("size") == stat.st_size
+            and entry.get("mtime_ns") == stat.st_mtime_ns
+            and all((out_dir / o).exists() for o in entry.get("outputs", ()))
+        )
+        if not unchanged:
+            todo.append(path)
+    return todo
+
+
+def export_wal(
+    wal_dir: Path,
+    out_dir: Path = EXPORT_DIR,
+    jobs: Optional[int] = None,
+    batch_rows: int = BATCH_ROWS,
+    files: Optional[Iterable[Path]] = None,
+    force: bool = False,
+) -> Dict[str, Any]:
+    """
+    Exports every new or changed WAL file; returns a summary
+    (`exported`, `unchanged`, `rows` per table, `failed` file names).
+    """
+    import pyarrow  # noqa: F401 -- fail before forking workers when it is missing
+
+    if batch_rows <= 0:
+        raise ValueError(f"batch_rows must be positive (got {batch_rows})")
+    out_dir.mkdir(parents=True, exist_ok=True)
+    files = list(files if files is not None else wal_segments(wal_dir))
+    manifest = load_manifest(out_dir)
+    todo = [p for p in files if p.exists()] if force else pending(files, manifest, out_dir)
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(todo) or 1))
+
+    summary: Dict[str, Any] = {"exported": 0, "unchanged": len(files) - len(todo), "rows": {}, "failed": []}
+
+    def record(entry: Dict[str, Any]):
+        old = manifest.get(entry["key"], {})
+        for stale in set(old.get("outputs", ())) - set(entry["outputs"]):
+            (out_dir / stale).unlink(missing_ok=True)
+        manifest[entry["key"]] = {k: v for k, v in entry.items() if k != "key"}
+        summary["exported"] += 1
+        for table, n in entry["rows"].items():
+            summary["rows"][table] = summary["rows"].get(table, 0) + n
+
+    try:
+        if jobs == 1:
+            for path in todo:
+                try:
+                    record(export_segment(str(path), str(out_dir), batch_rows))
+                except (OSError, ValueError) as exc:
+                    summary["failed"].append(f"{path.name}: {exc}")
+        else:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                futures = {pool.submit(export_segment, str(p), str(out_dir), batch_rows): p for p in todo}
+                for future, path in futures.items():
+                    try:
+                        record(future.result())
+                    except (OSError, ValueError) as exc:
+                        summary["failed"].append(f"{path.name}: {exc}")
+    finally:
+        # Also after Ctrl+C: files finished so far are not converted again.
+        _save_manifest(out_dir, manifest)
+    return summary
@@ -0,0 +1,229 @@
+"""
+Streaming TF-IDF keyphrases.
+
+Every embedded text is a document. Document frequencies are kept in
+count-min sketches (fixed-size uint32 tables, conservative update), one for
+the running session and one accumulated across sessions, so memory stays
+bounded however large the vocabulary grows. A term's weight is its count in
+the text times the mean of its session and global IDF: words that appear in
+every title ("code", the app name) sink, words specific to the current
+context rise.
+
+Batches are scored in one pass: repeated texts are tokenized once, each
+distinct term is hashed and looked up once per batch, and the sketches are
+updated before scoring so a batch sees its own terms.
+
+The global sketch can be persisted (`path`); it holds hashed counters only,
+never terms. Not thread-safe: an engine belongs to one embed worker.
+"""
+from __future__ import annotations
+import hashlib
+import math
+import os
+import re
+import struct
+from array import array
+from collections import Counter
+from itertools import chain
+from operator import itemgetter
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .paths import CACHE_DIR
+
+DEFAULT_KEYPHRASE_PATH = CACHE_DIR / "keyphrases.cms"
+
+_MAGIC = b"MSKP1\n"
+_HEADER = struct.Struct("<6sIIQ")  # magic, width, depth, documents
+
+# Shared with the plain keyphrases of embed.py: one tokenizer, one stopword list.
+STOPWORDS = frozenset(
+    "the and or a an of for to in on with from by at is are be this that new untitled "
+    "mit und oder der die das ein eine ist von zu im in am auf für den dem des neu".split()
+)
+
+WORD_RE = re.compile(r"[A-Za-zÀ-ÿ0-9_]+", re.UNICODE)
+
+
+def tokenize(text: str, min_len: int = 3) -> List[str]:
+    """
+    Lower-cased words of at least `min_len` characters, without stopwords and bare numbers.
+    """
+    return [
+        w for w in WORD_RE.findall(text.lower())
+        if len(w) >= min_len and w not in STOPWORDS and not w.isdigit()
+    ]
+
+
+class CountMinSketch:
+    """
+    Approximate counts in a width x depth uint32 table; estimates never undercount.
+    """
+
+    def __init__(self, width: int = 1 << 14, depth: int = 4):
+        if width <= 0 or width & (width - 1):
+            raise ValueError(f"width must be a power of two (got {width})")
+        if not 1 <= depth <= 8:
+            raise ValueError(f"depth must be between 1 and 8 (got {depth})")
+        self.width = width
+        self.depth = depth
+        self.documents = 0
+        self.table = array("I", bytes(4 * width * depth))
+
+    def slots(self, term: str) -> Tuple[int, ...]:
+        # Stable across processes (persisted tables); double hashing derives the rows.
+        digest = hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest()
+        h1, h2 = struct.unpack("<II", digest)
+        h2 |= 1
+        mask = self.width - 1
+        return tuple(row * self.width + ((h1 + row * h2) & mask) for row in range(self.depth))
+
+    def estimate(self, slots: Sequence[int]) -> int:
+        return min(map(self.table.__getitem__, slots))
+
+    def add(self, slots: Sequence[int], count: int = 1) -> int:
+        """
+        Adds `count` and returns the new estimate.
+        """
+        # Conservative update: only raise the counters below the new minimum.
+        table = self.table
+        target = min(min(map(table.__getitem__, slots)) + count, 0xFFFFFFFF)
+        for i in slots:
+            if table[i] < target:
+                table[i] = target
+        return target
+
+    def halve(self):
+        """
+        Ages all counts; keeps IDFs tracking recent use and counters far from overflow.
+        """
+        self.table = array("I", (c >> 1 for c in self.table))
+        self.documents >>= 1
+
+    def to_bytes(self) -> bytes:
+        return _HEADER.pack(_MAGIC, self.width, self.depth, self.documents) + self.table.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "CountMinSketch":
+        magic, width, depth, documents = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            raise ValueError("not a keyphrase sketch")
+        sketch = cls(width, depth)
+        table = array("I")
+        table.frombytes(data[_HEADER.size:])
+        if len(table) != width * depth:
+            raise ValueError("truncated keyphrase sketch")
+        sketch.table = table
+        sketch.documents = documents
+        return sketch
+
+
+class KeyphraseEngine:
+    def __init__(
+        self,
+        top_k: int = 5,
+        path: Optional[Path] = None,
+        width: int = 1 << 14,
+        depth: int = 4,
+        min_len: int = 3,
+        max_documents: int = 1 << 22,
+    ):
+        if top_k <= 0:
+            raise ValueError(f"top_k must be positive (got {top_k})")
+        self.top_k = top_k
+        self.path = path
+        self.min_len = min_len
+        self.max_documents = max_documents
+        self.session = CountMinSketch(width, depth)
+        self.global_ = self._load(path, width, depth)
+        self._slots: Dict[str, Tuple[Tuple[int, ...], Callable]] = {}
+        self._tokenized: Dict[str, List[str]] = {}
+
+    @staticmethod
+    def _load(path: Optional[Path], width: int, depth: int) -> CountMinSketch:
+        if path is not None and path.exists():
+            try:
+                sketch = CountMinSketch.from_bytes(path.read_bytes())
+                if (sketch.width, sketch.depth) == (width, depth):
+                    return sketch
+            except (ValueError, struct.error):
+                pass  # Corrupt or resized: start over, it is only a statistic.
+        return CountMinSketch(width, depth)
+
+    def save(self):
+        """
+        Persists the global sketch atomically (no-op without a path).
+        """
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_bytes(self.global_.to_bytes())
+        os.replace(tmp, self.path)
+
+    def _terms(self, text: str) -> List[str]:
+        terms = self._tokenized.get(text)
+        if terms is None:
+            terms = tokenize(text, self.min_len)
+            if len(self._tokenized) >= 4096:
+                self._tokenized.clear()
+            self._tokenized[text] = terms
+        return terms
+
+    def _slot(self, term: str) -> Tuple[Tuple[int, ...], Callable]:
+        # The slots, and an itemgetter that reads them from a table in one C call.
+        entry = self._slots.get(term)
+        if entry is None:
+            slots = self.session.slots(term)
+            entry = (slots, itemgetter(*slots) if len(slots) > 1 else lambda table: (table[slots[0]],))
+            if len(self._slots) >= 65536:
+                self._slots.clear()
+            self._slots[term] = entry
+        return entry
+
+    def extract(self, text: str) -> List[str]:
+        return self.extract_many([text])[0]
+
+    def extract_many(self, texts: Iterable[str]) -> List[List[str]]:
+        """
+        Counts each text as a document, then returns its top_k terms by TF-IDF.
+        """
+        session, global_ = self.session, self.global_
+        if global_.documents > self.max_documents:
+            global_.halve()
+        if session.documents > self.max_documents:
+            session.halve()
+
+        docs = [self._terms(text) for text in texts]
+        # Batch document frequencies first: one sketch update per distinct term, not per document.
+        batch_df = Counter(chain.from_iterable(map(set, docs)))
+        n_s = session.documents = session.documents + len(docs)
+        n_g = global_.documents = global_.documents + len(docs)
+        log = math.log
+        ts, tg = session.table, global_.table
+        idf: Dict[str, float] = {}
+        for term, count in batch_df.items():
+            slots, get = self._slot(term)
+            # Both sketches share the slot layout: one conservative update each, inline.
+            vs, vg = get(ts), get(tg)
+            df_s = min(min(vs) + count, 0xFFFFFFFF)
+            df_g = min(min(vg) + count, 0xFFFFFFFF)
+            for i, s, g in zip(slots, vs, vg):
+                if s < df_s:
+                    ts[i] = df_s
+                if g < df_g:
+                    tg[i] = df_g
+            idf[term] = 0.5 * (log((n_s + 1) / (df_s + 1)) + log((n_g + 1) / (df_g + 1))) + 1.0
+        top_k = self.top_k
+        by_idf = idf.__getitem__
+        out = []
+        for terms in docs:
+            # Dicts keep first-occurrence order and sorting is stable: ties rank by position.
+            unique = dict.fromkeys(terms)
+            if len(unique) == len(terms):
+                # The common case, every term once: the weight is its IDF.
+                out.append(sorted(unique, key=by_idf, reverse=True)[:top_k])
+            else:
+                tf = Counter(terms)
+                out.append(sorted(unique, key=lambda t: tf[t] * idf[t], reverse=True)[:top_k])
+        return out
@@ -0,0 +1,295 @@
+"""
+In-process metrics and an opt-in Prometheus endpoint.
+
+Instruments are cheap enough to stay always on (a lock and a few additions
+per observation, once per batch on the hot paths); nothing is exposed unless
+a MetricsServer is started (`mitschreiber start --metrics-port N`), which
+binds to 127.0.0.1 only and serves GET /metrics in the Prometheus text
+format 0.0.4.
+
+Values owned by other components (sampler counters in Rust, cache and queue
+statistics) are read at scrape time through collectors instead of being
+mirrored on every change.
+"""
+from __future__ import annotations
+import bisect
+import math
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; tuned for sub-millisecond WAL writes up to multi-second model calls.
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096)
+
+Labels = Tuple[str, ...]
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items()) + "}"
+
+
+class MetricFamily:
+    """
+    One metric with its samples, as produced by collectors at scrape time.
+    """
+
+    def __init__(self, name: str, kind: str, help: str, samples: Optional[List[Sample]] = None):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.samples: List[Sample] = samples or []
+
+    def add(self, value: float, **labels: str):
+        self.samples.append((self.name, labels, value))
+        return self
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {_escape(self.help)}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self.samples:
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Labels, object] = {}
+
+    def labels(self, *values: str, **kw: str):
+        if kw:
+            values = tuple(kw[name] for name in self.labelnames)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        key = tuple(str(v) for v in values)
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = self._new_child()
+            return child
+
+    def _default(self):
+        if self.labelnames:
+            raise ValueError(f"{self.name} has labels {self.labelnames}; use .labels()")
+        return self.labels()
+
+    def remove(self, *values: str):
+        with self._lock:
+            self._children.pop(tuple(str(v) for v in values), None)
+
+    def collect(self) -> MetricFamily:
+        family = MetricFamily(self.name, self.kind, self.help)
+        with self._lock:
+            children = list(self._children.items())
+        for key, child in children:
+            family.samples.extend(child._samples(self.name, dict(zip(self.labelnames, key))))
+        return family
+
+
+class _Value:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def set(self, value: float):
+        with self._lock:
+            self.value = value
+
+    def _samples(self, name, labels):
+        return [(name, labels, self.value)]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        if amount < 0:
+            raise ValueError("counters can only increase")
+        self._default().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value: float):
+        self._default().set(value)
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+
+class _HistogramValue:
+    def __init__(self, buckets: Sequence[float]):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def _samples(self, name, labels):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        out, cumulative = [], 0
+        for bound, count in zip(list(self.buckets) + [math.inf], counts):
+            cumulative += count
+            out.append((f"{name}_bucket", dict(labels, le=_format_value(bound)), cumulative))
+        out.append((f"{name}_sum", labels, total))
+        out.append((f"{name}_count", labels, cumulative))
+        return out
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+
+Collector = Callable[[], Iterable[MetricFamily]]
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Collector] = []
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"metric {metric.name} already registered differently")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labelnames))
+
+    def histogram(
+        self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def add_collector(self, collector: Collector):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def remove_collector(self, collector: Collector):
+        with self._lock:
+            if collector in self._collectors:
+                self._collectors.remove(collector)
+
+    def collect(self) -> List[MetricFamily]:
+        with self._lock:
+            metrics, collectors = list(self._metrics.values()), list(self._collectors)
+        families = [m.collect() for m in metrics]
+        merged: Dict[str, MetricFamily] = {}
+        for collector in collectors:
+            for family in collector():
+                # Several sessions may report the same family; merge their samples.
+                if family.name in merged:
+                    merged[family.name].samples.extend(family.samples)
+                else:
+                    merged[family.name] = family
+        return families + list(merged.values())
+
+    def render(self) -> str:
+        return "".join(f.render() for f in self.collect())
+
+
+REGISTRY = Registry()
+
+
+class MetricsServer:
+    """
+    Serves REGISTRY (or the given registry) at GET /metrics from a daemon thread.
+    """
+
+    def __init__(self, port: int, registry: Registry = REGISTRY, host: str = "127.0.0.1"):
+        # Imported here: wal.py pulls in this module, and the CLI's hotkey commands import wal.py.
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        reg = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = reg.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_port
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="mitschreiber-metrics", daemon=True)
+        self.thread.start()
+        return self
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
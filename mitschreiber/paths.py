@@ -4,6 +4,10 @@ from pathlib import Path
 DATA_HOME = Path.home() / ".local" / "share" / "mitschreiber"
 WAL_DIR = DATA_HOME / "wal"
 SESS_DIR = DATA_HOME / "sessions"
+CACHE_DIR = DATA_HOME / "cache"
+INDEX_DIR = DATA_HOME / "index"
+SINK_DIR = DATA_HOME / "sink"
+EXPORT_DIR = DATA_HOME / "export"
 
 def init_directories():
     DATA_HOME.mkdir(parents=True, exist_ok=True)
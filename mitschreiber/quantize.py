@@ -0,0 +1,99 @@
+"""
+Compact encodings for embed vectors.
+
+    float32  full precision (default)
+    float16  values rounded to half precision, printed as the shortest decimal
+             that maps back to the same half (about 5 significant digits)
+    int8     symmetric quantization: integers in [-127, 127], meta.scale holds
+             the factor that restores the floats (x ≈ q * scale)
+
+Truncation keeps the first `dim` components and renormalizes them
+(Matryoshka-style; meaningful for models trained that way, and at least
+consistent for all others). The contract requires 8–4096 numbers.
+
+Encodings are applied when the event is built; the embedding cache keeps
+full vectors, so changing the encoding never invalidates it. Consumers read
+vectors back through dequantize(), which honours meta.quant / meta.scale.
+"""
+from __future__ import annotations
+import math
+import struct
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+ENCODINGS = ("float32", "float16", "int8")
+MIN_DIM, MAX_DIM = 8, 4096
+
+_F16 = struct.Struct("<e")
+
+
+def truncate(vec: Sequence[float], dim: int) -> List[float]:
+    head = [float(x) for x in vec[:dim]]
+    norm = math.sqrt(sum(x * x for x in head))
+    return [x / norm for x in head] if norm else head
+
+
+def _round_f16(x: float) -> float:
+    try:
+        packed = _F16.pack(x)
+    except OverflowError:
+        return x
+    half = _F16.unpack(packed)[0]
+    for digits in (3, 4, 5):
+        y = float(f"{half:.{digits}g}")
+        if _F16.pack(y) == packed:
+            return y
+    return half
+
+
+def to_float16(vec: Sequence[float]) -> List[float]:
+    return [_round_f16(x) for x in vec]
+
+
+def to_int8(vec: Sequence[float]) -> Tuple[List[int], float]:
+    peak = max((abs(x) for x in vec), default=0.0)
+    if not peak:
+        return [0] * len(vec), 1.0
+    scale = peak / 127.0
+    return [int(round(x / scale)) for x in vec], scale
+
+
+def dequantize(vec: Sequence[float], meta: Optional[Dict[str, Any]]) -> List[float]:
+    """
+    Float vector of an embed event, whatever encoding produced it.
+    """
+    if meta and meta.get("quant") == "int8":
+        scale = float(meta.get("scale", 1.0))
+        return [q * scale for q in vec]
+    return [float(x) for x in vec]
+
+
+class Compaction:
+    def __init__(self, encoding: str = "float32", dim: Optional[int] = None):
+        if encoding not in ENCODINGS:
+            raise ValueError(f"encoding must be one of {', '.join(ENCODINGS)} (got {encoding!r})")
+        if dim is not None and not MIN_DIM <= dim <= MAX_DIM:
+            raise ValueError(f"dim must be between {MIN_DIM} and {MAX_DIM} (got {dim})")
+        self.encoding = encoding
+        self.dim = dim
+
+    @property
+    def enabled(self) -> bool:
+        return self.encoding != "float32" or self.dim is not None
+
+    def apply(self, vec: Sequence[float]) -> Tuple[List[float], Dict[str, Any]]:
+        """
+        Returns the encoded vector and the fields to merge into meta.
+        """
+        meta: Dict[str, Any] = {}
+        if self.dim is not None and len(vec) > self.dim:
+            meta["truncated_from"] = len(vec)
+            vec = truncate(vec, self.dim)
+        if self.encoding == "float16":
+            meta["quant"] = "float16"
+            return to_float16(vec), meta
+        if self.encoding == "int8":
+            values, scale = to_int8(vec)
+            meta["quant"] = "int8"
+            meta["scale"] = scale
+            return values, meta
+        return list(vec), meta
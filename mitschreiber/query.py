@@ -0,0 +1,153 @@
+"""
+Time-range queries over the WAL.
+
+Uses the sparse sidecar index (walindex.py) to skip whole segments and seek
+straight to the blocks overlapping [since, until); only those blocks and the
+unindexed tail of segments still being written are decoded. Segments without
+an index (older WAL files) are scanned in full.
+
+A `source` filter is also checked on the raw bytes first: records that do not
+contain the source string are never parsed, so reading the few rollup records
+(`mitschreiber report`) does not decode every state tick around them.
+"""
+from __future__ import annotations
+import io
+import json
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, Optional
+
+from . import walbin
+from .retention import wal_segments
+from .util import parse_ts
+from .walindex import SegmentIndex, load_index
+from .walio import is_binary, iter_records, iter_records_from, open_segment
+
+
+def _source_marker(source: Optional[str]) -> Optional[bytes]:
+    """
+    Bytes every record of `source` contains verbatim, or None when the writer
+    might have escaped them in JSON (then nothing can be skipped unparsed).
+    """
+    if not source or not source.isascii() or not source.isprintable() or '"' in source or "\\" in source:
+        return None
+    return source.encode("ascii")
+
+
+def _decode_block(
+    block: bytes, binary: bool, offset: int, contains: Optional[bytes] = None
+) -> Iterator[Dict[str, Any]]:
+    if binary:
+        for _, _, payload in walbin.iter_frames(io.BytesIO(block), offset=offset):
+            if contains is None or contains in payload:
+                yield walbin.decode_payload(payload)
+        return
+    for line in block.splitlines():
+        if line.strip() and (contains is None or contains in line):
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def _decode_from(
+    fp: BinaryIO, binary: bool, offset: int, contains: Optional[bytes] = None
+) -> Iterator[Dict[str, Any]]:
+    if binary:
+        for _, _, payload in walbin.iter_frames(fp, offset=offset):
+            if contains is None or contains in payload:
+                yield walbin.decode_payload(payload)
+        return
+    yield from _decode_block(fp.read(), False, offset, contains)
+
+
+def _indexed_records(
+    path: Path,
+    idx: SegmentIndex,
+    since: Optional[float],
+    until: Optional[float],
+    contains: Optional[bytes] = None,
+) -> Iterator[Dict[str, Any]]:
+    blocks = [e for e in idx.entries if e.overlaps(since, until)]
+    scan_tail = not idx.closed
+    if not blocks and not scan_tail:
+        return
+    binary = is_binary(path)
+    with open_segment(path) as fp:
+        for entry in blocks:
+            fp.seek(entry.off)
+            yield from _decode_block(fp.read(entry.end - entry.off), binary, entry.off, contains)
+        if scan_tail:
+            fp.seek(idx.end)
+            yield from _decode_from(fp, binary, idx.end, contains)
+
+
+def segment_records(
+    path: Path,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+    contains: Optional[bytes] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Candidate records of one segment for the time range (still to be filtered exactly).
+    With `contains`, records whose raw bytes lack it are skipped without decoding.
+    """
+    idx = load_index(path) if (since is not None or until is not None) else None
+    if idx is not None:
+        yield from _indexed_records(path, idx, since, until, contains)
+    elif contains is None:
+        yield from iter_records(path)
+    else:
+        for _, rec in iter_records_from(path, contains=contains):
+            if rec is not None:
+                yield rec
+
+
+def _matches(
+    rec: Dict[str, Any],
+    since: Optional[float],
+    until: Optional[float],
+    app: Optional[str],
+    source: Optional[str],
+    session: Optional[str],
+) -> bool:
+    if app is not None and rec.get("app") != app:
+        return False
+    if source is not None and rec.get("source") != source:
+        return False
+    if session is not None and rec.get("session") != session:
+        return False
+    if since is not None or until is not None:
+        ts = rec.get("ts")
+        if not ts:
+            return False
+        try:
+            t = parse_ts(ts)
+        except ValueError:
+            return False
+        if since is not None and t < since:
+            return False
+        if until is not None and t >= until:
+            return False
+    return True
+
+
+def query(
+    wal_dir: Path,
+    *,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+    app: Optional[str] = None,
+    source: Optional[str] = None,
+    session: Optional[str] = None,
+    files: Optional[Iterable[Path]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Streams WAL records with since <= ts < until (epoch seconds) matching the filters.
+    """
+    contains = _source_marker(source)
+    for path in (files if files is not None else wal_segments(wal_dir)):
+        if session is not None and session not in path.name:
+            continue
+        for rec in segment_records(path, since, until, contains):
+            if _matches(rec, since, until, app, source, session):
+                yield rec
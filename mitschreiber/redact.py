@@ -0,0 +1,279 @@
+"""
+PII/secret gate: redacts titles and clipboard text before they are persisted.
+
+All detectors are compiled into one regular expression (named alternatives),
+so a string is scanned once however many detectors and user terms there are:
+
+    private_key  PEM private key blocks
+    token        API tokens with a known shape (GitHub, GitLab, Slack, OpenAI/
+                 Anthropic "sk-", AWS access key ids, Google API keys, JWTs)
+    secret       the value of password=…, token: …, api_key=… (the key stays)
+    email        e-mail addresses
+    iban         IBANs, checked with their mod-97 checksum
+    entropy      long random-looking strings: mixed case and digits that
+                 alternate often, Shannon entropy >= min_entropy bits/char
+    term         user-supplied words or names (case-insensitive); the list is
+                 compiled into a trie, so thousands of terms cost one lookup
+
+Matches become "[redacted:<kind>]". Validation (checksum, entropy) only runs
+on candidates the expression already found.
+
+Speed: a regex alternation costs every branch at every position, so each
+string first goes through cheap necessary conditions at C speed ("@" for an
+e-mail, a digit for an IBAN or random string, a token prefix, ...). Only the
+detectors that can match are compiled into the expression for that string
+(cached per combination); clean prose often needs no regex at all. Titles
+repeat all day, so results for short strings are kept in an LRU.
+
+run_session hands every sampler batch to redact_jsonl() before it reaches the
+WAL, the embed worker and the rollups. Unchanged batches are written as they
+came; only records that were redacted are re-serialized. A record that
+cannot be parsed is dropped rather than written unchecked (fail closed).
+"""
+from __future__ import annotations
+import json
+import math
+import re
+from collections import Counter, OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+KINDS = ("private_key", "token", "secret", "email", "iban", "entropy", "term")
+# String fields of a state record that can carry user content.
+FIELDS = ("app", "window", "clipboard", "url", "path")
+DEFAULT_MIN_ENTROPY = 3.8
+# Strings up to this length are cached (titles); longer ones (clipboard) are not.
+_CACHE_MAX_LEN = 1024
+_MISS = object()
+
+_TOKEN = (
+    r"\b(?:gh[pousr]_[A-Za-z0-9]{36,}|github_pat_[A-Za-z0-9_]{22,}|glpat-[A-Za-z0-9_-]{20,}"
+    r"|xox[abprs]-[A-Za-z0-9-]{10,}|sk-[A-Za-z0-9_-]{20,}|AKIA[0-9A-Z]{16}|AIza[0-9A-Za-z_-]{35}"
+    r"|eyJ[A-Za-z0-9_-]{8,}\.[A-Za-z0-9_-]{8,}\.[A-Za-z0-9_-]{8,})"
+)
+_TOKEN_HINTS = ("gh", "glpat-", "xox", "sk-", "AKIA", "AIza", "eyJ")
+_SECRET_HINTS = ("pass", "pwd", "secret", "token", "key")
+_DIGITS = "0123456789"
+
+_PATTERNS = (
+    (
+        "private_key",
+        r"-----BEGIN (?:[A-Z0-9]+ )*PRIVATE KEY-----(?s:.*?-----END (?:[A-Z0-9]+ )*PRIVATE KEY-----|.*)",
+    ),
+    ("token", _TOKEN),
+    # Two groups: the key is kept, only the value (which closes last) is replaced.
+    (
+        "secret",
+        r"(?P<secret_key>(?i:\b(?:password|passwd|pwd|passwort|secret|token|api[_-]?key|access[_-]?key)"
+        r"\s*[:=]\s*))(?P<secret_value>[^\s\"',;]+)",
+    ),
+    ("email", r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9-]+(?:\.[A-Za-z0-9-]+)*\.[A-Za-z]{2,}\b"),
+    ("iban", r"\b[A-Z]{2}\d{2}(?: ?[A-Z0-9]{4}){2,7}(?: ?[A-Z0-9]{1,3})?\b"),
+    (
+        "entropy",
+        r"(?<![\w+/-])[A-Za-z0-9+/_-]{24,}={0,2}(?![\w+/=-])",
+    ),
+)
+
+
+def _trie_pattern(terms: Iterable[str]) -> Optional[str]:
+    """
+    One regex for many literals: shared prefixes are matched once.
+    """
+    trie: Dict[str, Any] = {}
+    for term in terms:
+        term = term.strip().casefold()
+        if not term:
+            continue
+        node = trie
+        for ch in term:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+    if not trie:
+        return None
+
+    def emit(node: Dict[str, Any]) -> str:
+        end = "" in node
+        branches = [re.escape(ch) + emit(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return "(?:" + body + ")?" if end else body
+
+    return r"(?<!\w)(?i:" + emit(trie) + r")(?!\w)"
+
+
+def _iban_ok(candidate: str) -> bool:
+    iban = candidate.replace(" ", "")
+    if not 15 <= len(iban) <= 34:
+        return False
+    digits = "".join(str(int(ch, 36)) for ch in iban[4:] + iban[:4])
+    return int(digits) % 97 == 1
+
+
+def _entropy(s: str) -> float:
+    n = len(s)
+    return -sum(c / n * math.log2(c / n) for c in Counter(s).values())
+
+
+def _random_looking(s: str, min_entropy: float) -> bool:
+    """
+    Random strings switch between upper, lower and digit on most characters;
+    identifiers and file names (CamelCase words, a version number) rarely do.
+    """
+    s = "".join(ch for ch in s if ch.isalnum())
+    if len(s) < 20 or sum(ch.isdigit() for ch in s) < 2 or s.islower() or s.isupper():
+        return False
+    classes = [ch.isdigit() + 2 * ch.isupper() for ch in s]
+    switches = sum(a != b for a, b in zip(classes, classes[1:]))
+    return switches >= 0.45 * (len(s) - 1) and _entropy(s) >= min_entropy
+
+
+def _candidates(text: str) -> Tuple[str, ...]:
+    """
+    Detectors that can match `text` at all, from substring tests only.
+    """
+    kinds = []
+    if "PRIVATE KEY" in text:
+        kinds.append("private_key")
+    if any(hint in text for hint in _TOKEN_HINTS):
+        kinds.append("token")
+    lowered = text.lower()
+    if any(hint in lowered for hint in _SECRET_HINTS):
+        kinds.append("secret")
+    if "@" in text:
+        kinds.append("email")
+    if any(d in text for d in _DIGITS):
+        kinds += ("iban", "entropy")
+    return tuple(kinds)
+
+
+class Redactor:
+    def __init__(
+        self,
+        terms: Sequence[str] = (),
+        min_entropy: float = DEFAULT_MIN_ENTROPY,
+        cache_size: int = 4096,
+    ):
+        if min_entropy < 0:
+            raise ValueError(f"min_entropy must not be negative (got {min_entropy})")
+        if cache_size < 0:
+            raise ValueError(f"cache_size must not be negative (got {cache_size})")
+        self.min_entropy = min_entropy
+        self.cache_size = cache_size
+        self._sources = dict(_PATTERNS)
+        term = _trie_pattern(terms)
+        if term is not None:
+            self._sources["term"] = term
+        self._compiled: Dict[Tuple[str, ...], "re.Pattern[str]"] = {}
+        self._cache: "OrderedDict[str, Optional[str]]" = OrderedDict()
+        self.records = 0
+        self.redacted = 0
+        self.dropped = 0
+        # Fixed keys: stats() may copy this while the capture loop counts.
+        self.matches: Dict[str, int] = dict.fromkeys(KINDS, 0)
+
+    def _pattern(self, kinds: Tuple[str, ...]) -> "re.Pattern[str]":
+        pattern = self._compiled.get(kinds)
+        if pattern is None:
+            # One alternation, in _PATTERNS order: earlier detectors win on overlap.
+            parts = [
+                self._sources[kind] if kind == "secret" else f"(?P<{kind}>{self._sources[kind]})"
+                for kind in kinds
+            ]
+            pattern = self._compiled[kinds] = re.compile("|".join(parts))
+        return pattern
+
+    def _replace(self, m: "re.Match[str]") -> str:
+        kind = m.lastgroup
+        if kind == "secret_value":
+            self.matches["secret"] += 1
+            return m.group("secret_key") + "[redacted:secret]"
+        text = m.group()
+        if kind == "iban" and not _iban_ok(text):
+            return text
+        if kind == "entropy" and not _random_looking(text, self.min_entropy):
+            return text
+        self.matches[kind] += 1
+        return f"[redacted:{kind}]"
+
+    def _scan(self, text: str) -> str:
+        kinds = _candidates(text)
+        if "term" in self._sources:
+            kinds += ("term",)
+        if not kinds:
+            return text
+        clean = self._pattern(kinds).sub(self._replace, text)
+        return text if clean == text else clean
+
+    def redact(self, text: str) -> str:
+        """
+        `text` with every detected secret replaced (the same object if none).
+        """
+        if len(text) > _CACHE_MAX_LEN or not self.cache_size:
+            return self._scan(text)
+        cached = self._cache.get(text, _MISS)
+        if cached is not _MISS:
+            self._cache.move_to_end(text)
+            # None: clean. The caller gets its own object back, not the cached key.
+            return text if cached is None else cached
+        clean = self._scan(text)
+        self._cache[text] = None if clean is text else clean
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return clean
+
+    def redact_record(self, evt: Dict[str, Any]) -> bool:
+        """
+        Redacts the content fields of a record in place; True if any changed.
+        """
+        changed = False
+        for key in FIELDS:
+            value = evt.get(key)
+            if isinstance(value, str) and value:
+                clean = self.redact(value)
+                if clean is not value:
+                    evt[key] = clean
+                    changed = True
+        return changed
+
+    def redact_jsonl(self, raw: bytes) -> Tuple[bytes, List[Dict[str, Any]]]:
+        """
+        Redacts a buffer of newline-terminated JSON records (a sampler batch).
+        Returns the buffer to persist and its records, already parsed.
+        """
+        records: List[Dict[str, Any]] = []
+        if not raw:
+            return raw, records
+        lines = raw.splitlines()
+        out: Optional[List[bytes]] = None
+        for i, line in enumerate(lines):
+            self.records += 1
+            try:
+                evt = json.loads(line)
+                if not isinstance(evt, dict):
+                    raise ValueError("not a JSON object")
+            except ValueError:
+                self.dropped += 1
+                if out is None:
+                    out = lines[:i]
+                continue
+            if self.redact_record(evt):
+                self.redacted += 1
+                if out is None:
+                    out = lines[:i]
+                out.append(json.dumps(evt, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+            elif out is not None:
+                out.append(line)
+            records.append(evt)
+        if out is None:
+            return raw, records
+        return b"".join(line + b"\n" for line in out), records
+
+    def stats(self) -> Dict[str, Any]:
+        # matches count detections per distinct string (cached repeats are not recounted).
+        return {
+            "records": self.records,
+            "redacted": self.redacted,
+            "dropped": self.dropped,
+            "matches": dict(self.matches),
+        }
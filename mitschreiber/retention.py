@@ -0,0 +1,87 @@
+"""
+WAL retention: keeps disk use within a day and/or byte budget across all sessions.
+
+Segments are deleted oldest first (by modification time). Segments still being
+written or sealed – the caller's active segment and any uncompressed segment
+whose writer, in this or another process, holds its lock (wal.segment_in_use)
+– are never deleted, however long the session has been quiet.
+"""
+from __future__ import annotations
+import time
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+from .wal import lock_path_for, segment_in_use
+from .walindex import index_path_for
+
+_SEGMENT_SUFFIXES = (".jsonl", ".jsonl.gz", ".jsonl.zst", ".mwal", ".mwal.gz", ".mwal.zst")
+# Each session writes its states (session-*) and its dwell-time rollups (rollups-*, see rollup.py).
+_STREAM_GLOBS = ("session-*", "rollups-*")
+
+
+def wal_segments(wal_dir: Path) -> List[Path]:
+    """
+    All session WAL files (legacy single files and segments, sealed or not), oldest first.
+    """
+    if not wal_dir.exists():
+        return []
+    files = [
+        p
+        for pattern in _STREAM_GLOBS
+        for p in wal_dir.glob(pattern)
+        if p.is_file() and p.name.endswith(_SEGMENT_SUFFIXES)
+    ]
+    return sorted(files, key=lambda p: p.stat().st_mtime)
+
+
+def _is_sealed(path: Path) -> bool:
+    return path.name.endswith((".gz", ".zst"))
+
+
+def delete_segment(path: Path):
+    path.unlink(missing_ok=True)
+    index_path_for(path).unlink(missing_ok=True)
+    # Left behind by a writer that crashed before sealing.
+    lock_path_for(path).unlink(missing_ok=True)
+
+
+def enforce_retention(
+    wal_dir: Path,
+    *,
+    max_age_days: Optional[float] = None,
+    max_bytes: Optional[int] = None,
+    protect: Iterable[Path] = (),
+    now: Optional[float] = None,
+) -> List[Path]:
+    """
+    Deletes the oldest segments until both budgets hold; returns the deleted paths.
+    """
+    if max_age_days is None and max_bytes is None:
+        return []
+    now = time.time() if now is None else now
+    protected = {Path(p).resolve() for p in protect}
+
+    entries = []
+    for p in wal_segments(wal_dir):
+        try:
+            st = p.stat()
+        except FileNotFoundError:
+            continue
+        live = p.resolve() in protected or (not _is_sealed(p) and segment_in_use(p))
+        entries.append((p, st.st_mtime, st.st_size, live))
+
+    total = sum(size for (_, _, size, _) in entries)
+    cutoff = now - max_age_days * 86400 if max_age_days is not None else None
+    deleted: List[Path] = []
+    for p, mtime, size, live in entries:
+        if live:
+            continue
+        too_old = cutoff is not None and mtime < cutoff
+        too_big = max_bytes is not None and total > max_bytes
+        if not (too_old or too_big):
+            # Oldest first: once neither budget is exceeded we are done.
+            break
+        delete_segment(p)
+        total -= size
+        deleted.append(p)
+    return deleted
@@ -0,0 +1,264 @@
+"""
+Streaming dwell-time rollups.
+
+run_session feeds every `os.context.state` record into a RollupAggregator.
+The time between two states is credited to the earlier context, split at
+window boundaries, and summed per app and per (app, window title) in
+tumbling windows (default 1 min, 15 min, 1 h). When a window closes, one
+compact `os.context.rollup` record goes to the session's own rollup stream
+(WAL segments rollups-<UUID>-<seq>, next to the session-* state segments):
+
+    {"source": "os.context.rollup", "session": "...", "ts": <end>,
+     "window_s": 900, "start": "...", "end": "...", "total_s": 812.5,
+     "apps": [{"app": "kitty", "seconds": 600.0}, ...],
+     "windows": [{"app": "kitty", "window": "vim", "seconds": 420.0}, ...]}
+
+Memory is bounded: one open bucket per window size, each with at most
+`max_keys` titles (the rest is summed as OTHER per app). Gaps longer than
+`max_gap_s` (suspend, a stopped sampler) are not credited; gap_limit()
+derives it from how often the sampler re-confirms the context, and without
+heartbeats (--change-only --heartbeat 0) every gap is credited.
+
+`mitschreiber report` reads only the rollup segments (rollup_segments(), report()),
+never the state ticks.
+"""
+from __future__ import annotations
+import math
+import re
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .retention import wal_segments
+from .util import ISO, parse_ts
+
+ROLLUP_SOURCE = "os.context.rollup"
+ROLLUP_PREFIX = "rollups"
+STATE_SOURCE = "os.context.state"
+DEFAULT_WINDOWS = (60, 900, 3600)
+DEFAULT_MAX_GAP_S = 600.0
+OTHER = "(other)"
+
+_DURATION = re.compile(r"^(\d+)([smhd]?)$")
+_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_windows(spec: str) -> Tuple[int, ...]:
+    """
+    Parses "1m,15m,1h" (plain numbers are seconds); "" or "off" means none.
+    """
+    spec = spec.strip().lower()
+    if spec in ("", "off", "none"):
+        return ()
+    windows = set()
+    for part in spec.split(","):
+        m = _DURATION.match(part.strip())
+        if not m or int(m.group(1)) <= 0:
+            raise ValueError(f"invalid rollup window {part.strip()!r} (expected e.g. 60, 15m, 1h)")
+        windows.add(int(m.group(1)) * _UNITS[m.group(2)])
+    return tuple(sorted(windows))
+
+
+def gap_limit(confirm_ms: Optional[int]) -> Optional[float]:
+    """
+    max_gap_s for a sampler that re-emits the current context every
+    `confirm_ms` (poll interval or heartbeat): at least two intervals.
+    None (no heartbeats) means a quiet context is never confirmed, so no limit.
+    """
+    if not confirm_ms:
+        return None
+    return max(DEFAULT_MAX_GAP_S, 2 * confirm_ms / 1000.0)
+
+
+def rollup_segments(wal_dir: Path) -> List[Path]:
+    """
+    The rollup streams' WAL segments, oldest first.
+    """
+    return [p for p in wal_segments(wal_dir) if p.name.startswith(f"{ROLLUP_PREFIX}-")]
+
+
+def _iso(t: float) -> str:
+    return datetime.fromtimestamp(t, timezone.utc).strftime(ISO)
+
+
+class _Bucket:
+    __slots__ = ("start", "apps", "windows")
+
+    def __init__(self, start: float):
+        self.start = start
+        self.apps: Dict[str, float] = {}
+        self.windows: Dict[Tuple[str, str], float] = {}
+
+    def add(self, app: str, window: str, seconds: float, max_keys: int):
+        self.apps[app] = self.apps.get(app, 0.0) + seconds
+        key = (app, window)
+        if key not in self.windows and len(self.windows) >= max_keys:
+            key = (app, OTHER)
+        self.windows[key] = self.windows.get(key, 0.0) + seconds
+
+
+class RollupAggregator:
+    def __init__(
+        self,
+        session_id: str,
+        windows: Sequence[int] = DEFAULT_WINDOWS,
+        max_keys: int = 256,
+        max_gap_s: Optional[float] = DEFAULT_MAX_GAP_S,
+    ):
+        if not windows or any(w <= 0 for w in windows):
+            raise ValueError(f"rollup windows must be positive seconds (got {list(windows)})")
+        if max_keys <= 0:
+            raise ValueError(f"max_keys must be positive (got {max_keys})")
+        if max_gap_s is not None and max_gap_s <= 0:
+            raise ValueError(f"max_gap_s must be positive (got {max_gap_s})")
+        self.session_id = session_id
+        self.windows = tuple(sorted(set(int(w) for w in windows)))
+        self.max_keys = max_keys
+        self.max_gap_s = max_gap_s
+        self._open: Dict[int, _Bucket] = {}
+        # Context since the last state, when it was seen, and how far it is credited.
+        self._context: Optional[Tuple[str, str]] = None
+        self._seen = 0.0
+        self._credited = 0.0
+        self._closed: List[Dict[str, Any]] = []
+
+    def observe(self, evt: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Feeds one WAL record; returns the rollups of windows it closed.
+        """
+        if evt.get("source", STATE_SOURCE) != STATE_SOURCE or "dwell_ms" in evt:
+            # Closing records repeat the previous context at the next state's ts.
+            return []
+        ts = evt.get("ts")
+        if not ts:
+            return []
+        try:
+            t = parse_ts(ts)
+        except ValueError:
+            return []
+        out = self.advance(t)
+        if t >= self._seen:
+            self._context = (str(evt.get("app") or "Unknown"), str(evt.get("window") or "Unknown"))
+            self._seen = t
+            # advance() may have credited past t by wall clock; never credit twice.
+            self._credited = max(self._credited, t)
+        return out
+
+    def advance(self, now: float) -> List[Dict[str, Any]]:
+        """
+        Credits the current context up to `now` (at most max_gap_s past its
+        last state, if set) and closes every window that ended by then.
+        """
+        if self._context is not None:
+            until = now if self.max_gap_s is None else min(now, self._seen + self.max_gap_s)
+            if until > self._credited:
+                self._credit(self._credited, until)
+                self._credited = until
+        for w in self.windows:
+            bucket = self._open.get(w)
+            if bucket is not None and bucket.start + w <= now:
+                self._close(w)
+        return self._drain()
+
+    def flush(self, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Credits up to `now` and emits all open (partial) windows, e.g. at session end.
+        """
+        out = self.advance(now) if now is not None else []
+        for w in self.windows:
+            self._close(w)
+        return out + self._drain()
+
+    def _credit(self, a: float, b: float):
+        app, window = self._context
+        for w in self.windows:
+            t = a
+            while t < b:
+                start = math.floor(t / w) * w
+                bucket = self._open.get(w)
+                if bucket is None or bucket.start != start:
+                    self._close(w)
+                    bucket = self._open[w] = _Bucket(start)
+                end = min(b, start + w)
+                bucket.add(app, window, end - t, self.max_keys)
+                t = end
+
+    def _drain(self) -> List[Dict[str, Any]]:
+        out, self._closed = self._closed, []
+        return out
+
+    def _close(self, w: int):
+        bucket = self._open.pop(w, None)
+        if bucket is None or not bucket.apps:
+            return
+        end = bucket.start + w
+        self._closed.append(
+            {
+                "ts": _iso(end),
+                "source": ROLLUP_SOURCE,
+                "session": self.session_id,
+                "window_s": w,
+                "start": _iso(bucket.start),
+                "end": _iso(end),
+                "total_s": round(sum(bucket.apps.values()), 3),
+                "apps": [
+                    {"app": app, "seconds": round(s, 3)}
+                    for app, s in sorted(bucket.apps.items(), key=lambda kv: -kv[1])
+                ],
+                "windows": [
+                    {"app": app, "window": window, "seconds": round(s, 3)}
+                    for (app, window), s in sorted(bucket.windows.items(), key=lambda kv: -kv[1])
+                ],
+            }
+        )
+
+
+def report(
+    records: Iterable[Dict[str, Any]],
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+    by: str = "app",
+    resolution: Optional[int] = None,
+) -> Tuple[Optional[int], List[Dict[str, Any]]]:
+    """
+    Sums rollup records into (resolution, rows sorted by seconds).
+
+    Only windows entirely inside [since, until] count. Every window size is
+    summed in the same pass; unless `resolution` is given, the coarsest one
+    aligned with both bounds is reported (exact and fewest records).
+    """
+    if by not in ("app", "window"):
+        raise ValueError(f"by must be 'app' or 'window' (got {by!r})")
+    totals: Dict[int, Dict[Tuple[str, ...], float]] = {}
+    for rec in records:
+        if rec.get("source") != ROLLUP_SOURCE:
+            continue
+        try:
+            w = int(rec["window_s"])
+            start, end = parse_ts(rec["start"]), parse_ts(rec["end"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if (since is not None and start < since) or (until is not None and end > until):
+            continue
+        sums = totals.setdefault(w, {})
+        if by == "app":
+            for row in rec.get("apps", ()):
+                key = (row["app"],)
+                sums[key] = sums.get(key, 0.0) + row["seconds"]
+        else:
+            for row in rec.get("windows", ()):
+                key = (row["app"], row["window"])
+                sums[key] = sums.get(key, 0.0) + row["seconds"]
+    if not totals:
+        return resolution, []
+    if resolution is None:
+        aligned = [
+            w for w in totals
+            if (since is None or since % w == 0) and (until is None or until % w == 0)
+        ]
+        resolution = max(aligned) if aligned else min(totals)
+    sums = totals.get(resolution, {})
+    names = ("app",) if by == "app" else ("app", "window")
+    rows = [dict(zip(names, key), seconds=round(s, 3)) for key, s in sums.items()]
+    rows.sort(key=lambda r: -r["seconds"])
+    return resolution, rows
@@ -1,26 +1,29 @@
 # mitschreiber/session.py
 from __future__ import annotations
-from pathlib import Path
-import fcntl
-import hashlib
+import contextlib
+import functools
 import json
 import sys
+import threading
 import time
-from typing import Dict, Any, Optional
+from pathlib import Path
+from typing import Callable, Dict, Any, Optional, Sequence
 
-from mitschreiber._mitschreiber import start_session, stop_session, poll_state
-from .util import now_iso
+from mitschreiber._mitschreiber import start_session, stop_session, poll_state_wait, session_stats
 from .paths import WAL_DIR, SESS_DIR
-
-try:
-    from .embed import build_embed_event
-    HAS_EMBED = True
-    EMBED_IMPORT_ERROR = None
-except Exception as e:
-    HAS_EMBED = False
-    EMBED_IMPORT_ERROR = e
-
-_WARNED_EMBED_FALLBACK = False
+from .wal import WalWriter, SegmentedWalWriter
+from .retention import enforce_retention
+from .worker import EmbedWorker
+from .embed_cache import EmbeddingCache, DEFAULT_CACHE_PATH
+from .keyphrases import KeyphraseEngine, DEFAULT_KEYPHRASE_PATH
+from .quantize import Compaction
+from .dedup import DEFAULT_MEMORY, DEFAULT_THRESHOLD, NearDuplicateGate
+from .redact import Redactor
+from .rollup import DEFAULT_WINDOWS, ROLLUP_PREFIX, RollupAggregator, gap_limit
+from .sink import ChronikSink, SinkError
+from .metrics import REGISTRY, SIZE_BUCKETS, MetricFamily, MetricsServer
+from .backends import EmbeddingBackend, configure as configure_backend
+from .embed import build_embed_events
 
 
 def _embed_text_from_evt(evt: dict) -> str | None:
@@ -41,130 +44,456 @@ def _embed_text_from_evt(evt: dict) -> str | None:
 # Use SESS_DIR for consistency with paths.py
 SESSIONS_DIR = SESS_DIR
 
-class WalWriter:
-    def __init__(self, path: Path):
-        self.path = path
-        self.file = None
-
-    def __enter__(self):
-        self.path.parent.mkdir(parents=True, exist_ok=True)
-        self.file = open(self.path, "a", encoding="utf-8")
-        return self
-
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        if self.file:
-            self.file.close()
-
-    def append(self, obj: Dict[str, Any]):
-        if not self.file:
-            return
-        fcntl.flock(self.file, fcntl.LOCK_EX)
-        try:
-            self.file.write(json.dumps(obj, ensure_ascii=False) + "\n")
-            self.file.flush()
-        finally:
-            fcntl.flock(self.file, fcntl.LOCK_UN)
-
-def _emit_embed(state_evt: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+# Upper bound for one blocking wait on the sampler channel. Signal handlers
+# (Ctrl+C, `mitschreiber stop`) run only between waits, so this bounds the
+# shutdown latency; it does not delay events, which wake the loop immediately.
+_WAIT_SLICE_MS = 200
+_MAX_EVENTS_PER_WAIT = 4096
+
+# What a full sampler channel loses: the oldest queued state (ring buffer,
+# keeps data fresh after a stall), the new one, or repeats of the waiting one.
+QUEUE_OVERFLOW = ("drop-oldest", "drop-newest", "coalesce")
+
+_POLL_BATCH = REGISTRY.histogram(
+    "mitschreiber_poll_batch_records",
+    "States returned by one non-empty poll of the sampler channel.",
+    buckets=SIZE_BUCKETS,
+)
+
+def _build_embed_batch(
+    evts: list[Dict[str, Any]],
+    backend: EmbeddingBackend,
+    cache: Optional[EmbeddingCache] = None,
+    keyphraser: Optional[KeyphraseEngine] = None,
+    compaction: Optional[Compaction] = None,
+    dedup: Optional[NearDuplicateGate] = None,
+) -> list[Optional[Dict[str, Any]]]:
     """
-    STUB / PROTOTYPE
-    Generates a deterministic 'fake' embedding from the event state.
-    This is strictly for demo/testing purposes (Pipe-Integration & Schema)
-    and uses a SHA256 hash instead of a real ML model.
+    Turns a micro-batch of state events into embed events (runs in the worker thread).
+    Near-duplicates of recent texts of the same app are dropped first (see dedup.py).
+    """
+    if dedup is not None:
+        evts = [evt for evt in evts if dedup.admit(str(evt.get("app") or ""), _embed_text_from_evt(evt) or "")]
+    items = []
+    for evt in evts:
+        text_content = _embed_text_from_evt(evt)
+        if not text_content:
+            # Nothing meaningful to embed
+            continue
+        items.append((text_content, evt["session"], evt.get("app", ""), evt.get("window", "")))
+    events = build_embed_events(items, backend, cache=cache, keyphraser=keyphraser, compaction=compaction)
+    return [eevt for (eevt, _) in events]
 
-    TODO: Replace with real local embedding model (e.g., via onnx/gguf).
+def _select_backend(
+    name: Optional[str], model: Optional[str], threads: Optional[int], inter_op_threads: Optional[int]
+) -> EmbeddingBackend:
     """
-    # Minimaler Stub: bildet ein deterministisches kleines „Embedding“
-    # aus app+window Hash – genügt für Pipe-Integration & Schema-Form.
-    text = f"{state_evt.get('app','')}|{state_evt.get('window','')}"
-    h = hashlib.sha256(text.encode("utf-8")).hexdigest()
-    # Achtung: Demo-Embedding mit 8 Werten
-    vec = [((ord(c) % 17) - 8) / 100.0 for c in h[:8]]
-    return {
-        "ts": now_iso(),
-        "source": "os.context.text.embed",
-        "session": state_evt["session"],
-        "app": state_evt.get("app"),
-        "window": state_evt.get("window"),
-        "keyphrases": [w for w in text.split("|") if w],
-        "embedding": vec,
-        "hash_id": f"sha256:{h}",
-        "privacy": {"raw_retained": False},
-        "meta": {"model": "demo-embedding-stub"}
-    }
+    Loads the session's embedding backend up front; falls back to the hash
+    backend when its dependencies are missing (for this session only).
+    """
+    backend = configure_backend(name, model=model, threads=threads, inter_op_threads=inter_op_threads)
+    try:
+        backend.load()
+    except ImportError as exc:
+        print(
+            f"mitschreiber: embedding backend {backend.name!r} unavailable ({exc}); using hash backend",
+            file=sys.stderr,
+        )
+        backend = configure_backend("hash")
+    return backend
+
+def _report_embed_stats(
+    session_id: str,
+    stats: Dict[str, Any],
+    cache_stats: Optional[Dict[str, int]] = None,
+    dedup_stats: Optional[Dict[str, int]] = None,
+):
+    msg = (
+        f"mitschreiber embed [{session_id}]: {stats['embedded']} event(s) in {stats['batches']} batch(es), "
+        f"batch latency avg {stats['batch_ms_avg']} ms / max {stats['batch_ms_max']} ms, "
+        f"queue high-water {stats['queue_max_depth']}, dropped {stats['dropped']}"
+    )
+    if cache_stats is not None:
+        msg += (
+            f", cache hits {cache_stats['hits']} (disk {cache_stats['disk_hits']}) / "
+            f"misses {cache_stats['misses']}"
+        )
+    if dedup_stats is not None:
+        msg += f", near-duplicates skipped {dedup_stats['skipped']} of {dedup_stats['checked']}"
+    print(msg, file=sys.stderr)
+
+def _report_redact_stats(session_id: str, stats: Dict[str, Any]):
+    found = ", ".join(f"{kind} {n}" for kind, n in stats["matches"].items() if n) or "nothing"
+    print(
+        f"mitschreiber redact [{session_id}]: {stats['redacted']} of {stats['records']} record(s) redacted "
+        f"({found}), {stats['dropped']} unparseable dropped",
+        file=sys.stderr,
+    )
 
-def run_session(session_id: str, embed: bool, clipboard: bool, poll_ms: int):
+def _report_sink_stats(session_id: str, stats: Dict[str, int]):
+    print(
+        f"mitschreiber sink [{session_id}]: {stats['sent_records']} record(s) in {stats['sent_batches']} batch(es), "
+        f"{stats['retries']} retries, {stats['rejected']} rejected, {stats['pending']} pending",
+        file=sys.stderr,
+    )
+
+def _session_collector(
+    session_id: str,
+    worker: Optional[EmbedWorker],
+    cache: Optional[EmbeddingCache],
+    sink: Optional[ChronikSink],
+    dedup: Optional[NearDuplicateGate] = None,
+    redactor: Optional[Redactor] = None,
+):
+    """
+    Reads the counters owned by the sampler, redactor, embed worker, cache, dedup gate and sink at scrape time.
+    """
+    def collect():
+        families = []
+        sampler = session_stats(session_id)
+        if sampler is not None:
+            families += [
+                MetricFamily("mitschreiber_sampler_probes_total", "counter", "Sampler probes.")
+                .add(sampler["probes"], session=session_id),
+                MetricFamily("mitschreiber_sampler_emitted_total", "counter", "States queued for Python.")
+                .add(sampler["emitted"], session=session_id),
+                MetricFamily("mitschreiber_sampler_drops_total", "counter", "States dropped on a full channel.")
+                .add(sampler["drops"], session=session_id),
+                MetricFamily("mitschreiber_channel_depth", "gauge", "States waiting in the sampler channel.")
+                .add(sampler["depth"], session=session_id),
+                MetricFamily("mitschreiber_channel_capacity", "gauge", "Capacity of the sampler channel.")
+                .add(sampler["capacity"], session=session_id),
+                MetricFamily("mitschreiber_channel_high_water", "gauge", "Deepest the sampler channel has been.")
+                .add(sampler["high_water"], session=session_id),
+                MetricFamily("mitschreiber_sampler_coalesced_total", "counter", "Repeated states not queued (coalesce).")
+                .add(sampler["coalesced"], session=session_id),
+                MetricFamily("mitschreiber_sampler_probe_microseconds", "gauge", "Probe latency.")
+                .add(sampler["probe_us_avg"], session=session_id, stat="avg")
+                .add(sampler["probe_us_max"], session=session_id, stat="max"),
+                MetricFamily("mitschreiber_sampler_interval_ms", "gauge", "Poll interval after idle backoff.")
+                .add(sampler["interval_ms"], session=session_id),
+            ]
+        if redactor is not None:
+            stats = redactor.stats()
+            redactions = MetricFamily("mitschreiber_redactions_total", "counter", "Secrets and PII redacted, by kind.")
+            for kind, n in stats["matches"].items():
+                redactions.add(n, session=session_id, kind=kind)
+            families += [
+                redactions,
+                MetricFamily("mitschreiber_redacted_records_total", "counter", "State records with a redaction.")
+                .add(stats["redacted"], session=session_id),
+                MetricFamily("mitschreiber_redact_dropped_total", "counter", "Unparseable records not written.")
+                .add(stats["dropped"], session=session_id),
+            ]
+        if worker is not None:
+            stats = worker.stats()
+            families += [
+                MetricFamily("mitschreiber_embed_queue_depth", "gauge", "State events waiting for embedding.")
+                .add(stats["queue_depth"], session=session_id),
+                MetricFamily("mitschreiber_embed_dropped_total", "counter", "State events dropped on a full embed queue.")
+                .add(stats["dropped"], session=session_id),
+                MetricFamily("mitschreiber_embed_events_total", "counter", "Embed events written.")
+                .add(stats["embedded"], session=session_id),
+                MetricFamily("mitschreiber_embed_errors_total", "counter", "Failed embedding batches.")
+                .add(stats["errors"], session=session_id),
+            ]
+        if dedup is not None:
+            stats = dedup.stats()
+            families += [
+                MetricFamily(
+                    "mitschreiber_embed_dedup_skipped_total", "counter", "Texts not embedded as near-duplicates."
+                ).add(stats["skipped"], session=session_id),
+                MetricFamily("mitschreiber_embed_dedup_checked_total", "counter", "Texts checked by the dedup gate.")
+                .add(stats["checked"], session=session_id),
+            ]
+        if cache is not None:
+            stats = cache.stats()
+            families += [
+                MetricFamily("mitschreiber_embed_cache_hits_total", "counter", "Embedding cache hits by tier.")
+                .add(stats["hits"] - stats["disk_hits"], session=session_id, tier="memory")
+                .add(stats["disk_hits"], session=session_id, tier="disk"),
+                MetricFamily("mitschreiber_embed_cache_misses_total", "counter", "Embedding cache misses.")
+                .add(stats["misses"], session=session_id),
+                MetricFamily("mitschreiber_embed_cache_entries", "gauge", "Embeddings held in memory.")
+                .add(stats["entries"], session=session_id),
+            ]
+        if sink is not None:
+            stats = sink.stats()
+            families += [
+                MetricFamily("mitschreiber_sink_sent_records_total", "counter", "Records acknowledged by chronik.")
+                .add(stats["sent_records"], session=session_id),
+                MetricFamily("mitschreiber_sink_retries_total", "counter", "Failed chronik requests that were retried.")
+                .add(stats["retries"], session=session_id),
+                MetricFamily("mitschreiber_sink_rejected_records_total", "counter", "Records rejected by chronik.")
+                .add(stats["rejected"], session=session_id),
+            ]
+        return families
+    return collect
+
+def run_session(
+    session_id: str,
+    embed: bool,
+    clipboard: bool,
+    poll_ms: int,
+    max_poll_ms: Optional[int] = None,
+    queue_capacity: int = 10_000,
+    queue_overflow: str = "drop-oldest",
+    embed_batch: int = 16,
+    embed_delay_ms: int = 250,
+    embed_queue: int = 1024,
+    embed_cache_size: int = 4096,
+    embed_cache_persist: bool = False,
+    change_only: bool = False,
+    heartbeat_ms: int = 60_000,
+    durability: str = "flush",
+    sync_interval_ms: int = 1000,
+    segment_bytes: int = 64 << 20,
+    segment_age_s: float = 3600.0,
+    compression: str = "gzip",
+    retention_days: Optional[float] = None,
+    retention_bytes: Optional[int] = None,
+    wal_format: str = "jsonl",
+    ship: bool = False,
+    metrics_port: Optional[int] = None,
+    sampler: str = "auto",
+    wal_dir: Optional[Path] = None,
+    stop_event: Optional[threading.Event] = None,
+    embed_backend: Optional[str] = None,
+    embed_model: Optional[str] = None,
+    embed_threads: Optional[int] = None,
+    embed_inter_op_threads: Optional[int] = None,
+    keyphrase_persist: bool = False,
+    embed_encoding: str = "float32",
+    embed_dim: Optional[int] = None,
+    embed_dedup: Optional[float] = DEFAULT_THRESHOLD,
+    embed_dedup_memory: int = DEFAULT_MEMORY,
+    rollup_windows: Sequence[int] = DEFAULT_WINDOWS,
+    redact: bool = True,
+    redact_terms: Sequence[str] = (),
+    on_start: Optional[Callable[[Dict[str, Any]], None]] = None,
+):
+    """
+    Runs a capture session until Ctrl+C or until `stop_event` is set.
+    `sampler="auto"` follows X11 focus/title changes via PropertyNotify,
+    `"poll"` re-reads X11 every `poll_ms`, `"stub"` forces the synthetic
+    sampler (benchmarks, headless tests).
+    `max_poll_ms` lets the sampler back off exponentially from `poll_ms` up
+    to this interval while the user is idle (no input, no context change).
+    `queue_capacity`/`queue_overflow` size the sampler channel and choose
+    what a full one loses (see QUEUE_OVERFLOW).
+    `embed_backend`/`embed_model` select the embedding backend (see backends.py).
+    `keyphrase_persist` keeps keyphrase document frequencies across sessions.
+    `embed_encoding`/`embed_dim` compact the emitted vectors (see quantize.py).
+    `embed_dedup` is the similarity from which a text is skipped as a
+    near-duplicate of one of the last `embed_dedup_memory` texts of its app
+    (see dedup.py); None embeds every text.
+    `rollup_windows` are the tumbling windows (seconds) of the dwell-time
+    rollups, written to their own segment stream (see rollup.py); empty
+    disables them.
+    `redact` replaces secrets and PII in titles and clipboard text before
+    anything is written or embedded; `redact_terms` are extra words or names
+    to redact (see redact.py).
+    `on_start` is called once capture runs, with the session's worker, cache,
+    sink and writer (the daemon reads their live stats).
+    """
     if poll_ms <= 0:
         raise ValueError(f"poll_ms must be positive (got {poll_ms})")
+    if max_poll_ms is not None and max_poll_ms < poll_ms:
+        raise ValueError(f"max_poll_ms must not be below poll_ms (got {max_poll_ms} < {poll_ms})")
+    if queue_capacity <= 0:
+        raise ValueError(f"queue_capacity must be positive (got {queue_capacity})")
+    if queue_overflow not in QUEUE_OVERFLOW:
+        raise ValueError(f"queue_overflow must be one of {', '.join(QUEUE_OVERFLOW)} (got {queue_overflow!r})")
+    if heartbeat_ms < 0:
+        raise ValueError(f"heartbeat_ms must not be negative (got {heartbeat_ms})")
     cfg = {
         "clipboard_allowed": bool(clipboard),
         "screenshots_allowed": False,
         "poll_interval_ms": int(poll_ms),
+        # change: the sampler emits only context changes, heartbeats and closing records (dwell_ms)
+        "emit_mode": "change" if change_only else "every",
+        "heartbeat_ms": int(heartbeat_ms),
+        "sampler": sampler,
+        "queue_capacity": int(queue_capacity),
+        "overflow": queue_overflow,
     }
-    start_session(session_id, cfg)
+    if max_poll_ms is not None:
+        cfg["max_poll_interval_ms"] = int(max_poll_ms)
+    wal_dir = WAL_DIR if wal_dir is None else wal_dir
+    rollup_writer: Optional[SegmentedWalWriter] = None
+    def _retention(_sealed=None):
+        removed = enforce_retention(
+            wal_dir,
+            max_age_days=retention_days,
+            max_bytes=retention_bytes,
+            protect=[w.path for w in (writer, rollup_writer) if w is not None],
+        )
+        for p in removed:
+            print(f"mitschreiber: retention removed {p.name}", file=sys.stderr)
+        if cache is not None and retention_days is not None:
+            # Cached vectors of titles must not outlive the WAL they came from.
+            stale = cache.prune(retention_days)
+            if stale:
+                print(f"mitschreiber: retention removed {stale} cached embedding(s)", file=sys.stderr)
+
+    compaction = Compaction(embed_encoding, embed_dim)
+    # How often a quiet context is re-emitted: every (backed-off) poll, or per
+    # heartbeat in change-only mode (checked on a poll, so never more often).
+    poll_ceiling_ms = max_poll_ms or poll_ms
+    confirm_ms = (max(heartbeat_ms, poll_ceiling_ms) if heartbeat_ms else 0) if change_only else poll_ceiling_ms
+    rollups = (
+        RollupAggregator(session_id, rollup_windows, max_gap_s=gap_limit(confirm_ms)) if rollup_windows else None
+    )
+    dedup = NearDuplicateGate(embed_dedup, embed_dedup_memory) if embed and embed_dedup is not None else None
+    redactor = Redactor(redact_terms) if redact else None
+
+    # Load the model before capture starts: a bad model path fails here, not in the worker.
+    backend: Optional[EmbeddingBackend] = None
+    if embed:
+        backend = _select_backend(embed_backend, embed_model, embed_threads, embed_inter_op_threads)
 
-    wal_path = WAL_DIR / f"session-{session_id}.jsonl"
+    # Fail before capture starts if shipping is requested but not configured.
+    sink = ChronikSink.from_env(wal_dir=wal_dir) if ship else None
 
-    # Calculate poll interval in seconds
-    interval_sec = poll_ms / 1000.0
+    # Opt-in and loopback only; started before capture so a busy port fails fast.
+    metrics = MetricsServer(metrics_port).start() if metrics_port is not None else None
 
+    start_session(session_id, cfg)
+
+    worker: Optional[EmbedWorker] = None
+    collector = None
+    cache: Optional[EmbeddingCache] = None
+    keyphraser: Optional[KeyphraseEngine] = None
     try:
-        with WalWriter(wal_path) as writer:
-            next_tick = time.time()
-            while True:
-                # Poll state now returns a list of JSON strings
-                raw_events = poll_state(session_id)
-
-                for raw_evt in raw_events:
-                    evt = json.loads(raw_evt)
-                    # Normalisieren & schreiben
-                    # Note: We prefer the timestamp from Rust (evt["ts"]) if available for precision
-                    if "ts" not in evt:
-                        evt["ts"] = now_iso()
-                    evt["source"] = "os.context.state"
-                    evt["session"] = session_id
-                    writer.append(evt)
-
-                    if embed:
-                        if HAS_EMBED:
-                            # Use real embedding logic if available
-                            text_content = _embed_text_from_evt(evt)
-                            if not text_content:
-                                # Nothing meaningful to embed
-                                continue
-                            eevt, _ = build_embed_event(
-                                text=text_content,
-                                session=session_id,
-                                app=evt.get("app", ""),
-                                window=evt.get("window", "")
-                            )
-                        else:
-                            # Fallback to stub
-                            global _WARNED_EMBED_FALLBACK
-                            if not _WARNED_EMBED_FALLBACK:
-                                msg = "mitschreiber: --embed requested but embed module unavailable; using stub fallback"
-                                if EMBED_IMPORT_ERROR is not None:
-                                    msg += f" (reason: {EMBED_IMPORT_ERROR!r})"
-                                print(msg, file=sys.stderr)
-                                _WARNED_EMBED_FALLBACK = True
-                            eevt = _emit_embed(evt)
-
-                        if eevt:
-                            writer.append(eevt)
-
-                # Drift-corrected sleep
-                next_tick += interval_sec
-                sleep_time = next_tick - time.time()
-                if sleep_time > 0:
-                    time.sleep(sleep_time)
-                else:
-                    # If we are behind, just update next_tick to now to avoid burst catch-up
-                    next_tick = time.time()
+        # Group commit: each poll batch (plus any embed events) is one write() under one flock().
+        # Segments roll over by size/age; sealed ones are compressed and trigger retention.
+        segmented = functools.partial(
+            SegmentedWalWriter,
+            wal_dir,
+            max_segment_bytes=segment_bytes,
+            max_segment_age_s=segment_age_s,
+            compression=compression,
+            on_sealed=_retention,
+            group_commit=True,
+            durability=durability,
+            sync_interval_ms=sync_interval_ms,
+            fmt=wal_format,
+            index=True,
+        )
+        # Rollups get their own small stream, so `report` never reads the state ticks.
+        with segmented(f"session-{session_id}") as writer, (
+            segmented(f"{ROLLUP_PREFIX}-{session_id}") if rollups is not None else contextlib.nullcontext()
+        ) as rollup_writer:
+            if embed:
+                if embed_cache_size > 0:
+                    cache = EmbeddingCache(
+                        max_entries=embed_cache_size,
+                        path=DEFAULT_CACHE_PATH if embed_cache_persist else None,
+                    )
+                keyphraser = KeyphraseEngine(path=DEFAULT_KEYPHRASE_PATH if keyphrase_persist else None)
+                # Embedding runs off the poll loop so a slow model never delays state events.
+                worker = EmbedWorker(
+                    writer,
+                    functools.partial(
+                        _build_embed_batch,
+                        backend=backend,
+                        cache=cache,
+                        keyphraser=keyphraser,
+                        compaction=compaction,
+                        dedup=dedup,
+                    ),
+                    max_batch=embed_batch,
+                    max_delay_ms=embed_delay_ms,
+                    queue_size=embed_queue,
+                )
+                worker.start()
+            # After the cache is open, so retention covers it too.
+            _retention()
+            if sink is not None:
+                # Tails the WAL in its own thread: chronik outages never block capture.
+                try:
+                    sink.start()
+                except SinkError as exc:
+                    print(f"mitschreiber: not shipping: {exc}", file=sys.stderr)
+                    sink = None
+            if metrics is not None:
+                collector = _session_collector(session_id, worker, cache, sink, dedup, redactor)
+                REGISTRY.add_collector(collector)
+            if on_start is not None:
+                on_start(
+                    {
+                        "worker": worker,
+                        "cache": cache,
+                        "sink": sink,
+                        "writer": writer,
+                        "dedup": dedup,
+                        "redact": redactor,
+                    }
+                )
+            try:
+                while stop_event is None or not stop_event.is_set():
+                    # Event-driven: blocks in Rust with the GIL released until states arrive.
+                    # The buffer holds normalized JSONL records (source/session filled in Rust)
+                    # and is appended verbatim: no per-event parse/dump round trip. The
+                    # redactor re-serializes only records it changed.
+                    raw = poll_state_wait(session_id, _WAIT_SLICE_MS, _MAX_EVENTS_PER_WAIT)
+                    records = None
+                    if raw:
+                        _POLL_BATCH.observe(raw.count(b"\n"))
+                        if redactor is not None:
+                            raw, records = redactor.redact_jsonl(raw)
+                    writer.append_raw(raw)
+
+                    if (worker is not None or rollups is not None) and raw:
+                        if records is None:
+                            records = [json.loads(line) for line in raw.splitlines()]
+                        for evt in records:
+                            if rollups is not None:
+                                for rollup in rollups.observe(evt):
+                                    rollup_writer.append(rollup)
+                            # Closing records repeat the previous context; nothing new to embed.
+                            if worker is not None and "dwell_ms" not in evt:
+                                worker.submit(evt)
+                    if rollups is not None:
+                        # Windows close on time, even while no state arrives.
+                        for rollup in rollups.advance(time.time()):
+                            rollup_writer.append(rollup)
+                        rollup_writer.commit()
+                    writer.commit()
+            finally:
+                if rollups is not None:
+                    # Partial windows, so a short session still shows up in reports.
+                    for rollup in rollups.flush(time.time()):
+                        rollup_writer.append(rollup)
+                    rollup_writer.commit()
+                # Drain pending embeddings while the WAL is still open.
+                if worker is not None:
+                    worker.close()
+                    _report_embed_stats(
+                        session_id,
+                        worker.stats(),
+                        cache.stats() if cache else None,
+                        dedup.stats() if dedup else None,
+                    )
+                if redactor is not None:
+                    _report_redact_stats(session_id, redactor.stats())
+                if cache is not None:
+                    cache.close()
+                if keyphraser is not None:
+                    keyphraser.save()
 
     except KeyboardInterrupt:
         pass
     finally:
+        if collector is not None:
+            REGISTRY.remove_collector(collector)
+        if metrics is not None:
+            metrics.close()
         stop_session(session_id)
+        if sink is not None:
+            # After the WAL is closed, so the sealed last segment is shipped too.
+            sink.stop()
+            _report_sink_stats(session_id, sink.stats())
 
 # Für CLI import
-__all__ = ["run_session", "SESSIONS_DIR"]
+__all__ = ["run_session", "SESSIONS_DIR", "WalWriter"]
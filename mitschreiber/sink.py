@@ -0,0 +1,363 @@
+"""
+chronik HTTP sink: ships WAL records to CHRONIK_INGEST_URL.
+
+The sink tails the WAL segments (it never sits between the sampler and the
+WAL, so a slow or unreachable chronik cannot stall capture) and POSTs
+NDJSON batches bounded by record count, bytes and age over one persistent
+keep-alive connection. Failed batches are retried with exponential backoff
+and full jitter; while retrying nothing new is read, so the backlog stays on
+disk in the WAL (backpressure) instead of in memory.
+
+Delivery is at-least-once: a durable checkpoint maps each segment (by its
+uncompressed name, so sealing does not reset it) to the byte offset up to
+which chronik acknowledged records, and is replaced atomically only after a
+2xx response. A restart resumes from there; a crash between the response and
+the checkpoint write can resend one batch.
+"""
+from __future__ import annotations
+import fcntl
+import http.client
+import json
+import os
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from .paths import SINK_DIR, WAL_DIR
+from .retention import wal_segments
+from .walio import is_sealed, iter_lines_from, segment_key
+
+DEFAULT_CHECKPOINT_PATH = SINK_DIR / "chronik.checkpoint.json"
+
+# Statuses worth retrying: auth/config problems that an operator can fix,
+# timeouts, rate limits and server errors. Other 4xx mean the batch itself is
+# unacceptable and retrying it would block the sink forever.
+_RETRY_STATUSES = {401, 403, 408, 425, 429}
+
+_Update = Tuple[str, int, bool]
+
+
+class SinkError(Exception):
+    pass
+
+
+def _atomic_write_json(path: Path, obj: Dict[str, Any]):
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as fp:
+        json.dump(obj, fp)
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.replace(tmp, path)
+
+
+class ChronikSink:
+    def __init__(
+        self,
+        url: str,
+        token: Optional[str] = None,
+        *,
+        wal_dir: Path = WAL_DIR,
+        checkpoint_path: Path = DEFAULT_CHECKPOINT_PATH,
+        batch_records: int = 500,
+        batch_bytes: int = 1 << 20,
+        max_delay_ms: int = 1000,
+        poll_ms: int = 500,
+        timeout_s: float = 10.0,
+        backoff_base_s: float = 0.5,
+        backoff_max_s: float = 60.0,
+    ):
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError(f"chronik URL must be http(s)://host/... (got {url!r})")
+        if batch_records <= 0 or batch_bytes <= 0:
+            raise ValueError("batch_records and batch_bytes must be positive")
+        if max_delay_ms < 0 or poll_ms <= 0:
+            raise ValueError("max_delay_ms must not be negative and poll_ms must be positive")
+        self.url = url
+        self._scheme, self._host, self._port = parts.scheme, parts.hostname, parts.port
+        self._target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        self.token = token
+        self.wal_dir = wal_dir
+        self.checkpoint_path = checkpoint_path
+        self.batch_records = batch_records
+        self.batch_bytes = batch_bytes
+        self.max_delay = max_delay_ms / 1000.0
+        self.poll = poll_ms / 1000.0
+        self.timeout_s = timeout_s
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+
+        self._conn: Optional[http.client.HTTPConnection] = None
+        self._lock_fp = None
+        self._checkpoint: Dict[str, Dict[str, Any]] = {}
+        # Read positions run ahead of the checkpoint by the batch in flight.
+        self._read: Dict[str, Dict[str, Any]] = {}
+        self._batch: List[bytes] = []
+        self._batch_size = 0
+        self._batch_started = 0.0
+        self._updates: Dict[str, _Update] = {}
+        self.thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+        self._stats_lock = threading.Lock()
+        self.sent_records = 0
+        self.sent_batches = 0
+        self.sent_bytes = 0
+        self.retries = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_env(cls, **kwargs) -> "ChronikSink":
+        url = os.environ.get("CHRONIK_INGEST_URL")
+        if not url:
+            raise ValueError("CHRONIK_INGEST_URL is not set")
+        return cls(url, os.environ.get("CHRONIK_TOKEN") or None, **kwargs)
+
+    # -- checkpoint ---------------------------------------------------------
+
+    def _acquire(self):
+        """
+        Loads the checkpoint and takes an exclusive lock on it, so two sinks
+        (e.g. `mitschreiber ship` next to `start --ship`) never ship twice.
+        """
+        self.checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock_fp = open(self.checkpoint_path.with_name(self.checkpoint_path.name + ".lock"), "a")
+        try:
+            fcntl.flock(self._lock_fp, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lock_fp.close()
+            self._lock_fp = None
+            raise SinkError("another sink is already shipping this WAL")
+        try:
+            self._checkpoint = json.loads(self.checkpoint_path.read_text(encoding="utf-8"))["segments"]
+        except FileNotFoundError:
+            self._checkpoint = {}
+        self._read = {k: dict(v) for k, v in self._checkpoint.items()}
+
+    def _release(self):
+        self._close_conn()
+        if self._lock_fp is not None:
+            self._lock_fp.close()
+            self._lock_fp = None
+
+    def _save_checkpoint(self):
+        _atomic_write_json(self.checkpoint_path, {"url": self.url, "segments": self._checkpoint})
+
+    def checkpoint(self) -> Dict[str, Dict[str, Any]]:
+        return {k: dict(v) for k, v in self._checkpoint.items()}
+
+    # -- HTTP ---------------------------------------------------------------
+
+    def _connection(self) -> http.client.HTTPConnection:
+        if self._conn is None:
+            cls = http.client.HTTPSConnection if self._scheme == "https" else http.client.HTTPConnection
+            self._conn = cls(self._host, self._port, timeout=self.timeout_s)
+        return self._conn
+
+    def _close_conn(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _post(self, body: bytes) -> Tuple[int, Optional[str]]:
+        headers = {"Content-Type": "application/x-ndjson", "Content-Length": str(len(body))}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        for reused in (self._conn is not None, False):
+            conn = self._connection()
+            try:
+                conn.request("POST", self._target, body=body, headers=headers)
+                resp = conn.getresponse()
+                # Drain the body so the connection can be reused.
+                resp.read()
+                break
+            except (OSError, http.client.HTTPException):
+                self._close_conn()
+                if not reused:
+                    raise
+                # The server dropped the idle keep-alive connection: reconnect once right away.
+        if resp.will_close:
+            self._close_conn()
+        return resp.status, resp.getheader("Retry-After")
+
+    def _backoff(self, attempt: int, retry_after: Optional[str]) -> float:
+        delay = random.uniform(0, min(self.backoff_max_s, self.backoff_base_s * (2 ** attempt)))
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, min(float(retry_after), self.backoff_max_s))
+        return delay
+
+    def _deliver(self, lines: List[bytes]) -> bool:
+        """
+        Sends one batch until it is acknowledged or rejected. Returns False if
+        the sink was stopped before that (the batch is resent next time).
+        """
+        body = b"".join(lines)
+        attempt = 0
+        while True:
+            try:
+                status, retry_after = self._post(body)
+            except (OSError, http.client.HTTPException) as exc:
+                status, retry_after, reason = None, None, repr(exc)
+            else:
+                reason = f"HTTP {status}"
+                if 200 <= status < 300:
+                    with self._stats_lock:
+                        self.sent_records += len(lines)
+                        self.sent_batches += 1
+                        self.sent_bytes += len(body)
+                    return True
+                if status == 413 and len(lines) > 1:
+                    mid = len(lines) // 2
+                    return self._deliver(lines[:mid]) and self._deliver(lines[mid:])
+                if status < 500 and status not in _RETRY_STATUSES:
+                    with self._stats_lock:
+                        self.rejected += len(lines)
+                    print(f"mitschreiber sink: chronik rejected {len(lines)} record(s) ({reason})", file=sys.stderr)
+                    return True
+            with self._stats_lock:
+                self.retries += 1
+            delay = self._backoff(attempt, retry_after)
+            if attempt == 0 or attempt % 10 == 0:
+                print(f"mitschreiber sink: {reason}; retrying in {delay:.1f}s", file=sys.stderr)
+            attempt += 1
+            if self._stop.wait(delay):
+                return False
+
+    # -- batching -----------------------------------------------------------
+
+    def _add(self, line: bytes, update: _Update):
+        if not self._batch:
+            self._batch_started = time.monotonic()
+        self._batch.append(line)
+        self._batch_size += len(line)
+        self._updates[update[0]] = update
+
+    def _batch_full(self) -> bool:
+        return len(self._batch) >= self.batch_records or self._batch_size >= self.batch_bytes
+
+    def _flush(self) -> bool:
+        if self._batch and not self._deliver(self._batch):
+            return False
+        for key, offset, done in self._updates.values():
+            self._checkpoint[key] = {"offset": offset, "done": done}
+        if self._batch or self._updates:
+            self._save_checkpoint()
+        self._batch, self._batch_size, self._updates = [], 0, {}
+        return True
+
+    def _pump(self) -> bool:
+        """
+        Reads everything appended since the last call, sending full batches on
+        the way. Returns True if anything new was read.
+        """
+        progressed = False
+        segments = wal_segments(self.wal_dir)
+        for path in segments:
+            key = segment_key(path)
+            seg = self._read.setdefault(key, {"offset": 0, "done": False})
+            if seg["done"]:
+                continue
+            try:
+                for end, line in iter_lines_from(path, seg["offset"]):
+                    seg["offset"] = end
+                    self._add(line, (key, end, False))
+                    progressed = True
+                    if self._batch_full() and not self._flush():
+                        return progressed
+            except FileNotFoundError:
+                # Sealed under our feet; the compressed file continues at the same offset.
+                continue
+            if is_sealed(path):
+                # Nothing follows a sealed segment's end; checkpoint that even without new records.
+                seg["done"] = True
+                self._updates[key] = (key, seg["offset"], True)
+
+        present = {segment_key(p) for p in segments}
+        for key in [k for k in self._read if k not in present]:
+            # Deleted by retention.
+            self._checkpoint.pop(key, None)
+            del self._read[key]
+        return progressed
+
+    # -- running ------------------------------------------------------------
+
+    def ship(self, follow: bool = False) -> Dict[str, int]:
+        """
+        Ships the WAL; with follow=True keeps tailing until stop() is called.
+        """
+        self._acquire()
+        self._run(follow)
+        return self.stats()
+
+    def _run(self, follow: bool):
+        try:
+            while not self._stop.is_set():
+                progressed = self._pump()
+                if self._stop.is_set():
+                    break
+                if not follow or self._flush_due():
+                    if not self._flush():
+                        break
+                if not progressed:
+                    if not follow:
+                        break
+                    self._stop.wait(self.poll)
+            if self._stop.is_set():
+                # Stopping: one bounded last attempt for what was already read.
+                self._flush_final()
+        finally:
+            self._release()
+
+    def _flush_due(self) -> bool:
+        if not self._batch:
+            # Only checkpoint updates (segments found sealed): nothing to send.
+            return bool(self._updates)
+        return time.monotonic() - self._batch_started >= self.max_delay
+
+    def _flush_final(self):
+        self._stop.clear()
+        timer = threading.Timer(self.timeout_s, self._stop.set)
+        timer.start()
+        try:
+            # Pick up the records written while shutting down (e.g. the sealed last segment).
+            self._pump()
+            self._flush()
+        finally:
+            timer.cancel()
+
+    def start(self):
+        if self.thread is not None:
+            return
+        # Synchronously, so a second sink fails here with SinkError.
+        self._acquire()
+        self._stop.clear()
+        self.thread = threading.Thread(target=self._run, args=(True,), name="mitschreiber-sink", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def stats(self) -> Dict[str, int]:
+        with self._stats_lock:
+            return {
+                "sent_records": self.sent_records,
+                "sent_batches": self.sent_batches,
+                "sent_bytes": self.sent_bytes,
+                "retries": self.retries,
+                "rejected": self.rejected,
+                "pending": len(self._batch),
+            }
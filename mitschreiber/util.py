@@ -6,3 +6,13 @@ ISO = "%Y-%m-%dT%H:%M:%S.%fZ"
 
 def now_iso() -> str:
     return datetime.now(timezone.utc).strftime(ISO)
+
+def parse_ts(ts: str) -> float:
+    """
+    Parses an ISO-8601 timestamp (Rust RFC 3339 or now_iso() form) into epoch seconds.
+    Timestamps without offset are taken as UTC.
+    """
+    dt = datetime.fromisoformat(ts)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
@@ -0,0 +1,318 @@
+"""
+On-device vector index over os.context.text.embed records.
+
+Layout under INDEX_DIR/<model-slug>/:
+
+    vectors.f32   L2-normalized float32 rows, memory-mapped for search
+    meta.jsonl    one line per row (ts, session, app, window, keyphrases, hash_id)
+    meta.off      uint64 byte offset of each meta line
+    state.json    model, dim, row count and the read position per WAL segment
+    ivf.npz       optional inverted file (centroids + int8 codes), see build_ivf()
+
+An index holds one model's vectors: for_model() fixes the model up front and
+update() skips embed records of any other model (their dimension and vector
+space differ). update() reads only what was appended to the WAL since the last run (byte
+offsets per segment, keyed by the uncompressed segment name so sealing does not
+reset them) and skips texts already indexed (hash_id). Rows are appended before
+state.json is replaced atomically; a crash in between leaves trailing rows that
+the next open truncates.
+
+Search is exact brute force (one matrix-vector product) by default. With an
+IVF built, only the nprobe closest lists are scored on int8 codes and the best
+candidates are re-ranked exactly; rows added after the build are still scanned
+exhaustively until the IVF is rebuilt.
+
+Requires NumPy: pip install mitschreiber[search]
+"""
+from __future__ import annotations
+import json
+import os
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from .paths import INDEX_DIR
+from .quantize import dequantize
+from .retention import wal_segments
+from .walio import is_sealed, iter_records_from, segment_key
+
+EMBED_SOURCE = "os.context.text.embed"
+_EMBED_MARKER = EMBED_SOURCE.encode()
+
+_META_FIELDS = ("ts", "session", "app", "window", "keyphrases", "hash_id")
+
+# IVF candidates re-ranked exactly per requested result.
+_RERANK_FACTOR = 8
+
+
+def model_slug(model: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", model).strip("_") or "default"
+
+
+def _atomic_write_json(path: Path, obj: Dict[str, Any]):
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as fp:
+        json.dump(obj, fp)
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.replace(tmp, path)
+
+
+def _normalize(mat: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(mat, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+
+def _truncate(path: Path, size: int):
+    if path.exists() and path.stat().st_size > size:
+        with open(path, "r+b") as fp:
+            fp.truncate(size)
+
+
+class VectorIndex:
+    def __init__(self, directory: Path, model: Optional[str] = None):
+        self.dir = Path(directory)
+        self.vectors_path = self.dir / "vectors.f32"
+        self.meta_path = self.dir / "meta.jsonl"
+        self.off_path = self.dir / "meta.off"
+        self.state_path = self.dir / "state.json"
+        self.ivf_path = self.dir / "ivf.npz"
+        try:
+            self.state: Dict[str, Any] = json.loads(self.state_path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            self.state = self._empty_state(model)
+        if model is not None and self.model not in (None, model):
+            # Filled from another model's records (older versions took the first
+            # model in the WAL): start over, update() rebuilds it from the WAL.
+            self.state = self._empty_state(model)
+            self.ivf_path.unlink(missing_ok=True)
+        self._ivf: Optional[Dict[str, np.ndarray]] = None
+
+    @staticmethod
+    def _empty_state(model: Optional[str]) -> Dict[str, Any]:
+        return {"model": model, "dim": None, "count": 0, "segments": {}}
+
+    @classmethod
+    def for_model(cls, model: str, root: Path = INDEX_DIR) -> "VectorIndex":
+        return cls(root / model_slug(model), model=model)
+
+    @property
+    def model(self) -> Optional[str]:
+        return self.state.get("model")
+
+    @property
+    def dim(self) -> Optional[int]:
+        return self.state.get("dim")
+
+    def __len__(self) -> int:
+        return int(self.state["count"])
+
+    # -- building -----------------------------------------------------------
+
+    def _repair(self):
+        """
+        Drops rows written after the last committed state (crash mid-update).
+        """
+        n, dim = len(self), self.dim or 0
+        _truncate(self.vectors_path, n * dim * 4)
+        _truncate(self.off_path, n * 8)
+        if n and self.off_path.exists():
+            offs = np.fromfile(self.off_path, dtype="<u8", count=n)
+            with open(self.meta_path, "rb") as fp:
+                fp.seek(int(offs[-1]))
+                last = fp.readline()
+            _truncate(self.meta_path, int(offs[-1]) + len(last))
+        else:
+            _truncate(self.meta_path, 0)
+
+    def _known_hashes(self) -> Set[str]:
+        known: Set[str] = set()
+        if not self.meta_path.exists():
+            return known
+        with open(self.meta_path, "rb") as fp:
+            for line in fp:
+                h = json.loads(line).get("hash_id")
+                if h:
+                    known.add(h)
+        return known
+
+    def update(self, wal_dir: Path) -> int:
+        """
+        Appends embed records that landed in the WAL since the last update.
+        Returns the number of new rows.
+        """
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._repair()
+        segments: Dict[str, Dict[str, Any]] = self.state["segments"]
+        known = self._known_hashes()
+        rows: List[List[float]] = []
+        metas: List[bytes] = []
+
+        for path in wal_segments(wal_dir):
+            key = segment_key(path)
+            seg = segments.get(key, {"offset": 0, "done": False})
+            if seg["done"]:
+                continue
+            pos = seg["offset"]
+            try:
+                for pos, rec in iter_records_from(path, seg["offset"], contains=_EMBED_MARKER):
+                    if rec is None or rec.get("source") != EMBED_SOURCE:
+                        continue
+                    meta = rec.get("meta") or {}
+                    vec = rec.get("embedding")
+                    model = meta.get("model")
+                    if not vec or rec.get("hash_id") in known:
+                        continue
+                    if self.model is None:
+                        self.state["model"] = model
+                    if model != self.model:
+                        # Another backend's vectors live in their own index.
+                        continue
+                    if self.dim is None:
+                        self.state["dim"] = len(vec)
+                    if len(vec) != self.dim:
+                        # Truncated to another --embed-dim: not comparable.
+                        continue
+                    known.add(rec.get("hash_id"))
+                    rows.append(dequantize(vec, meta))
+                    metas.append(
+                        json.dumps({k: rec.get(k) for k in _META_FIELDS}, ensure_ascii=False).encode("utf-8")
+                        + b"\n"
+                    )
+            except FileNotFoundError:
+                # Sealed or deleted by retention while we were reading it.
+                continue
+            # A sealed segment never grows again; anything else may.
+            segments[key] = {"offset": pos, "done": is_sealed(path)}
+
+        present = {segment_key(p) for p in wal_segments(wal_dir)}
+        for key in [k for k in segments if k not in present]:
+            # Deleted by retention; its rows stay searchable.
+            del segments[key]
+
+        if rows:
+            mat = _normalize(np.asarray(rows, dtype=np.float32))
+            with open(self.vectors_path, "ab") as fp:
+                fp.write(mat.astype("<f4").tobytes())
+            with open(self.meta_path, "ab") as meta_fp, open(self.off_path, "ab") as off_fp:
+                off = meta_fp.tell()
+                offs = np.empty(len(metas), dtype="<u8")
+                for i, line in enumerate(metas):
+                    offs[i] = off
+                    off += len(line)
+                meta_fp.write(b"".join(metas))
+                off_fp.write(offs.tobytes())
+            self.state["count"] = len(self) + len(rows)
+        _atomic_write_json(self.state_path, self.state)
+        return len(rows)
+
+    # -- searching ----------------------------------------------------------
+
+    def vectors(self) -> np.ndarray:
+        if not len(self):
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return np.memmap(self.vectors_path, dtype="<f4", mode="r", shape=(len(self), self.dim))
+
+    def _load_ivf(self) -> Optional[Dict[str, np.ndarray]]:
+        if self._ivf is None and self.ivf_path.exists():
+            with np.load(self.ivf_path) as data:
+                self._ivf = {k: data[k] for k in data.files}
+        return self._ivf
+
+    def metadata(self, rows: List[int]) -> List[Dict[str, Any]]:
+        offs = np.memmap(self.off_path, dtype="<u8", mode="r", shape=(len(self),))
+        out = []
+        with open(self.meta_path, "rb") as fp:
+            for row in rows:
+                fp.seek(int(offs[row]))
+                out.append(json.loads(fp.readline()))
+        return out
+
+    def search_rows(self, query: np.ndarray, k: int = 10, nprobe: Optional[int] = None) -> List[Tuple[int, float]]:
+        """
+        Returns the k (row, cosine similarity) pairs closest to `query`, best first.
+        """
+        if k <= 0:
+            raise ValueError(f"k must be positive (got {k})")
+        q = _normalize(np.asarray(query, dtype=np.float32).reshape(-1))
+        if self.dim is not None and q.shape[0] != self.dim:
+            raise ValueError(f"query has dimension {q.shape[0]}, index has {self.dim}")
+        vecs = self.vectors()
+        ivf = self._load_ivf() if nprobe else None
+        if ivf is None:
+            rows = np.arange(len(vecs))
+        else:
+            rows = self._ivf_candidates(ivf, q, k, nprobe)
+        if not len(rows):
+            return []
+        scores = vecs[rows] @ q if ivf is not None else vecs @ q
+        top = min(k, len(rows))
+        best = np.argpartition(-scores, top - 1)[:top]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [(int(rows[i]), float(scores[i])) for i in best]
+
+    def _ivf_candidates(self, ivf: Dict[str, np.ndarray], q: np.ndarray, k: int, nprobe: int) -> np.ndarray:
+        centroids, starts = ivf["centroids"], ivf["starts"]
+        probe = np.argsort(-(centroids @ q))[:nprobe]
+        members = np.concatenate([np.arange(starts[c], starts[c + 1]) for c in probe])
+        approx = (ivf["codes"][members].astype(np.float32) @ q) * ivf["scales"][members]
+        keep = min(len(members), k * _RERANK_FACTOR)
+        if keep:
+            members = members[np.argpartition(-approx, keep - 1)[:keep]]
+        # Rows appended after the IVF was built are scanned exhaustively.
+        fresh = np.arange(int(ivf["count"]), len(self))
+        return np.sort(np.concatenate([ivf["order"][members], fresh]).astype(np.int64))
+
+    def search(self, query: np.ndarray, k: int = 10, nprobe: Optional[int] = None) -> List[Dict[str, Any]]:
+        hits = self.search_rows(query, k, nprobe)
+        metas = self.metadata([row for (row, _) in hits])
+        return [dict(meta, score=score) for (meta, (_, score)) in zip(metas, hits)]
+
+    # -- IVF ----------------------------------------------------------------
+
+    def build_ivf(self, nlist: Optional[int] = None, iters: int = 10, sample: int = 65536, seed: int = 0) -> int:
+        """
+        Clusters the rows (spherical k-means on a sample) and stores each list's
+        rows as int8 codes with a per-row scale. Returns the number of lists.
+        """
+        vecs = self.vectors()
+        n = len(vecs)
+        if n == 0:
+            raise ValueError("index is empty")
+        nlist = nlist or max(1, int(np.sqrt(n)))
+        if nlist <= 0 or nlist > n:
+            raise ValueError(f"nlist must be between 1 and {n} (got {nlist})")
+        rng = np.random.default_rng(seed)
+        train = np.asarray(vecs[np.sort(rng.choice(n, size=min(n, max(sample, nlist)), replace=False))])
+        centroids = train[rng.choice(len(train), size=nlist, replace=False)].copy()
+        for _ in range(iters):
+            assign = np.argmax(train @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = train[assign == c]
+                if len(members):
+                    centroids[c] = members.sum(axis=0)
+            centroids = _normalize(centroids)
+
+        assign = np.empty(n, dtype=np.int32)
+        for start in range(0, n, 65536):
+            assign[start:start + 65536] = np.argmax(vecs[start:start + 65536] @ centroids.T, axis=1)
+        order = np.argsort(assign, kind="stable")
+        starts = np.searchsorted(assign[order], np.arange(nlist + 1))
+        scales = np.empty(n, dtype=np.float32)
+        codes = np.empty((n, vecs.shape[1]), dtype=np.int8)
+        for start in range(0, n, 65536):
+            block = np.asarray(vecs[order[start:start + 65536]])
+            s = np.abs(block).max(axis=1) / 127.0
+            s[s == 0] = 1.0
+            scales[start:start + len(block)] = s
+            codes[start:start + len(block)] = np.round(block / s[:, None]).astype(np.int8)
+
+        tmp = self.ivf_path.with_name("ivf.tmp.npz")
+        np.savez(tmp, centroids=centroids.astype(np.float32), order=order, starts=starts,
+                 codes=codes, scales=scales, count=np.int64(n))
+        os.replace(tmp, self.ivf_path)
+        self._ivf = None
+        return nlist
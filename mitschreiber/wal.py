@@ -0,0 +1,395 @@
+"""
+Write-ahead log writer.
+
+Records are newline-delimited JSON appended to a session file. In group-commit
+mode appended records are buffered and written with one write() under one
+flock() per commit (the capture loop commits once per poll batch); otherwise
+every append is written immediately, as before.
+
+Durability policies:
+  none       no explicit flush; data reaches the OS when Python's buffer fills
+             or the file is closed (fastest, loses the tail on a crash)
+  flush      flush to the OS after every write/commit (survives process crashes)
+  fdatasync  flush + os.fdatasync() at most every sync_interval_ms or every
+             sync_every records, and on close (survives power loss up to the window)
+
+With fmt="binary" records are framed in the compact .mwal encoding
+(see walbin.py) instead of JSONL.
+
+SegmentedWalWriter splits a session into session-<UUID>-<seq>.jsonl (.mwal)
+segments that roll over by size or age; sealed segments are compressed in the
+background and the retention budget is enforced after each seal.
+
+While a writer has a file open (until a segment is sealed) it holds a shared
+flock() on <file>.lock, so retention in any process can tell live files from
+files left behind by a crash (see segment_in_use()).
+"""
+from __future__ import annotations
+import fcntl
+import gzip
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
+
+from . import walbin
+from .metrics import REGISTRY
+
+# walindex (and dataclasses) is only needed once a segment is written; the CLI
+# imports this module for its option choices and should stay light.
+if TYPE_CHECKING:
+    from .walindex import IndexBuilder
+
+WAL_FORMATS = ("jsonl", "binary")
+FORMAT_SUFFIXES = {"jsonl": ".jsonl", "binary": ".mwal"}
+DURABILITY_MODES = ("none", "flush", "fdatasync")
+COMPRESSION_MODES = ("gzip", "zstd", "none")
+COMPRESSED_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+
+# Auto-commit threshold so a writer nobody commits cannot grow without bound.
+_MAX_PENDING_BYTES = 1 << 20
+
+_WRITE_SECONDS = REGISTRY.histogram(
+    "mitschreiber_wal_write_seconds", "Latency of one WAL write incl. flock, flush and fdatasync."
+)
+_WRITTEN_BYTES = REGISTRY.counter("mitschreiber_wal_written_bytes_total", "Bytes appended to the WAL.")
+_WRITTEN_RECORDS = REGISTRY.counter("mitschreiber_wal_written_records_total", "Records appended to the WAL.")
+
+
+class WalWriter:
+    def __init__(
+        self,
+        path: Path,
+        *,
+        group_commit: bool = False,
+        durability: str = "flush",
+        sync_interval_ms: int = 1000,
+        sync_every: int = 0,
+        fmt: str = "jsonl",
+        index: bool = False,
+    ):
+        if fmt not in WAL_FORMATS:
+            raise ValueError(f"fmt must be one of {WAL_FORMATS} (got {fmt!r})")
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"durability must be one of {DURABILITY_MODES} (got {durability!r})")
+        if sync_interval_ms < 0 or sync_every < 0:
+            raise ValueError("sync_interval_ms and sync_every must not be negative")
+        self.path = path
+        self.file = None
+        self._held: Optional[int] = None
+        self.fmt = fmt
+        self.index = index
+        self._index: Optional[IndexBuilder] = None
+        self.group_commit = group_commit
+        self.durability = durability
+        self.sync_interval = sync_interval_ms / 1000.0
+        self.sync_every = sync_every
+        # flock() serializes processes; this lock serializes the capture loop
+        # and the embedding worker thread within this process.
+        self._lock = threading.Lock()
+        self._pending: List[bytes] = []
+        self._pending_bytes = 0
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def __enter__(self):
+        self._open()
+        return self
+
+    def _open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._held = _hold(self.path)
+        # Binary append: records arrive either as dicts or as ready-made JSONL bytes from Rust.
+        self.file = open(self.path, "ab")
+        if self.fmt == "binary" and self.file.tell() == 0:
+            self.file.write(walbin.MAGIC)
+            self.file.flush()
+        if self.index:
+            from .walindex import IndexBuilder
+
+            self._index = IndexBuilder(self.path)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if not self.file:
+            return
+        self.commit()
+        with self._lock:
+            self._close_file()
+
+    def _close_file(self):
+        if self.durability == "fdatasync" and self._unsynced:
+            self.file.flush()
+            os.fdatasync(self.file.fileno())
+            self._unsynced = 0
+        self.file.close()
+        self.file = None
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+        held, self._held = self._held, None
+        _release(self.path, held)
+
+    def append(self, obj: Dict[str, Any]):
+        if self.fmt == "binary":
+            self._append(walbin.encode_record(obj), 1)
+        else:
+            self._append((json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8"), 1)
+
+    def append_raw(self, data: bytes):
+        """
+        Appends pre-serialized, newline-terminated JSONL records as-is
+        (framed without parsing in binary format).
+        """
+        if not data:
+            return
+        records = data.count(b"\n")
+        if self.fmt == "binary":
+            data = walbin.frame_jsonl(data)
+        self._append(data, records)
+
+    def _append(self, data: bytes, records: int):
+        if not self.file:
+            return
+        _WRITTEN_RECORDS.inc(records)
+        with self._lock:
+            if not self.group_commit:
+                self._write(data, records)
+                return
+            self._pending.append(data)
+            self._pending_bytes += len(data)
+            self._unsynced += records
+            if self._pending_bytes >= _MAX_PENDING_BYTES:
+                self._commit_locked()
+
+    def commit(self):
+        """
+        Writes all buffered records with a single write() (group-commit mode).
+        """
+        if not self.file:
+            return
+        with self._lock:
+            self._commit_locked()
+
+    def _commit_locked(self):
+        if not self._pending:
+            return
+        data = b"".join(self._pending)
+        self._pending.clear()
+        self._pending_bytes = 0
+        # Record count was already added in append_raw.
+        self._write(data, 0)
+
+    def _before_write(self, nbytes: int):
+        """
+        Hook called under the lock before each write (used for segment rotation).
+        """
+
+    def _write(self, data: bytes, records: int):
+        t0 = time.perf_counter()
+        self._before_write(len(data))
+        self._unsynced += records
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+        try:
+            offset = self.file.tell()
+            self.file.write(data)
+            if self._index is not None:
+                self._index.note(offset, data)
+            if self.durability != "none":
+                self.file.flush()
+            if self.durability == "fdatasync" and self._sync_due():
+                os.fdatasync(self.file.fileno())
+                self._unsynced = 0
+                self._last_sync = time.monotonic()
+        finally:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+        _WRITE_SECONDS.observe(time.perf_counter() - t0)
+        _WRITTEN_BYTES.inc(len(data))
+
+    def _sync_due(self) -> bool:
+        if self.sync_every and self._unsynced >= self.sync_every:
+            return True
+        return time.monotonic() - self._last_sync >= self.sync_interval
+
+
+def lock_path_for(path: Path) -> Path:
+    return path.with_name(path.name + ".lock")
+
+
+def _hold(path: Path) -> int:
+    """
+    Marks `path` as being written: a shared flock on its .lock file, held until _release().
+    """
+    fd = os.open(lock_path_for(path), os.O_RDWR | os.O_CREAT, 0o600)
+    fcntl.flock(fd, fcntl.LOCK_SH)
+    return fd
+
+
+def _release(path: Path, fd: Optional[int]):
+    if fd is None:
+        return
+    lock_path_for(path).unlink(missing_ok=True)
+    os.close(fd)
+
+
+def segment_in_use(path: Path) -> bool:
+    """
+    True while a writer in any process still holds `path` open. A crashed
+    writer's lock is gone with its process, whatever the file's mtime says.
+    """
+    try:
+        fd = os.open(lock_path_for(path), os.O_RDONLY)
+    except FileNotFoundError:
+        return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return True
+    finally:
+        os.close(fd)
+    return False
+
+
+def compress_segment(path: Path, method: str = "gzip") -> Path:
+    """
+    Compresses a sealed segment next to the original and removes the original.
+    The compressed file appears atomically (written under a temporary name).
+    """
+    if method == "none":
+        return path
+    target = path.with_name(path.name + COMPRESSED_SUFFIXES[method])
+    tmp = target.with_name(target.name + ".tmp")
+    with open(path, "rb") as src:
+        if method == "gzip":
+            with gzip.open(tmp, "wb", compresslevel=6) as dst:
+                shutil.copyfileobj(src, dst, 1 << 20)
+        else:
+            import zstandard  # optional dependency: pip install mitschreiber[zstd]
+            with open(tmp, "wb") as raw:
+                zstandard.ZstdCompressor(level=3).copy_stream(src, raw)
+    os.replace(tmp, target)
+    path.unlink()
+    return target
+
+
+class SegmentedWalWriter(WalWriter):
+    """
+    WalWriter that rolls over to a new segment file once the current one
+    exceeds max_segment_bytes or is older than max_segment_age_s (0 = no limit).
+    Commits are never split across segments.
+
+    Sealed segments are handed to a single background thread that compresses
+    them and then calls on_sealed (e.g. retention enforcement).
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        prefix: str,
+        *,
+        max_segment_bytes: int = 64 << 20,
+        max_segment_age_s: float = 3600.0,
+        compression: str = "gzip",
+        on_sealed: Optional[Callable[[Path], None]] = None,
+        **kwargs,
+    ):
+        if compression not in COMPRESSION_MODES:
+            raise ValueError(f"compression must be one of {COMPRESSION_MODES} (got {compression!r})")
+        self.directory = directory
+        self.prefix = prefix
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segment_age_s = max_segment_age_s
+        self.compression = compression
+        self.on_sealed = on_sealed
+        self.fmt = kwargs.get("fmt", "jsonl")
+        self.seq = self._next_seq()
+        self._opened_at = time.monotonic()
+        self._segment_bytes = 0
+        # Lock of the segment just closed, handed to its seal job.
+        self._sealing: Optional[int] = None
+        from concurrent.futures import ThreadPoolExecutor
+
+        self._sealer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mitschreiber-seal")
+        super().__init__(self._segment_path(self.seq), **kwargs)
+
+    def _segment_path(self, seq: int) -> Path:
+        return self.directory / f"{self.prefix}-{seq:05d}{FORMAT_SUFFIXES[self.fmt]}"
+
+    def _next_seq(self) -> int:
+        # Continue after existing segments (sealed or not, any format) of the same prefix.
+        seqs = []
+        for p in self.directory.glob(f"{self.prefix}-*"):
+            tail = p.name[len(self.prefix) + 1:].split(".", 1)[0]
+            if tail.isdigit():
+                seqs.append(int(tail))
+        return max(seqs) + 1 if seqs else 0
+
+    def _open(self):
+        super()._open()
+        self._opened_at = time.monotonic()
+        self._segment_bytes = self.file.tell()
+
+    def _close_file(self):
+        # The segment stays marked as in use until it is compressed: the seal
+        # job still reads it, and retention must not delete it meanwhile.
+        self._sealing, self._held = self._held, None
+        super()._close_file()
+
+    def _header_bytes(self) -> int:
+        return len(walbin.MAGIC) if self.fmt == "binary" else 0
+
+    def _before_write(self, nbytes: int):
+        if self._segment_bytes > self._header_bytes() and (
+            (self.max_segment_bytes and self._segment_bytes + nbytes > self.max_segment_bytes)
+            or (self.max_segment_age_s and time.monotonic() - self._opened_at >= self.max_segment_age_s)
+        ):
+            self._rotate()
+        self._segment_bytes += nbytes
+
+    def _rotate(self):
+        sealed = self.path
+        self._close_file()
+        self._seal(sealed)
+        self.seq += 1
+        self.path = self._segment_path(self.seq)
+        self._open()
+
+    def _seal(self, path: Path):
+        held, self._sealing = self._sealing, None
+        if path.exists() and path.stat().st_size <= self._header_bytes():
+            path.unlink()
+            from .walindex import index_path_for
+
+            index_path_for(path).unlink(missing_ok=True)
+            _release(path, held)
+            return
+        self._sealer.submit(self._seal_job, path, held)
+
+    def _seal_job(self, path: Path, held: Optional[int] = None):
+        try:
+            sealed = compress_segment(path, self.compression)
+        except Exception as exc:
+            # The uncompressed segment stays in place and remains readable.
+            print(f"mitschreiber: sealing {path.name} failed: {exc!r}", file=sys.stderr)
+            return
+        finally:
+            _release(path, held)
+        if self.on_sealed is not None:
+            try:
+                self.on_sealed(sealed)
+            except Exception as exc:
+                print(f"mitschreiber: after sealing {path.name}: {exc!r}", file=sys.stderr)
+
+    def close(self):
+        if not self.file:
+            return
+        super().close()
+        # The last segment is sealed too; wait so the session ends fully compressed.
+        self._seal(self.path)
+        self._sealer.shutdown(wait=True)
@@ -0,0 +1,172 @@
+"""
+Compact binary WAL encoding (.mwal).
+
+A file starts with MAGIC, followed by length-prefixed records:
+
+    u32 payload_len | payload
+
+payload kind 0 (JSON):  u8 0 | utf-8 JSON of the full record
+payload kind 1 (embed): u8 1 | u16 dim | u32 json_len | JSON without "embedding" | dim x f32
+payload kind 2 (embed): as kind 1 with dim x f16 (meta.quant == "float16")
+payload kind 3 (embed): as kind 1 with dim x i8  (meta.quant == "int8")
+
+All integers and floats are little-endian. Embed vectors are stored as raw
+float32, which makes os.context.text.embed records several times smaller than
+their JSON form and avoids float formatting/parsing. to_jsonl() converts back
+to contract-valid JSONL for chronik ingestion.
+"""
+from __future__ import annotations
+import json
+import struct
+import sys
+from array import array
+from typing import Any, BinaryIO, Dict, Iterator, Tuple
+
+from .quantize import _round_f16
+
+MAGIC = b"MWAL\x01\n"
+
+KIND_JSON = 0
+KIND_EMBED = 1
+KIND_EMBED_F16 = 2
+KIND_EMBED_I8 = 3
+
+_LEN = struct.Struct("<I")
+_EMBED_HEAD = struct.Struct("<BHI")
+_F32 = struct.Struct("<f")
+
+# array('f') is native-endian; records are little-endian on disk.
+_SWAP = sys.byteorder != "little"
+
+
+def _dumps(obj: Dict[str, Any]) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _pack_vector(vec, quant) -> Tuple[int, bytes]:
+    # Compacted vectors (quantize.py) keep their size on disk; anything out of range falls back to f32.
+    try:
+        if quant == "int8":
+            return KIND_EMBED_I8, array("b", vec).tobytes()
+        if quant == "float16":
+            return KIND_EMBED_F16, struct.pack(f"<{len(vec)}e", *vec)
+    except (OverflowError, TypeError, struct.error):
+        pass
+    blob = array("f", vec)
+    if _SWAP:
+        blob.byteswap()
+    return KIND_EMBED, blob.tobytes()
+
+
+def encode_record(obj: Dict[str, Any]) -> bytes:
+    """
+    Frames one record; embed vectors go into a raw float32 blob.
+    """
+    vec = obj.get("embedding")
+    if isinstance(vec, list) and 0 < len(vec) <= 0xFFFF:
+        meta = _dumps({k: v for k, v in obj.items() if k != "embedding"})
+        kind, blob = _pack_vector(vec, (obj.get("meta") or {}).get("quant"))
+        payload = _EMBED_HEAD.pack(kind, len(vec), len(meta)) + meta + blob
+    else:
+        payload = bytes((KIND_JSON,)) + _dumps(obj)
+    return _LEN.pack(len(payload)) + payload
+
+
+def frame_jsonl(data: bytes) -> bytes:
+    """
+    Frames newline-delimited JSON records as kind-0 records without parsing them.
+    """
+    out = bytearray()
+    for line in data.splitlines():
+        if line:
+            out += _LEN.pack(len(line) + 1)
+            out.append(KIND_JSON)
+            out += line
+    return bytes(out)
+
+
+def decode_payload(payload: bytes) -> Dict[str, Any]:
+    kind = payload[0]
+    if kind == KIND_JSON:
+        return json.loads(payload[1:])
+    if kind in (KIND_EMBED, KIND_EMBED_F16, KIND_EMBED_I8):
+        _, dim, meta_len = _EMBED_HEAD.unpack_from(payload)
+        start = _EMBED_HEAD.size + meta_len
+        obj = json.loads(payload[_EMBED_HEAD.size:start])
+        if kind == KIND_EMBED_I8:
+            blob = array("b")
+            blob.frombytes(payload[start:start + dim])
+            obj["embedding"] = blob.tolist()
+        elif kind == KIND_EMBED_F16:
+            obj["embedding"] = [_round_f16(x) for x in struct.unpack_from(f"<{dim}e", payload, start)]
+        else:
+            blob = array("f")
+            blob.frombytes(payload[start:start + dim * 4])
+            if _SWAP:
+                blob.byteswap()
+            obj["embedding"] = blob.tolist()
+        return obj
+    raise ValueError(f"unknown WAL record kind {kind}")
+
+
+def iter_frames(fp: BinaryIO, offset: int = 0) -> Iterator[Tuple[int, int, bytes]]:
+    """
+    Yields (start, end, payload) per record; offsets are positions in the stream.
+    At offset 0 the magic header is verified and skipped. A truncated tail
+    (e.g. a crash mid-write) ends the iteration.
+    """
+    pos = offset
+    if pos == 0:
+        head = fp.read(len(MAGIC))
+        if not head:
+            return
+        if head != MAGIC:
+            raise ValueError("not a mitschreiber binary WAL (bad magic)")
+        pos = len(MAGIC)
+    while True:
+        raw_len = fp.read(_LEN.size)
+        if len(raw_len) < _LEN.size:
+            return
+        (n,) = _LEN.unpack(raw_len)
+        payload = fp.read(n)
+        if len(payload) < n:
+            return
+        end = pos + _LEN.size + n
+        yield pos, end, payload
+        pos = end
+
+
+def iter_records(fp: BinaryIO) -> Iterator[Dict[str, Any]]:
+    for _, _, payload in iter_frames(fp):
+        yield decode_payload(payload)
+
+
+def _round_f32(x: float) -> float:
+    """
+    Shortest decimal that maps back to the same float32 (avoids printing float64 noise).
+    """
+    for digits in (6, 7, 8):
+        y = float(f"{x:.{digits}g}")
+        if _F32.unpack(_F32.pack(y))[0] == x:
+            return y
+    return float(f"{x:.9g}")
+
+
+def jsonl_line(obj: Dict[str, Any]) -> bytes:
+    """
+    One contract-valid JSONL line for a decoded record.
+    """
+    if "embedding" in obj:
+        obj["embedding"] = [x if isinstance(x, int) else _round_f32(x) for x in obj["embedding"]]
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+def to_jsonl(src: BinaryIO, dst: BinaryIO) -> int:
+    """
+    Converts a binary WAL stream into contract-valid JSONL; returns the record count.
+    """
+    n = 0
+    for obj in iter_records(src):
+        dst.write(jsonl_line(obj))
+        n += 1
+    return n
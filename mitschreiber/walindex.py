@@ -0,0 +1,157 @@
+"""
+Sparse time index for WAL segments.
+
+Next to each segment the writer keeps a sidecar <segment>.idx (named after the
+uncompressed segment, so it survives sealing). Every line maps a block of the
+segment to the time range it covers:
+
+    {"off": 0, "end": 65811, "t0": 1735732800.0, "t1": 1735733101.0, "n": 412}
+
+Offsets are positions in the uncompressed stream; t0/t1 are epoch seconds
+(t1 rounded up to the next full second). A block is closed once it exceeds
+INDEX_BLOCK_BYTES and when the segment is closed; the last line is then
+{"closed": true, "end": N}. Anything after the last indexed block (crash,
+segment still being written) must be scanned.
+"""
+from __future__ import annotations
+import json
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
+
+from .util import parse_ts
+
+INDEX_BLOCK_BYTES = 64 * 1024
+
+# Both producers write UTC timestamps, so the "YYYY-MM-DDTHH:MM:SS" prefix
+# orders lexicographically; only the extremes of a block get parsed.
+_TS_RE = re.compile(rb'"ts":\s*"(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})')
+
+
+def index_path_for(segment: Path) -> Path:
+    name = segment.name
+    for suffix in (".gz", ".zst"):
+        if name.endswith(suffix):
+            name = name[: -len(suffix)]
+    return segment.with_name(name + ".idx")
+
+
+@dataclass
+class IndexEntry:
+    off: int
+    end: int
+    t0: float
+    t1: float
+    n: int
+
+    def overlaps(self, since: Optional[float], until: Optional[float]) -> bool:
+        return (since is None or self.t1 >= since) and (until is None or self.t0 < until)
+
+
+@dataclass
+class SegmentIndex:
+    entries: List[IndexEntry]
+    # True if the writer closed the segment cleanly: entries cover it up to `end`.
+    closed: bool
+    end: int
+
+    @property
+    def t0(self) -> Optional[float]:
+        return min((e.t0 for e in self.entries), default=None)
+
+    @property
+    def t1(self) -> Optional[float]:
+        return max((e.t1 for e in self.entries), default=None)
+
+
+def load_index(segment: Path) -> Optional[SegmentIndex]:
+    path = index_path_for(segment)
+    try:
+        raw = path.read_bytes()
+    except FileNotFoundError:
+        return None
+    entries: List[IndexEntry] = []
+    closed, end = False, 0
+    for line in raw.splitlines():
+        try:
+            obj = json.loads(line)
+        except json.JSONDecodeError:
+            # Torn last line after a crash.
+            continue
+        if obj.get("closed"):
+            closed, end = True, max(end, int(obj["end"]))
+            continue
+        # The file was reopened and appended to after an earlier close.
+        closed = False
+        entries.append(IndexEntry(obj["off"], obj["end"], obj["t0"], obj["t1"], obj["n"]))
+        end = max(end, obj["end"])
+    return SegmentIndex(entries, closed, end)
+
+
+class IndexBuilder:
+    """
+    Accumulates written blocks and appends an index line whenever the current
+    block grows beyond block_bytes. Called by WalWriter under its lock.
+    """
+
+    def __init__(self, segment: Path, block_bytes: Optional[int] = None):
+        self.path = index_path_for(segment)
+        self.block_bytes = block_bytes or INDEX_BLOCK_BYTES
+        self.file = None
+        self._closed = False
+        self._reset(None)
+
+    def _reset(self, off: Optional[int]):
+        self.off = off
+        self.end = off
+        self.lo: Optional[bytes] = None
+        self.hi: Optional[bytes] = None
+        self.n = 0
+
+    def note(self, offset: int, data: bytes):
+        if self.off is None or offset != self.end:
+            # Non-contiguous write (e.g. another process appended): start a new block.
+            self.flush()
+            self._reset(offset)
+        self.end = offset + len(data)
+        for ts in _TS_RE.findall(data):
+            self.n += 1
+            if self.lo is None or ts < self.lo:
+                self.lo = ts
+            if self.hi is None or ts > self.hi:
+                self.hi = ts
+        if self.end - self.off >= self.block_bytes:
+            self.flush()
+
+    def flush(self):
+        if self.off is None or self.end == self.off:
+            return
+        if self.lo is not None:
+            entry = {
+                "off": self.off,
+                "end": self.end,
+                "t0": parse_ts(self.lo.decode()),
+                "t1": parse_ts(self.hi.decode()) + 1.0,
+                "n": self.n,
+            }
+            self._write_line(entry)
+        self._reset(self.end)
+
+    def _write_line(self, obj: dict):
+        if self.file is None:
+            # Created lazily so segments that never receive data leave no sidecar.
+            self.file = open(self.path, "ab")
+        self.file.write(json.dumps(obj).encode() + b"\n")
+        self.file.flush()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self.flush()
+        if self.end is not None:
+            self._write_line({"closed": True, "end": self.end})
+        if self.file is not None:
+            self.file.close()
+            self.file = None
@@ -0,0 +1,121 @@
+"""
+Reading WAL files regardless of format and compression.
+
+Handles legacy session-<UUID>.jsonl files, JSONL segments and binary .mwal
+segments, each optionally sealed as .gz or .zst.
+"""
+from __future__ import annotations
+import gzip
+import json
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterator, Optional, Tuple
+
+from . import walbin
+
+
+def is_binary(path: Path) -> bool:
+    return ".mwal" in path.suffixes
+
+
+def is_sealed(path: Path) -> bool:
+    return path.name.endswith((".gz", ".zst"))
+
+
+def segment_key(path: Path) -> str:
+    """
+    Name of the uncompressed segment: stable across sealing, so byte offsets
+    (positions in the uncompressed stream) stay valid after compression.
+    """
+    name = path.name
+    for suffix in (".gz", ".zst"):
+        if name.endswith(suffix):
+            name = name[: -len(suffix)]
+    return name
+
+
+def open_segment(path: Path) -> BinaryIO:
+    """
+    Opens a WAL file for binary reading, transparently decompressing sealed segments.
+    """
+    if path.name.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.name.endswith(".zst"):
+        import zstandard  # optional dependency: pip install mitschreiber[zstd]
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+    return open(path, "rb")
+
+
+def iter_records(path: Path) -> Iterator[Dict[str, Any]]:
+    """
+    Streams the records of one WAL file as dicts. Undecodable lines (e.g. a
+    torn last line after a crash) are skipped.
+    """
+    with open_segment(path) as fp:
+        if is_binary(path):
+            yield from walbin.iter_records(fp)
+            return
+        for line in fp:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def iter_records_from(
+    path: Path, offset: int = 0, contains: Optional[bytes] = None
+) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Incremental reading: yields (end_offset, record) for complete records after
+    `offset` (a position in the uncompressed stream). A partially written last
+    record is not yielded, so end_offset is always safe to resume from.
+    With `contains`, records whose raw bytes lack that substring are not
+    decoded and yield (end_offset, None), so callers can still checkpoint.
+    """
+    with open_segment(path) as fp:
+        if is_binary(path):
+            if offset:
+                fp.seek(offset)
+            for _, end, payload in walbin.iter_frames(fp, offset):
+                if contains is None or contains in payload:
+                    yield end, walbin.decode_payload(payload)
+                else:
+                    yield end, None
+            return
+        if offset:
+            fp.seek(offset)
+        pos = offset
+        for line in fp:
+            if not line.endswith(b"\n"):
+                break
+            pos += len(line)
+            if not line.strip() or (contains is not None and contains not in line):
+                yield pos, None
+                continue
+            try:
+                yield pos, json.loads(line)
+            except json.JSONDecodeError:
+                yield pos, None
+
+
+def iter_lines_from(path: Path, offset: int = 0) -> Iterator[Tuple[int, bytes]]:
+    """
+    Like iter_records_from, but yields (end_offset, jsonl_line) with the record
+    as one newline-terminated JSONL line: verbatim for JSONL files, converted
+    for binary ones.
+    """
+    with open_segment(path) as fp:
+        if offset:
+            fp.seek(offset)
+        if is_binary(path):
+            for _, end, payload in walbin.iter_frames(fp, offset):
+                yield end, walbin.jsonl_line(walbin.decode_payload(payload))
+            return
+        pos = offset
+        for line in fp:
+            if not line.endswith(b"\n"):
+                break
+            pos += len(line)
+            if line.strip():
+                yield pos, line
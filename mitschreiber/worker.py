@@ -0,0 +1,174 @@
+"""
+Background embedding stage.
+
+State events are handed to an EmbedWorker through a bounded queue; a single
+worker thread groups them into micro-batches (by size or deadline), calls the
+batch builder once per batch and appends the resulting embed events to the WAL.
+The capture loop never waits for the model: when the queue is full, new items
+are dropped (freshness over completeness, same policy as the Rust sampler).
+"""
+from __future__ import annotations
+import queue
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from .metrics import REGISTRY, SIZE_BUCKETS
+
+_BATCH_SECONDS = REGISTRY.histogram(
+    "mitschreiber_embed_batch_seconds", "Time to embed one micro-batch (model call incl. cache lookups)."
+)
+_BATCH_SIZE = REGISTRY.histogram(
+    "mitschreiber_embed_batch_size", "State events per embedding micro-batch.", buckets=SIZE_BUCKETS
+)
+
+# Sentinel that tells the worker thread to flush and exit.
+_STOP = object()
+
+BatchBuilder = Callable[[Sequence[Dict[str, Any]]], List[Optional[Dict[str, Any]]]]
+
+
+class EmbedWorker:
+    def __init__(
+        self,
+        writer,
+        build_batch: BatchBuilder,
+        *,
+        max_batch: int = 16,
+        max_delay_ms: int = 250,
+        queue_size: int = 1024,
+    ):
+        if max_batch <= 0:
+            raise ValueError(f"max_batch must be positive (got {max_batch})")
+        if max_delay_ms < 0:
+            raise ValueError(f"max_delay_ms must not be negative (got {max_delay_ms})")
+        self.writer = writer
+        self.build_batch = build_batch
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000.0
+        self.queue: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size)
+        self.thread: Optional[threading.Thread] = None
+
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.dropped = 0
+        self.errors = 0
+        self.batches = 0
+        self.embedded = 0
+        self.max_depth = 0
+        self.last_batch_ms = 0.0
+        self.max_batch_ms = 0.0
+        self._total_batch_ms = 0.0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self._run, name="mitschreiber-embed", daemon=True)
+        self.thread.start()
+
+    def submit(self, item: Dict[str, Any]) -> bool:
+        """
+        Enqueues a state event for embedding. Never blocks; returns False if dropped.
+        """
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        depth = self.queue.qsize()
+        with self._lock:
+            self.submitted += 1
+            if depth > self.max_depth:
+                self.max_depth = depth
+        return True
+
+    def close(self, timeout: Optional[float] = None):
+        """
+        Flushes pending items and stops the worker thread.
+        """
+        if self.thread is None:
+            return
+        # The sentinel must get through even if the queue is full.
+        self.queue.put(_STOP)
+        self.thread.join(timeout)
+        self.thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "queue_depth": self.queue.qsize(),
+                "queue_max_depth": self.max_depth,
+                "submitted": self.submitted,
+                "dropped": self.dropped,
+                "errors": self.errors,
+                "batches": self.batches,
+                "embedded": self.embedded,
+                "batch_ms_last": round(self.last_batch_ms, 3),
+                "batch_ms_avg": round(self._total_batch_ms / self.batches, 3) if self.batches else 0.0,
+                "batch_ms_max": round(self.max_batch_ms, 3),
+            }
+
+    def _collect(self) -> tuple[list, bool]:
+        """
+        Blocks for the first item, then gathers more until the batch is full
+        or the deadline (counted from the first item) has passed.
+        """
+        first = self.queue.get()
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = self._collect()
+            if batch:
+                self._process(batch)
+
+    def _process(self, batch: list):
+        t0 = time.perf_counter()
+        try:
+            events = self.build_batch(batch)
+        except Exception as exc:
+            # A failing model must not kill the worker; the batch is lost.
+            print(f"mitschreiber: embedding batch of {len(batch)} failed: {exc!r}", file=sys.stderr)
+            with self._lock:
+                self.errors += 1
+            return
+        elapsed_ms = (time.perf_counter() - t0) * 1000.0
+        _BATCH_SECONDS.observe(elapsed_ms / 1000.0)
+        _BATCH_SIZE.observe(len(batch))
+        written = 0
+        for evt in events:
+            if evt:
+                self.writer.append(evt)
+                written += 1
+        if written:
+            self.writer.commit()
+        with self._lock:
+            self.batches += 1
+            self.embedded += written
+            self.last_batch_ms = elapsed_ms
+            self._total_batch_ms += elapsed_ms
+            if elapsed_ms > self.max_batch_ms:
+                self.max_batch_ms = elapsed_ms
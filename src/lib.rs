@@ -1,6 +1,6 @@
 use pyo3::prelude::*;
 
-use mitschreiber_sampler::{start_session, stop_session, poll_state};
+use mitschreiber_sampler::{start_session, stop_session, poll_state, poll_state_jsonl, poll_state_wait, session_stats};
 
 /// The main `_mitschreiber` Python module.
 #[pymodule]
@@ -8,5 +8,8 @@ fn _mitschreiber(_py: Python, m: &PyModule) -> PyResult<()> {
     m.add_function(wrap_pyfunction!(start_session, m)?)?;
     m.add_function(wrap_pyfunction!(stop_session, m)?)?;
     m.add_function(wrap_pyfunction!(poll_state, m)?)?;
+    m.add_function(wrap_pyfunction!(poll_state_jsonl, m)?)?;
+    m.add_function(wrap_pyfunction!(poll_state_wait, m)?)?;
+    m.add_function(wrap_pyfunction!(session_stats, m)?)?;
     Ok(())
 }
@@ -0,0 +1,139 @@
+import math
+import sys
+import types
+
+import pytest
+
+from mitschreiber import backends, embed
+from mitschreiber.backends import (
+    EmbeddingBackend,
+    HashBackend,
+    WordPieceTokenizer,
+    create_backend,
+    register_backend,
+)
+
+VOCAB = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "main", ".", "py", "fenster", "##chen", "code", "vs", "##code"]
+
+
+@pytest.fixture
+def vocab(tmp_path):
+    path = tmp_path / "vocab.txt"
+    path.write_text("\n".join(VOCAB) + "\n", encoding="utf-8")
+    return path
+
+
+def test_registry_creates_backends_and_rejects_unknown_names():
+    assert {"hash", "onnx", "sentence-transformers"} <= set(backends.available_backends())
+    assert isinstance(create_backend("hash", model=None), HashBackend)
+    with pytest.raises(ValueError):
+        create_backend("nope")
+
+
+def test_hash_backend_is_deterministic_and_normalized():
+    backend = create_backend("hash")
+    a, b = backend.embed(["vscode | main.py", "vscode | main.py"])
+    assert a == b and len(a) == 32
+    assert math.isclose(sum(x * x for x in a), 1.0, rel_tol=1e-9)
+
+
+def test_onnx_backend_requires_a_model(monkeypatch):
+    monkeypatch.delenv(backends.MODEL_ENV, raising=False)
+    with pytest.raises(ValueError):
+        backends.configure("onnx")
+
+
+def test_wordpiece_splits_words_into_known_pieces(vocab):
+    tok = WordPieceTokenizer(vocab)
+    ids = tok.encode("VSCode main.py Fensterchen ???")
+    pieces = [VOCAB[i] for i in ids]
+    assert pieces == ["[CLS]", "vs", "##code", "main", ".", "py", "fenster", "##chen", "[UNK]", "[UNK]", "[UNK]", "[SEP]"]
+    assert len(tok.encode("main " * 50, max_length=8)) == 8
+
+
+def test_events_are_tagged_with_the_backend_model():
+    @register_backend("test-const")
+    class ConstBackend(EmbeddingBackend):
+        name = "test-const"
+        model_id = "const-3"
+
+        def __init__(self, **_):
+            pass
+
+        def embed(self, texts):
+            return [[1.0, 0.0, 0.0] for _ in texts]
+
+    backend = backends.configure("test-const")
+    [(evt, _)] = embed.build_embed_events([("kitty | shell", "s", "kitty", "shell")], backend)
+    assert evt["meta"]["model"] == "const-3"
+    assert evt["embedding"] == [1.0, 0.0, 0.0]
+    backends._BACKENDS.pop("test-const")
+
+
+def test_configure_shares_equal_backends_and_keeps_others_apart():
+    first = backends.configure("hash", model=None)
+    assert backends.configure("hash", model=None) is first
+    other = backends.configure("hash", model=None, dim=16)
+    assert other is not first and other.model_id == "hash16-demo"
+    # Creating another backend does not change what an earlier session holds.
+    [(evt, _)] = embed.build_embed_events([("kitty | shell", "s", "kitty", "shell")], first)
+    assert evt["meta"]["model"] == first.model_id == "hash32-demo"
+
+
+def test_onnx_backend_mean_pools_a_tiny_model(tmp_path, vocab):
+    onnx = pytest.importorskip("onnx")
+    pytest.importorskip("onnxruntime")
+    np = pytest.importorskip("numpy")
+    from onnx import TensorProto, helper, numpy_helper
+
+    # input_ids -> Gather(embedding table) == a one-layer "encoder" with output [B, T, H].
+    table = np.eye(len(VOCAB), 4, dtype=np.float32) + 0.1
+    graph = helper.make_graph(
+        [helper.make_node("Gather", ["table", "input_ids"], ["last_hidden_state"])],
+        "tiny",
+        [
+            helper.make_tensor_value_info("input_ids", TensorProto.INT64, ["B", "T"]),
+            helper.make_tensor_value_info("attention_mask", TensorProto.INT64, ["B", "T"]),
+        ],
+        [helper.make_tensor_value_info("last_hidden_state", TensorProto.FLOAT, ["B", "T", 4])],
+        [numpy_helper.from_array(table, "table")],
+    )
+    model_dir = tmp_path
+    onnx.save(helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)]), model_dir / "model.onnx")
+
+    backend = create_backend("onnx", model=str(model_dir), threads=1, batch_size=2)
+    texts = ["main", "main . py main", "fenster"]
+    vecs = backend.embed(texts)
+    assert backend.model_id == f"onnx/{model_dir.name}"
+    for text, vec in zip(texts, vecs):
+        ids = backend.tokenizer.encode(text)
+        expected = table[ids].mean(axis=0)
+        expected /= np.linalg.norm(expected)
+        assert np.allclose(vec, expected, atol=1e-6)
+
+
+def test_torch_threads_are_set_once_per_process(monkeypatch, capsys):
+    calls = []
+
+    def refuse(n):
+        raise RuntimeError("cannot set number of interop threads after parallel work has started")
+
+    fake_torch = types.SimpleNamespace(set_num_threads=calls.append, set_num_interop_threads=refuse)
+    monkeypatch.setitem(sys.modules, "torch", fake_torch)
+    monkeypatch.setattr(backends, "_torch_threads", {})
+    backends._set_torch_threads(2, 2)
+    assert calls == [2]
+    assert "cannot set torch inter_op_threads to 2" in capsys.readouterr().err
+    # A second session must not retune the first one's pool.
+    backends._set_torch_threads(4, None)
+    assert calls == [2]
+    assert "already 2; ignoring 4" in capsys.readouterr().err
+
+
+def test_sessions_share_one_sentence_transformers_backend_across_thread_options(monkeypatch, capsys):
+    monkeypatch.setattr(backends, "_shared", {})
+    first = backends.configure("sentence-transformers", model="m", threads=2)
+    assert backends.configure("sentence-transformers", model="m", threads=4) is first
+    assert "ignoring 4" in capsys.readouterr().err
+    assert backends.configure("sentence-transformers", model="m") is first
+    assert capsys.readouterr().err == ""
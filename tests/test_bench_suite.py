@@ -0,0 +1,35 @@
+from benchmarks.suite import STAGES, compare, run_stage
+
+BASELINE = {
+    "results": [
+        {"stage": "hash32", "events_per_s": 100_000, "p50_us": 10.0, "p99_us": 20.0, "peak_kib": 1.0},
+        {"stage": "run_session", "events_per_s": 900, "cpu_us_per_event": 5.0},
+    ]
+}
+
+
+def test_compare_flags_regressions_beyond_tolerance():
+    ok = [{"stage": "hash32", "events_per_s": 80_000, "p50_us": 12.0, "p99_us": 39.0, "peak_kib": 1.2}]
+    assert compare(ok, BASELINE, tolerance=0.25, p99_tolerance=1.0) == []
+
+    slow = [{"stage": "hash32", "events_per_s": 70_000, "p50_us": 13.0, "p99_us": 45.0, "peak_kib": 1.0}]
+    msgs = compare(slow, BASELINE, tolerance=0.25, p99_tolerance=1.0)
+    assert [m.split(":")[0] for m in msgs] == ["hash32.events_per_s", "hash32.p50_us", "hash32.p99_us"]
+
+
+def test_compare_ignores_unknown_skipped_and_poll_bound_stages():
+    results = [
+        {"stage": "new_stage", "events_per_s": 1},
+        {"stage": "run_session", "events_per_s": 100, "cpu_us_per_event": 5.5},
+    ]
+    assert compare(results, BASELINE) == []
+    assert compare([{"stage": "run_session", "skipped": "no extension"}], BASELINE) == []
+
+
+def test_stages_run_and_report_all_metrics():
+    stage = next(s for s in STAGES if s.name == "build_embed_events")
+    result = run_stage(stage, scale=0.02)
+    assert result["events"] == 10 * 16
+    assert result["events_per_s"] > 0
+    assert 0 < result["p50_us"] <= result["p99_us"]
+    assert result["peak_kib"] > 0
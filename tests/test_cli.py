@@ -169,3 +169,43 @@ def test_init_directories_creates_all_dirs(tmp_path):
     assert data_home.exists(), "DATA_HOME should be created"
     assert wal_dir.exists(), "WAL_DIR should be created"
     assert sess_dir.exists(), "SESS_DIR should be created"
+
+@patch("mitschreiber.cli.run_session")
+def test_start_passes_idle_backoff_bounds(mock_run, mock_session_dir):
+    with patch("sys.argv", ["mitschreiber", "start", "--foreground", "--poll-interval", "250", "--max-poll-interval", "30000"]):
+        main()
+    kwargs = mock_run.call_args.kwargs
+    assert (kwargs["poll_ms"], kwargs["max_poll_ms"]) == (250, 30000)
+
+def test_run_session_rejects_backoff_below_poll_interval():
+    from mitschreiber.session import run_session
+    with pytest.raises(ValueError, match="max_poll_ms"):
+        run_session("s", embed=False, clipboard=False, poll_ms=500, max_poll_ms=100)
+
+def test_run_session_validates_queue_options():
+    from mitschreiber.session import run_session
+    with pytest.raises(ValueError, match="queue_capacity"):
+        run_session("s", embed=False, clipboard=False, poll_ms=500, queue_capacity=0)
+    with pytest.raises(ValueError, match="queue_overflow"):
+        run_session("s", embed=False, clipboard=False, poll_ms=500, queue_overflow="block")
+
+@patch("mitschreiber.cli.run_session")
+def test_start_passes_dedup_options(mock_run, mock_session_dir):
+    with patch("sys.argv", ["mitschreiber", "start", "--foreground", "--embed-dedup", "0.8", "--embed-dedup-memory", "4"]):
+        main()
+    assert (mock_run.call_args.kwargs["embed_dedup"], mock_run.call_args.kwargs["embed_dedup_memory"]) == (0.8, 4)
+    with patch("sys.argv", ["mitschreiber", "start", "--foreground", "--embed-dedup", "off"]):
+        main()
+    assert mock_run.call_args.kwargs["embed_dedup"] is None
+
+@patch("mitschreiber.cli.run_session")
+def test_start_passes_redact_options(mock_run, mock_session_dir, tmp_path):
+    terms = tmp_path / "terms.txt"
+    terms.write_text("# Kunden\nACME GmbH\n\n  Projekt Nebel \n", encoding="utf-8")
+    with patch("sys.argv", ["mitschreiber", "start", "--foreground", "--redact-terms", str(terms)]):
+        main()
+    assert mock_run.call_args.kwargs["redact"] is True
+    assert mock_run.call_args.kwargs["redact_terms"] == ["ACME GmbH", "Projekt Nebel"]
+    with patch("sys.argv", ["mitschreiber", "start", "--foreground", "--no-redact"]):
+        main()
+    assert mock_run.call_args.kwargs["redact"] is False
@@ -0,0 +1,174 @@
+import json
+import signal
+import socket
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from mitschreiber.cli import main
+from mitschreiber.daemon import Daemon, DaemonError, request
+
+
+class FakeRunner:
+    """
+    Stands in for run_session: reports ready, then captures until stopped.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.emitted = {}
+
+    def __call__(self, session_id, stop_event, on_start, **kwargs):
+        if kwargs.get("poll_ms", 1) <= 0:
+            raise ValueError("poll_ms must be positive")
+        self.calls.append((session_id, kwargs))
+        self.emitted[session_id] = 0
+        on_start({"worker": None, "cache": None, "sink": None, "writer": None})
+        if kwargs.get("sampler") == "crash":
+            raise OSError(28, "No space left on device")
+        while not stop_event.wait(0.01):
+            self.emitted[session_id] += 1
+
+    def stats(self, session_id):
+        if session_id not in self.emitted:
+            return None
+        return {"probes": self.emitted[session_id], "emitted": self.emitted[session_id], "drops": 0, "depth": 0}
+
+
+@pytest.fixture
+def runner():
+    return FakeRunner()
+
+
+@pytest.fixture
+def daemon(tmp_path, runner):
+    with Daemon(tmp_path / "control.sock", runner=runner, stats=runner.stats) as d:
+        yield d
+
+
+def test_hosts_several_sessions_and_reports_live_stats(daemon, runner):
+    sock = daemon.socket_path
+    assert request(sock, {"op": "ping"})["ok"]
+    first = request(sock, {"op": "start", "options": {"embed": True, "poll_ms": 250}})["session_id"]
+    second = request(sock, {"op": "start", "options": {}})["session_id"]
+    assert runner.calls[0][1]["embed"] is True and runner.calls[0][1]["poll_ms"] == 250
+
+    status = request(sock, {"op": "status"})
+    assert {s["session_id"] for s in status["sessions"]} == {first, second}
+    assert all("sampler" in s for s in status["sessions"])
+
+    assert request(sock, {"op": "stop", "session_id": first})["stopped"] == [first]
+    assert [s["session_id"] for s in request(sock, {"op": "status"})["sessions"]] == [second]
+    assert request(sock, {"op": "stop"})["stopped"] == [second]
+    assert request(sock, {"op": "status"})["sessions"] == []
+
+
+def test_bad_requests_get_errors_not_crashes(daemon):
+    sock = daemon.socket_path
+    assert not request(sock, {"op": "start", "options": {"wal_dir": "/"}})["ok"]
+    reply = request(sock, {"op": "start", "options": {"poll_ms": 0}})
+    assert not reply["ok"] and "poll_ms" in reply["error"]
+    assert not request(sock, {"op": "stop", "session_id": "nope"})["ok"]
+    assert not request(sock, {"op": "frobnicate"})["ok"]
+    assert request(sock, {"op": "ping"})["ok"]
+
+
+def test_a_session_that_dies_is_logged_and_kept_until_stopped(daemon, capsys):
+    sock = daemon.socket_path
+    crashed = request(sock, {"op": "start", "options": {"sampler": "crash"}})["session_id"]
+    running = request(sock, {"op": "start", "options": {}})["session_id"]
+    daemon._sessions[crashed].thread.join(5)
+
+    assert "No space left on device" in capsys.readouterr().err
+    sessions = {s["session_id"]: s for s in request(sock, {"op": "status"})["sessions"]}
+    assert sessions[crashed]["state"] == "failed"
+    assert sessions[crashed]["error"] == "OSError: [Errno 28] No space left on device"
+    assert sessions[running]["state"] == "running" and "error" not in sessions[running]
+
+    assert request(sock, {"op": "stop", "session_id": crashed})["stopped"] == [crashed]
+    assert [s["session_id"] for s in request(sock, {"op": "status"})["sessions"]] == [running]
+
+
+def test_second_daemon_is_refused_and_stale_socket_replaced(daemon, tmp_path, runner):
+    with pytest.raises(DaemonError):
+        Daemon(daemon.socket_path, runner=runner).bind()
+
+    stale = tmp_path / "stale.sock"
+    stale.touch()
+    assert request(stale, {"op": "ping"}) is None
+    with Daemon(stale, runner=runner) as other:
+        assert request(other.socket_path, {"op": "ping"})["ok"]
+    assert not stale.exists()
+
+
+def test_shutdown_stops_sessions(tmp_path, runner):
+    d = Daemon(tmp_path / "control.sock", runner=runner, stats=runner.stats).bind()
+    served = threading.Thread(target=d.serve_forever)
+    served.start()
+    request(d.socket_path, {"op": "start", "options": {}})
+    assert request(d.socket_path, {"op": "shutdown"})["ok"]
+    served.join(5)
+    assert not served.is_alive() and not d.socket_path.exists()
+
+
+def test_cli_uses_the_daemon_when_it_answers(tmp_path, runner, capsys):
+    with patch("mitschreiber.cli.SESSIONS_DIR", tmp_path), \
+         Daemon(tmp_path / "control.sock", runner=runner, stats=runner.stats), \
+         patch("mitschreiber.cli.run_session") as foreground:
+        with patch("sys.argv", ["mitschreiber", "start", "--embed"]):
+            assert main() == 0
+        foreground.assert_not_called()
+        assert runner.calls[0][1]["embed"] is True
+
+        with patch("sys.argv", ["mitschreiber", "status"]):
+            main()
+        out = capsys.readouterr().out
+        status = json.loads(out[out.index("{"):])
+        assert len(status["sessions"]) == 1
+
+        with patch("sys.argv", ["mitschreiber", "stop"]):
+            main()
+        assert "Stopped 1 session(s) in daemon." in capsys.readouterr().out
+
+
+def test_cli_also_sees_a_foreground_session_beside_the_daemon(tmp_path, runner, capsys):
+    (tmp_path / "active.json").write_text(json.dumps({"session_id": "fg", "pid": 4242, "flags": {}}))
+    with patch("mitschreiber.cli.SESSIONS_DIR", tmp_path), \
+         Daemon(tmp_path / "control.sock", runner=runner, stats=runner.stats), \
+         patch("psutil.Process"), \
+         patch("os.kill") as kill:
+        with patch("sys.argv", ["mitschreiber", "start", "--embed"]):
+            assert main() == 0
+        capsys.readouterr()
+
+        with patch("sys.argv", ["mitschreiber", "status"]):
+            main()
+        out = capsys.readouterr().out
+        assert '"sessions"' in out and "Foreground session:" in out and '"session_id": "fg"' in out
+
+        with patch("sys.argv", ["mitschreiber", "stop", "--session", "fg"]):
+            main()
+        kill.assert_called_once_with(4242, signal.SIGINT)
+
+        kill.reset_mock()
+        with patch("sys.argv", ["mitschreiber", "stop"]):
+            main()
+        out = capsys.readouterr().out
+        assert "Stopped 1 session(s) in daemon." in out and "Sent SIGINT to PID 4242" in out
+        kill.assert_called_once_with(4242, signal.SIGINT)
+
+
+@pytest.mark.parametrize(
+    "error", [socket.timeout("timed out"), PermissionError(13, "Permission denied"), DaemonError("closed")]
+)
+def test_cli_reports_a_daemon_that_does_not_answer(tmp_path, capsys, error):
+    (tmp_path / "control.sock").touch()
+    with patch("mitschreiber.cli.SESSIONS_DIR", tmp_path), \
+         patch("mitschreiber.daemon.request", side_effect=error), \
+         patch("sys.argv", ["mitschreiber", "stop"]):
+        with pytest.raises(SystemExit) as exc:
+            main()
+    assert exc.value.code == 2
+    err = capsys.readouterr().err
+    assert err.count("\n") == 1 and "did not answer" in err
@@ -0,0 +1,72 @@
+import pytest
+
+from mitschreiber.backends import HashBackend
+from mitschreiber.dedup import NearDuplicateGate, normalize, simhash
+
+
+def test_normalize_drops_trivial_variation():
+    assert normalize("main.rs ● - VS Code") == normalize("main.rs - VS Code") == "main.rs - vs code"
+    assert normalize("Inbox (3) - Thunderbird") == normalize("Inbox (12) - Thunderbird")
+    assert normalize("Kalender 09:41") == normalize("Kalender 9:42 PM") == "kalender"
+    assert normalize("*notes.txt - gedit") == "notes.txt - gedit"
+    assert normalize("Rechnung 2024-03.pdf — Okular") == "rechnung 2024-03.pdf — okular"
+
+
+def test_simhash_is_close_for_small_edits_and_far_for_other_texts():
+    base = simhash(normalize("Re: Quarterly report draft - Inbox - Mozilla Thunderbird"))
+    near = simhash(normalize("Re: Quarterly report draft. - Inbox - Mozilla Thunderbird"))
+    other = simhash(normalize("Rust borrow checker - Google Search"))
+    assert (base ^ near).bit_count() <= 16 < 32 < (base ^ other).bit_count()
+
+
+def test_gate_skips_near_duplicates_per_app():
+    gate = NearDuplicateGate(threshold=0.9, memory=2)
+    assert gate.admit("code", "session.py ● - mitschreiber - Visual Studio Code")
+    assert not gate.admit("code", "session.py - mitschreiber - Visual Studio Code")
+    assert gate.admit("code", "dedup.py - mitschreiber - Visual Studio Code")
+    # Same text, other app: compared separately.
+    assert gate.admit("kitty", "session.py - mitschreiber - Visual Studio Code")
+    assert gate.admit("code", "README.md - heimgewebe - Visual Studio Code")
+    # memory=2: the first title has been forgotten.
+    assert gate.admit("code", "session.py - mitschreiber - Visual Studio Code")
+    assert gate.stats() == {"checked": 6, "skipped": 1, "apps": 2}
+
+
+def test_gate_threshold_one_only_skips_normalized_repeats():
+    gate = NearDuplicateGate(threshold=1.0)
+    assert gate.admit("mail", "Re: Quarterly report draft - Inbox")
+    assert gate.admit("mail", "Re: Quarterly report draft. - Inbox")
+    assert not gate.admit("mail", "Re: Quarterly report draft. - Inbox (2)")
+
+
+def test_gate_keeps_documents_that_differ_only_in_numbers():
+    gate = NearDuplicateGate(threshold=0.8)
+    assert gate.admit("okular", "Rechnung 2024-03.pdf — Okular")
+    assert gate.admit("okular", "Rechnung 2024-04.pdf — Okular")
+    title = "Fix crash on resume · Pull Request #{} · heimgewebe/mitschreiber — Mozilla Firefox"
+    assert gate.admit("firefox", title.format(1234))
+    assert gate.admit("firefox", title.format(1235))
+    assert not gate.admit("firefox", "● " + title.format(1235))
+    assert gate.stats()["skipped"] == 1
+
+
+def test_gate_validates_and_bounds_apps():
+    with pytest.raises(ValueError):
+        NearDuplicateGate(threshold=0)
+    with pytest.raises(ValueError):
+        NearDuplicateGate(memory=0)
+    gate = NearDuplicateGate(max_apps=2)
+    for app in ("a", "b", "c"):
+        gate.admit(app, "same title")
+    assert gate.stats()["apps"] == 2
+    assert gate.admit("a", "same title")
+
+
+def test_embed_batch_drops_near_duplicates_before_the_model():
+    from mitschreiber.session import _build_embed_batch
+
+    gate = NearDuplicateGate()
+    evts = [{"session": "s", "app": "thunderbird", "window": f"Inbox ({n}) - Mozilla Thunderbird"} for n in range(5)]
+    out = _build_embed_batch(evts + [{"session": "s", "app": "kitty", "window": "vim"}], HashBackend(), dedup=gate)
+    assert [e["app"] for e in out] == ["thunderbird", "kitty"]
+    assert gate.stats()["skipped"] == 4
@@ -0,0 +1,124 @@
+import sqlite3
+from array import array
+
+import pytest
+
+from mitschreiber import embed
+from mitschreiber.backends import HashBackend
+from mitschreiber.embed_cache import EmbeddingCache
+
+
+def test_lru_evicts_least_recently_used():
+    cache = EmbeddingCache(max_entries=2)
+    cache.put("m", "a", [1.0])
+    cache.put("m", "b", [2.0])
+    assert cache.get("m", "a") == [1.0]  # refresh "a"
+    cache.put("m", "c", [3.0])
+    assert cache.get("m", "b") is None
+    assert cache.get("m", "a") == [1.0]
+    assert cache.get("m", "c") == [3.0]
+    assert cache.stats() == {"hits": 3, "disk_hits": 0, "misses": 1, "entries": 2}
+
+
+def test_cache_is_keyed_by_model():
+    cache = EmbeddingCache()
+    cache.put("model-a", "h", [0.5])
+    assert cache.get("model-b", "h") is None
+
+
+def test_persistent_store_survives_restart(tmp_path):
+    db = tmp_path / "cache" / "embeddings.sqlite3"
+    first = EmbeddingCache(path=db)
+    first.put_many("m", [("h1", [0.25, -0.5]), ("h2", [1.0, 0.0])])
+    first.close()
+
+    second = EmbeddingCache(path=db)
+    assert second.get("m", "h1") == [0.25, -0.5]
+    assert second.stats()["disk_hits"] == 1
+    second.close()
+
+
+def test_build_embed_events_skips_model_on_hits(monkeypatch):
+    calls = []
+
+    def fake_batch(backend, texts):
+        calls.append(list(texts))
+        return [[float(len(t))] * 8 for t in texts]
+
+    monkeypatch.setattr(embed, "_embed_batch", fake_batch)
+    cache = EmbeddingCache()
+    items = [
+        ("vscode | main.py", "s", "vscode", "main.py"),
+        ("vscode | main.py", "s", "vscode", "main.py"),
+        ("firefox | docs", "s", "firefox", "docs"),
+    ]
+    out = embed.build_embed_events(items, HashBackend(), cache=cache)
+    # Duplicate texts within a batch are encoded once.
+    assert calls == [["vscode | main.py", "firefox | docs"]]
+    assert [evt["embedding"][0] for (evt, _) in out] == [16.0, 16.0, 14.0]
+
+    embed.build_embed_events(items[:1], HashBackend(), cache=cache)
+    assert len(calls) == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_store_is_float32_and_evicts_least_recently_used(tmp_path, monkeypatch):
+    db = tmp_path / "embeddings.sqlite3"
+    clock = [1_000_000.0]
+    monkeypatch.setattr("mitschreiber.embed_cache.time.time", lambda: clock[0])
+    cache = EmbeddingCache(max_entries=1, path=db, max_disk_entries=10)
+    for i in range(10):
+        clock[0] += 1
+        cache.put("m", f"h{i}", [0.1, float(i)])
+    ((size,),) = cache._db.execute("SELECT length(vec) FROM embeddings LIMIT 1")
+    assert size == 2 * 4
+    clock[0] += 1
+    assert cache.get("m", "h0") == pytest.approx([0.1, 0.0])  # from disk: now most recently used
+    clock[0] += 1
+    cache.put("m", "h10", [1.0, 1.0])
+    stored = {h for (h,) in cache._db.execute("SELECT hash FROM embeddings")}
+    # Over the cap: the least recently used (plus 10% slack) go, h0 was just used.
+    assert stored == {"h0", "h3", "h4", "h5", "h6", "h7", "h8", "h9", "h10"}
+    cache.close()
+
+
+def test_prune_drops_entries_unused_for_the_retention_period(tmp_path, monkeypatch):
+    db = tmp_path / "embeddings.sqlite3"
+    clock = [1_000_000.0]
+    monkeypatch.setattr("mitschreiber.embed_cache.time.time", lambda: clock[0])
+    cache = EmbeddingCache(path=db)
+    cache.put("m", "old", [1.0])
+    clock[0] += 3 * 86400
+    cache.put("m", "new", [2.0])
+    assert cache.prune(2) == 1
+    assert {h for (h,) in cache._db.execute("SELECT hash FROM embeddings")} == {"new"}
+    cache.close()
+
+
+def test_store_of_an_older_version_is_replaced(tmp_path):
+    db = tmp_path / "embeddings.sqlite3"
+    con = sqlite3.connect(str(db))
+    con.execute("CREATE TABLE embeddings (model TEXT, hash TEXT, vec BLOB, PRIMARY KEY (model, hash))")
+    con.execute("INSERT INTO embeddings VALUES ('m', 'h', ?)", (array("d", [0.5]).tobytes(),))
+    con.commit()
+    con.close()
+    cache = EmbeddingCache(path=db)
+    assert cache.get("m", "h") is None
+    cache.put("m", "h", [0.5])
+    assert cache.get("m", "h") == [0.5]
+    cache.close()
+
+
+def test_prune_command_also_cleans_the_cache(tmp_path, monkeypatch, capsys):
+    from mitschreiber.cli import main
+
+    db = tmp_path / "cache" / "embeddings.sqlite3"
+    cache = EmbeddingCache(path=db)
+    cache.put("m", "h", [1.0])
+    cache._db.execute("UPDATE embeddings SET last_used = 0")
+    cache._db.commit()
+    cache.close()
+    monkeypatch.setattr("mitschreiber.embed_cache.DEFAULT_CACHE_PATH", db)
+    monkeypatch.setattr("mitschreiber.cli.WAL_DIR", tmp_path / "wal")
+    main(["prune", "--retention-days", "7"])
+    assert "1 cached embedding(s) removed." in capsys.readouterr().out
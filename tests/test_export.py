@@ -0,0 +1,94 @@
+import os
+from unittest.mock import patch
+
+import pytest
+
+from mitschreiber.cli import main
+from mitschreiber.export import export_wal, load_manifest, pending
+from mitschreiber.quantize import Compaction
+from mitschreiber.wal import WalWriter
+
+
+def _write_wal(path, states=3, embeds=2, encoding="float32"):
+    compaction = Compaction(encoding)
+    with WalWriter(path) as writer:
+        for i in range(states):
+            writer.append(
+                {"ts": f"2025-01-01T12:00:0{i}Z", "source": "os.context.state", "session": "s", "app": "kitty", "window": f"w{i}"}
+            )
+        for i in range(embeds):
+            vec, meta = compaction.apply([0.5, -0.25, 0.125, 0.0, 1.0, -1.0, 0.75, 0.3])
+            writer.append(
+                {
+                    "ts": f"2025-01-01T12:00:1{i}Z",
+                    "source": "os.context.text.embed",
+                    "session": "s",
+                    "app": "kitty",
+                    "window": "w",
+                    "embedding": vec,
+                    "keyphrases": ["rust", "borrow"],
+                    "hash_id": f"h{i}",
+                    "meta": dict(meta, model="hash32-demo"),
+                }
+            )
+        writer.append({"ts": "2025-01-01T12:00:30Z", "source": "os.context.unknown"})
+
+
+def test_pending_skips_unchanged_files(tmp_path):
+    wal = tmp_path / "session-a.jsonl"
+    _write_wal(wal)
+    (tmp_path / "out" / "state").mkdir(parents=True)
+    (tmp_path / "out" / "state" / "session-a.parquet").touch()
+    stat = wal.stat()
+    entry = {"name": wal.name, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "outputs": ["state/session-a.parquet"]}
+    manifest = {wal.name: entry}
+    assert pending([wal], manifest, tmp_path / "out") == []
+
+    # Grown, touched, or its output deleted: export again.
+    with open(wal, "a") as f:
+        f.write("\n")
+    assert pending([wal], manifest, tmp_path / "out") == [wal]
+    manifest[wal.name] = dict(entry, size=wal.stat().st_size, mtime_ns=wal.stat().st_mtime_ns)
+    (tmp_path / "out" / "state" / "session-a.parquet").unlink()
+    assert pending([wal], manifest, tmp_path / "out") == [wal]
+    assert pending([tmp_path / "gone.jsonl"], {}, tmp_path / "out") == []
+
+
+def test_export_command_without_pyarrow(tmp_path, capsys):
+    with patch.dict("sys.modules", {"pyarrow": None}), \
+         patch("mitschreiber.cli.WAL_DIR", tmp_path), \
+         patch("sys.argv", ["mitschreiber", "export", "-o", str(tmp_path / "out")]):
+        assert main() == 2
+    assert "mitschreiber[export]" in capsys.readouterr().err
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_export_writes_typed_tables_incrementally(tmp_path, jobs):
+    pq = pytest.importorskip("pyarrow.parquet")
+    wal_dir, out = tmp_path / "wal", tmp_path / "out"
+    wal_dir.mkdir()
+    _write_wal(wal_dir / "session-a.jsonl")
+    _write_wal(wal_dir / "session-b.jsonl", states=1, embeds=3, encoding="int8")
+
+    summary = export_wal(wal_dir, out, jobs=jobs, batch_rows=2)
+    assert summary["exported"] == 2 and summary["rows"] == {"state": 4, "embed": 5}
+
+    state = pq.read_table(out / "state" / "session-a.parquet")
+    assert state.num_rows == 3 and state.schema.field("ts").type.tz == "UTC"
+    assert state.column("window").to_pylist() == ["w0", "w1", "w2"]
+    embed = pq.read_table(out / "embed" / "dim=8" / "session-b.parquet")
+    assert str(embed.schema.field("embedding").type) == "fixed_size_list<item: float>[8]"
+    assert embed.column("embedding").to_pylist()[0][0] == pytest.approx(0.5, abs=0.01)
+    assert embed.column("keyphrases").to_pylist()[0] == ["rust", "borrow"]
+
+    assert export_wal(wal_dir, out, jobs=jobs)["exported"] == 0
+    for stale in wal_dir.glob("session-a.*"):
+        stale.unlink()
+    _write_wal(wal_dir / "session-a.jsonl", states=5, embeds=0)
+    again = export_wal(wal_dir, out, jobs=jobs)
+    assert again["exported"] == 1 and again["unchanged"] == 1
+    # Outputs the new version no longer has are removed.
+    assert not (out / "embed" / "dim=8" / "session-a.parquet").exists()
+    assert load_manifest(out)["session-a.jsonl"]["rows"] == {"state": 5}
+    assert not [p for p in out.rglob("*.tmp")]
+    assert os.path.exists(out / "manifest.json")
@@ -0,0 +1,55 @@
+from mitschreiber import embed
+from mitschreiber.backends import HashBackend
+from mitschreiber.keyphrases import CountMinSketch, KeyphraseEngine
+
+
+def test_sketch_never_undercounts_and_roundtrips():
+    sketch = CountMinSketch(width=64, depth=3)
+    counts = {f"term{i}": i % 7 + 1 for i in range(200)}
+    for term, n in counts.items():
+        sketch.add(sketch.slots(term), n)
+    assert all(sketch.estimate(sketch.slots(t)) >= n for t, n in counts.items())
+
+    copy = CountMinSketch.from_bytes(sketch.to_bytes())
+    assert copy.table == sketch.table and copy.documents == sketch.documents
+
+
+def test_terms_common_to_the_session_sink():
+    engine = KeyphraseEngine(top_k=2)
+    for topic in ("borrow checker", "lifetimes", "tokio runtime", "serde derive"):
+        engine.extract(f"code | rust {topic} — vscode")
+    # "code", "rust" and "vscode" are in every document; the new topic words win.
+    assert engine.extract("code | rust async traits — vscode") == ["async", "traits"]
+
+
+def test_batches_score_like_single_calls():
+    texts = [f"firefox | docs page {i} — mozilla firefox" for i in range(5)] + ["kitty | cargo build"]
+    one, many = KeyphraseEngine(), KeyphraseEngine()
+    singles = [one.extract(t) for t in texts]
+    batched = many.extract_many(texts)
+    assert batched[-1] == singles[-1] == ["kitty", "cargo", "build"]
+    assert one.session.table == many.session.table
+
+
+def test_global_frequencies_persist_across_sessions(tmp_path):
+    path = tmp_path / "kp.cms"
+    first = KeyphraseEngine(path=path)
+    first.extract_many(["obsidian | wochenplan notizen"] * 20)
+    first.save()
+
+    second = KeyphraseEngine(path=path, top_k=1)
+    assert second.global_.documents == 20 and second.session.documents == 0
+    # "notizen" is known from the last session, the new word is not.
+    assert second.extract("obsidian | notizen gartenplanung") == ["gartenplanung"]
+
+    path.write_bytes(b"garbage")
+    assert KeyphraseEngine(path=path).global_.documents == 0
+
+
+def test_build_embed_events_uses_the_engine(monkeypatch):
+    monkeypatch.setattr(embed, "_embed_batch", lambda backend, texts: [[0.0] for _ in texts])
+    engine = KeyphraseEngine()
+    items = [("vscode | main.py mitschreiber", "s", "vscode", "main.py")] * 3
+    out = embed.build_embed_events(items, HashBackend(), keyphraser=engine)
+    assert out[0][0]["keyphrases"] == ["vscode", "main", "mitschreiber"]
+    assert engine.session.documents == 3
@@ -0,0 +1,70 @@
+import urllib.request
+
+import pytest
+
+from mitschreiber.metrics import CONTENT_TYPE, MetricFamily, MetricsServer, Registry
+from mitschreiber.wal import WalWriter
+
+
+def test_text_format():
+    reg = Registry()
+    reg.counter("demo_events_total", "Events.", ["session"]).labels(session='a"b').inc(3)
+    reg.gauge("demo_depth", "Depth.").set(7)
+    hist = reg.histogram("demo_seconds", "Latency.", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5):
+        hist.observe(value)
+    reg.add_collector(lambda: [MetricFamily("demo_probes_total", "counter", "Probes.").add(2, session="s1")])
+
+    text = reg.render()
+    assert "# TYPE demo_events_total counter\n" in text
+    assert 'demo_events_total{session="a\\"b"} 3\n' in text
+    assert "demo_depth 7\n" in text
+    assert 'demo_seconds_bucket{le="0.1"} 1\n' in text
+    assert 'demo_seconds_bucket{le="1"} 2\n' in text
+    assert 'demo_seconds_bucket{le="+Inf"} 3\n' in text
+    assert "demo_seconds_sum 5.55\n" in text
+    assert "demo_seconds_count 3\n" in text
+    assert 'demo_probes_total{session="s1"} 2\n' in text
+
+
+def test_registry_rejects_conflicting_and_negative_updates():
+    reg = Registry()
+    counter = reg.counter("demo_total", "Demo.")
+    assert reg.counter("demo_total", "Demo.") is counter
+    with pytest.raises(ValueError):
+        reg.gauge("demo_total", "Demo.")
+    with pytest.raises(ValueError):
+        counter.inc(-1)
+    with pytest.raises(ValueError):
+        reg.counter("labelled_total", "Demo.", ["session"]).inc()
+
+
+def test_server_serves_metrics_on_loopback():
+    reg = Registry()
+    reg.counter("demo_total", "Demo.").inc()
+    with MetricsServer(0, reg) as server:
+        assert server.httpd.server_address[0] == "127.0.0.1"
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics") as resp:
+            assert resp.headers["Content-Type"] == CONTENT_TYPE
+            assert "demo_total 1" in resp.read().decode()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"http://127.0.0.1:{server.port}/other")
+
+
+def test_wal_writes_are_instrumented(tmp_path):
+    from mitschreiber.metrics import REGISTRY
+
+    def value(name):
+        for family in REGISTRY.collect():
+            for sample_name, _, v in family.samples:
+                if sample_name == name:
+                    return v
+        return 0
+
+    before_bytes = value("mitschreiber_wal_written_bytes_total")
+    before_writes = value("mitschreiber_wal_write_seconds_count")
+    with WalWriter(tmp_path / "w.jsonl", group_commit=True) as writer:
+        writer.append({"a": 1})
+        writer.append({"a": 2})
+    assert value("mitschreiber_wal_written_bytes_total") - before_bytes == (tmp_path / "w.jsonl").stat().st_size
+    assert value("mitschreiber_wal_write_seconds_count") - before_writes == 1
@@ -0,0 +1,79 @@
+import io
+import json
+import math
+
+import pytest
+
+from mitschreiber import embed, walbin
+from mitschreiber.backends import HashBackend
+from mitschreiber.quantize import Compaction, dequantize, to_float16, to_int8, truncate
+
+
+def _unit(dim, seed=1):
+    vec = [math.sin(seed * (i + 1)) for i in range(dim)]
+    norm = math.sqrt(sum(x * x for x in vec))
+    return [x / norm for x in vec]
+
+
+def test_truncation_renormalizes():
+    vec = truncate(_unit(64), 16)
+    assert len(vec) == 16
+    assert math.isclose(sum(x * x for x in vec), 1.0, rel_tol=1e-12)
+
+
+def test_int8_is_symmetric_and_restorable():
+    vec = _unit(384)
+    values, scale = to_int8(vec)
+    assert max(abs(q) for q in values) == 127 and all(isinstance(q, int) for q in values)
+    restored = dequantize(values, {"quant": "int8", "scale": scale})
+    assert max(abs(a - b) for a, b in zip(vec, restored)) <= scale / 2 + 1e-12
+    assert to_int8([0.0] * 8) == ([0] * 8, 1.0)
+
+
+def test_float16_prints_short_decimals():
+    values = to_float16([0.1, -0.0333333333, 1 / 3])
+    assert values == [0.1, -0.03333, 0.3333]
+    assert len(json.dumps(to_float16(_unit(384)))) < len(json.dumps(_unit(384))) / 2
+
+
+def test_compaction_validates_and_tags_meta():
+    with pytest.raises(ValueError):
+        Compaction("bf16")
+    with pytest.raises(ValueError):
+        Compaction(dim=4)
+    values, meta = Compaction("int8", dim=32).apply(_unit(384))
+    assert len(values) == 32
+    assert meta["quant"] == "int8" and meta["truncated_from"] == 384 and meta["scale"] > 0
+    assert not Compaction().enabled
+
+
+@pytest.mark.parametrize("encoding, kind", [("float16", walbin.KIND_EMBED_F16), ("int8", walbin.KIND_EMBED_I8)])
+def test_binary_wal_stores_compact_kinds(encoding, kind):
+    values, meta = Compaction(encoding).apply(_unit(384))
+    evt = {"source": "os.context.text.embed", "embedding": values, "meta": dict(meta, model="m")}
+    frame = walbin.encode_record(evt)
+    assert frame[4] == kind
+    assert len(frame) < len(walbin.encode_record(dict(evt, meta={"model": "m"}))) * 0.6
+
+    out = io.BytesIO()
+    walbin.to_jsonl(io.BytesIO(walbin.MAGIC + frame), out)
+    assert json.loads(out.getvalue())["embedding"] == values
+
+
+def test_embed_events_carry_compacted_vectors(monkeypatch):
+    monkeypatch.setattr(embed, "_embed_batch", lambda backend, texts: [_unit(64) for _ in texts])
+    items = [("kitty | vim", "s", "kitty", "vim")]
+    [(evt, _)] = embed.build_embed_events(items, HashBackend(), compaction=Compaction("int8", 16))
+    assert len(evt["embedding"]) == 16 and evt["meta"]["quant"] == "int8"
+
+
+def test_eval_harness_reports_recall_and_size():
+    pytest.importorskip("numpy")
+    from benchmarks.quantize_eval import evaluate
+    from mitschreiber.backends import create_backend
+
+    texts = [f"window {i} of app {i % 7}" for i in range(120)]
+    rows = evaluate(texts, create_backend("hash"), dims=(None, 16), k=5)
+    assert [(r["encoding"], r["dim"]) for r in rows][:3] == [("float32", 32), ("float16", 32), ("int8", 32)]
+    assert rows[0]["recall@5"] == 1.0
+    assert rows[2]["json_bytes"] < rows[0]["json_bytes"] / 2
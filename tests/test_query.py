@@ -0,0 +1,100 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+from mitschreiber.query import query
+from mitschreiber.util import parse_ts
+from mitschreiber.wal import SegmentedWalWriter, WalWriter
+from mitschreiber.walindex import load_index
+
+BASE = datetime(2025, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def _state(minute, app="vscode", session="s1"):
+    ts = (BASE + timedelta(minutes=minute)).isoformat()
+    return {"ts": ts, "app": app, "window": "w", "source": "os.context.state", "session": session}
+
+
+def _write(tmp_path, fmt="jsonl", minutes=range(0, 240), compression="gzip"):
+    with SegmentedWalWriter(
+        tmp_path, "session-s1", compression=compression, fmt=fmt, index=True, max_segment_age_s=0
+    ) as writer:
+        for m in minutes:
+            writer.append(_state(m, app="firefox" if m % 2 else "vscode"))
+
+
+def _epoch(minute):
+    return (BASE + timedelta(minutes=minute)).timestamp()
+
+
+def test_index_blocks_cover_time_ranges(tmp_path, monkeypatch):
+    monkeypatch.setattr("mitschreiber.walindex.INDEX_BLOCK_BYTES", 1024)
+    wal = tmp_path / "session-x.jsonl"
+    with WalWriter(wal, index=True) as writer:
+        for m in range(100):
+            writer.append(_state(m))
+    idx = load_index(wal)
+    assert idx.closed
+    assert idx.end == wal.stat().st_size
+    assert len(idx.entries) > 1
+    assert idx.t0 == _epoch(0)
+    assert idx.t1 == _epoch(99) + 1
+    assert sum(e.n for e in idx.entries) == 100
+
+
+def test_query_time_range_and_filters(tmp_path):
+    _write(tmp_path)
+    recs = list(query(tmp_path, since=_epoch(60), until=_epoch(120)))
+    assert [parse_ts(r["ts"]) for r in recs] == [_epoch(m) for m in range(60, 120)]
+
+    recs = list(query(tmp_path, since=_epoch(60), until=_epoch(70), app="firefox"))
+    assert len(recs) == 5 and all(r["app"] == "firefox" for r in recs)
+
+    assert list(query(tmp_path, since=_epoch(1000))) == []
+
+
+def test_query_binary_segments(tmp_path):
+    _write(tmp_path, fmt="binary")
+    recs = list(query(tmp_path, since=_epoch(10), until=_epoch(12)))
+    assert [r["app"] for r in recs] == ["vscode", "firefox"]
+
+
+def test_query_scans_unindexed_tail(tmp_path):
+    wal = tmp_path / "session-t.jsonl"
+    with WalWriter(wal, index=True) as writer:
+        writer.append(_state(0))
+    # Records appended without the indexing writer (e.g. after a crash) are still found.
+    with open(wal, "a", encoding="utf-8") as fh:
+        fh.write(json.dumps(_state(5)) + "\n")
+    with open(tmp_path / "session-t.jsonl.idx", "a", encoding="utf-8") as fh:
+        fh.write(json.dumps({"off": 0, "end": 1, "t0": 0, "t1": 1, "n": 0}) + "\n")
+    recs = list(query(tmp_path, since=_epoch(4)))
+    assert [parse_ts(r["ts"]) for r in recs] == [_epoch(5)]
+
+
+def test_query_without_index_scans_everything(tmp_path):
+    wal = tmp_path / "session-legacy.jsonl"
+    with WalWriter(wal) as writer:
+        for m in range(10):
+            writer.append(_state(m))
+    assert len(list(query(tmp_path, since=_epoch(5)))) == 5
+
+
+def test_source_filter_decodes_only_matching_records(tmp_path, monkeypatch):
+    for fmt in ("jsonl", "binary"):
+        wal_dir = tmp_path / fmt
+        wal_dir.mkdir()
+        with WalWriter(wal_dir / f"session-s1.{'mwal' if fmt == 'binary' else 'jsonl'}", fmt=fmt, index=True) as writer:
+            for m in range(50):
+                writer.append(_state(m))
+                if m % 10 == 9:
+                    writer.append(dict(_state(m), source="os.context.rollup"))
+        parsed = []
+        real_loads = json.loads
+        # json is one module object: this sees every parse (WAL records and index lines).
+        monkeypatch.setattr("json.loads", lambda s: parsed.append(s if isinstance(s, bytes) else s.encode()) or real_loads(s))
+        for since in (None, _epoch(20)):
+            parsed.clear()
+            recs = list(query(wal_dir, since=since, source="os.context.rollup"))
+            assert [r["source"] for r in recs] == ["os.context.rollup"] * (5 if since is None else 3)
+            assert not [s for s in parsed if b"os.context.state" in s]
+        monkeypatch.undo()
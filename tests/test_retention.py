@@ -0,0 +1,67 @@
+import os
+
+from mitschreiber.retention import enforce_retention, wal_segments
+from mitschreiber.wal import SegmentedWalWriter, WalWriter, lock_path_for, segment_in_use
+
+DAY = 86400.0
+
+
+def _segment(wal_dir, name, size, age_days, now):
+    p = wal_dir / name
+    p.write_bytes(b"x" * size)
+    mtime = now - age_days * DAY
+    os.utime(p, (mtime, mtime))
+    return p
+
+
+def test_age_budget_deletes_only_old_segments(tmp_path):
+    now = 1_700_000_000.0
+    old = _segment(tmp_path, "session-a-00000.jsonl.gz", 10, 10, now)
+    new = _segment(tmp_path, "session-a-00001.jsonl.gz", 10, 1, now)
+    removed = enforce_retention(tmp_path, max_age_days=7, now=now)
+    assert removed == [old]
+    assert new.exists()
+
+
+def test_size_budget_deletes_oldest_first_and_spares_active(tmp_path):
+    now = 1_700_000_000.0
+    a = _segment(tmp_path, "session-a-00000.jsonl.gz", 100, 3, now)
+    b = _segment(tmp_path, "session-b-00000.jsonl.gz", 100, 2, now)
+    active = _segment(tmp_path, "session-b-00001.jsonl", 100, 0, now)
+    removed = enforce_retention(tmp_path, max_bytes=150, protect=[active], now=now)
+    assert removed == [a, b]
+    assert active.exists()
+
+
+def test_open_segments_of_other_sessions_are_kept_however_quiet(tmp_path):
+    now = 1_700_000_000.0
+    with WalWriter(tmp_path / "session-c-00000.jsonl") as writer:
+        writer.append({"source": "os.context.state"})
+        # Quiet for days (--change-only --heartbeat 0): still open, so still live.
+        os.utime(writer.path, (now - 3 * DAY, now - 3 * DAY))
+        assert enforce_retention(tmp_path, max_bytes=1, now=now) == []
+        assert writer.path.exists()
+    # Closed (or its writer crashed): no lock, no protection.
+    assert enforce_retention(tmp_path, max_bytes=1, now=now) == [writer.path]
+    assert not lock_path_for(writer.path).exists()
+
+
+def test_segments_stay_live_until_sealed(tmp_path):
+    writer = SegmentedWalWriter(tmp_path, "session-d", max_segment_bytes=1, compression="gzip")
+    with writer:
+        writer.append({"n": 1})
+        first = writer.path
+        writer.append({"n": 2})
+        assert writer.path != first
+        # The rotated segment is either still locked for sealing or already compressed.
+        assert segment_in_use(first) or not first.exists()
+    assert not list(tmp_path.glob("*.lock"))
+    assert {p.name for p in wal_segments(tmp_path)} == {"session-d-00000.jsonl.gz", "session-d-00001.jsonl.gz"}
+
+
+def test_wal_segments_ignores_other_files(tmp_path):
+    (tmp_path / "session-a-00000.jsonl.gz.tmp").write_bytes(b"")
+    (tmp_path / "notes.txt").write_bytes(b"")
+    seg = tmp_path / "session-a-00000.jsonl"
+    seg.write_bytes(b"")
+    assert wal_segments(tmp_path) == [seg]
@@ -0,0 +1,112 @@
+import json
+from unittest.mock import patch
+
+import pytest
+
+from mitschreiber.cli import main
+from mitschreiber.rollup import OTHER, ROLLUP_SOURCE, RollupAggregator, _iso, gap_limit, parse_windows, report, rollup_segments
+from mitschreiber.wal import WalWriter
+
+T0 = 1_735_732_800  # 2025-01-01T12:00:00Z, aligned to the hour
+
+
+def _state(t, app, window="w", **extra):
+    return dict({"ts": _iso(t), "source": "os.context.state", "app": app, "window": window}, **extra)
+
+
+def _run(agg, events, end):
+    out = []
+    for evt in events:
+        out += agg.observe(evt)
+    return out + agg.flush(end)
+
+
+def test_dwell_is_split_at_window_boundaries():
+    agg = RollupAggregator("s", windows=(60, 3600))
+    out = _run(agg, [_state(T0 + 30, "kitty"), _state(T0 + 90, "firefox")], T0 + 120)
+    minutes = [r for r in out if r["window_s"] == 60]
+    assert [(r["start"], r["apps"]) for r in minutes] == [
+        (_iso(T0), [{"app": "kitty", "seconds": 30.0}]),
+        (_iso(T0 + 60), [{"app": "kitty", "seconds": 30.0}, {"app": "firefox", "seconds": 30.0}]),
+    ]
+    [hour] = [r for r in out if r["window_s"] == 3600]
+    assert hour["total_s"] == 90.0 and hour["source"] == ROLLUP_SOURCE and hour["ts"] == hour["end"]
+
+
+def test_windows_close_on_time_and_gaps_are_capped():
+    agg = RollupAggregator("s", windows=(60,), max_gap_s=10)
+    assert agg.observe(_state(T0 + 5, "kitty")) == []
+    [closed] = agg.advance(T0 + 300)
+    assert closed["apps"] == [{"app": "kitty", "seconds": 10.0}]
+    # Closing records (change-only mode) repeat the old context and are ignored.
+    assert agg.observe(_state(T0 + 400, "kitty", dwell_ms=1000)) == []
+
+
+def test_without_heartbeats_long_dwell_is_credited_in_full():
+    # --change-only --heartbeat 0: a context held for 30 minutes emits no state in between.
+    agg = RollupAggregator("s", windows=(3600,), max_gap_s=gap_limit(0))
+    agg.observe(_state(T0, "okular"))
+    assert agg.advance(T0 + 1800) == []
+    agg.observe(_state(T0 + 1800, "okular", dwell_ms=1_800_000))
+    agg.observe(_state(T0 + 1800, "kitty"))
+    [hour] = agg.flush(T0 + 1860)
+    assert hour["apps"] == [{"app": "okular", "seconds": 1800.0}, {"app": "kitty", "seconds": 60.0}]
+
+
+def test_gap_limit_follows_the_confirmation_interval():
+    assert gap_limit(1000) == 600.0
+    assert gap_limit(900_000) == 1800.0
+    assert gap_limit(0) is None and gap_limit(None) is None
+
+
+def test_titles_are_bounded_per_window():
+    agg = RollupAggregator("s", windows=(3600,), max_keys=2)
+    events = [_state(T0 + i, "code", f"file{i}.py") for i in range(5)]
+    [hour] = _run(agg, events, T0 + 5)
+    assert len(hour["windows"]) == 3
+    assert {"app": "code", "window": OTHER, "seconds": 3.0} in hour["windows"]
+
+
+def test_parse_windows():
+    assert parse_windows("1h,1m,15m") == (60, 900, 3600)
+    assert parse_windows("off") == ()
+    with pytest.raises(ValueError):
+        parse_windows("5x")
+
+
+def test_report_picks_the_coarsest_aligned_resolution():
+    agg = RollupAggregator("s", windows=(60, 900))
+    events = [_state(T0 + 60 * i, "kitty" if i < 20 else "firefox") for i in range(30)]
+    records = _run(agg, events, T0 + 1800)
+    resolution, rows = report(records, since=T0, until=T0 + 1800)
+    assert resolution == 900
+    assert rows == [{"app": "kitty", "seconds": 1200.0}, {"app": "firefox", "seconds": 600.0}]
+    # Not aligned to 15 minutes: fall back to minutes, only whole windows inside the range count.
+    resolution, rows = report(records, since=T0 + 120, until=T0 + 1800)
+    assert resolution == 60 and sum(r["seconds"] for r in rows) == 1680.0
+
+
+def test_report_command_reads_rollups_from_the_wal(tmp_path, capsys):
+    agg = RollupAggregator("s", windows=(60, 3600))
+    events = [_state(T0 + 10 * i, "kitty" if i % 3 else "firefox", f"t{i % 2}") for i in range(360)]
+    with WalWriter(tmp_path / "session-s.jsonl") as writer:
+        for evt in events:
+            writer.append(evt)
+    with WalWriter(tmp_path / "rollups-s.jsonl") as writer:
+        for rollup in _run(agg, events, T0 + 3600):
+            writer.append(rollup)
+    assert rollup_segments(tmp_path) == [tmp_path / "rollups-s.jsonl"]
+
+    with patch("mitschreiber.cli.WAL_DIR", tmp_path), \
+         patch("sys.argv", ["mitschreiber", "report", "--since", _iso(T0), "--until", _iso(T0 + 3600), "--json"]):
+        assert main() == 0
+    rows = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [r["app"] for r in rows] == ["kitty", "firefox"]
+    assert rows[0]["resolution_s"] == 3600
+    assert sum(r["seconds"] for r in rows) == 3600.0
+
+    with patch("mitschreiber.cli.WAL_DIR", tmp_path), \
+         patch("sys.argv", ["mitschreiber", "report", "--by", "window", "--resolution", "1m"]):
+        main()
+    out = capsys.readouterr().out
+    assert "kitty | t1" in out and "1:00:00  total" in out
@@ -0,0 +1,169 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from mitschreiber.sink import ChronikSink, SinkError
+from mitschreiber.wal import SegmentedWalWriter, WalWriter
+
+
+class FakeChronik:
+    """
+    Stand-in ingest endpoint: records every accepted batch; `fail` holds
+    statuses to answer with before accepting again.
+    """
+
+    def __init__(self):
+        self.batches = []
+        self.fail = []
+        self.auth = []
+        self.connections = set()
+        owner = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                owner.connections.add(self.client_address)
+                owner.auth.append(self.headers.get("Authorization"))
+                status = owner.fail.pop(0) if owner.fail else 200
+                if status == 200:
+                    owner.batches.append([json.loads(line) for line in body.splitlines()])
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/ingest"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def records(self):
+        return [rec for batch in self.batches for rec in batch]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def chronik():
+    server = FakeChronik()
+    yield server
+    server.close()
+
+
+def _sink(chronik, tmp_path, **kwargs):
+    kwargs.setdefault("backoff_base_s", 0.01)
+    return ChronikSink(
+        chronik.url, "secret", wal_dir=tmp_path / "wal", checkpoint_path=tmp_path / "sink" / "cp.json", **kwargs
+    )
+
+
+def _write(tmp_path, start, stop, name="session-s1.jsonl"):
+    with WalWriter(tmp_path / "wal" / name) as writer:
+        for n in range(start, stop):
+            writer.append({"ts": "2025-01-01T12:00:00Z", "source": "os.context.state", "n": n})
+
+
+def test_ships_in_batches_over_one_connection_and_resumes(chronik, tmp_path):
+    _write(tmp_path, 0, 25)
+    stats = _sink(chronik, tmp_path, batch_records=10).ship()
+    assert stats["sent_records"] == 25 and stats["sent_batches"] == 3
+    assert [len(b) for b in chronik.batches] == [10, 10, 5]
+    assert len(chronik.connections) == 1
+    assert set(chronik.auth) == {"Bearer secret"}
+
+    # A restart only sends what was appended since.
+    _write(tmp_path, 25, 30)
+    _sink(chronik, tmp_path, batch_records=10).ship()
+    assert [r["n"] for r in chronik.records] == list(range(30))
+
+
+def test_retries_with_backoff_and_skips_rejected_batches(chronik, tmp_path):
+    _write(tmp_path, 0, 4)
+    chronik.fail = [503, 429, 200, 400]
+    stats = _sink(chronik, tmp_path, batch_records=2).ship()
+    # The first batch is accepted on the third attempt, the second one is rejected for good.
+    assert stats["retries"] == 2 and stats["rejected"] == 2
+    assert [r["n"] for r in chronik.records] == [0, 1]
+    _write(tmp_path, 4, 5)
+    _sink(chronik, tmp_path).ship()
+    assert [r["n"] for r in chronik.records] == [0, 1, 4]
+
+
+def test_retryable_errors_never_lose_records(chronik, tmp_path):
+    _write(tmp_path, 0, 6)
+    chronik.fail = [500, 502, 503]
+    _sink(chronik, tmp_path, batch_records=4).ship()
+    assert [r["n"] for r in chronik.records] == list(range(6))
+
+
+def test_checkpoint_survives_sealing(chronik, tmp_path):
+    wal = tmp_path / "wal"
+    with SegmentedWalWriter(wal, "session-s1", compression="gzip") as writer:
+        for n in range(3):
+            writer.append({"ts": "2025-01-01T12:00:00Z", "n": n})
+        writer.commit()
+        _sink(chronik, tmp_path).ship()
+        for n in range(3, 5):
+            writer.append({"ts": "2025-01-01T12:00:00Z", "n": n})
+    sink = _sink(chronik, tmp_path)
+    sink.ship()
+    assert [r["n"] for r in chronik.records] == list(range(5))
+    assert all(seg["done"] for seg in sink.checkpoint().values())
+
+
+def test_binary_segments_are_shipped_as_jsonl(chronik, tmp_path):
+    with WalWriter(tmp_path / "wal" / "session-s1.mwal", fmt="binary") as writer:
+        writer.append({"ts": "2025-01-01T12:00:00Z", "source": "os.context.text.embed", "embedding": [0.25, -0.5]})
+    _sink(chronik, tmp_path).ship()
+    assert chronik.records[0]["embedding"] == [0.25, -0.5]
+
+
+def test_follow_mode_tails_and_second_sink_is_refused(chronik, tmp_path):
+    _write(tmp_path, 0, 2)
+    sink = _sink(chronik, tmp_path, max_delay_ms=0, poll_ms=10)
+    with sink:
+        with pytest.raises(SinkError):
+            _sink(chronik, tmp_path).ship()
+        _write(tmp_path, 2, 5)
+        deadline = time.monotonic() + 5
+        while len(chronik.records) < 5 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    assert [r["n"] for r in chronik.records] == list(range(5))
+
+
+def test_stop_is_bounded_while_chronik_is_down(tmp_path):
+    _write(tmp_path, 0, 3)
+    sink = ChronikSink(
+        "http://127.0.0.1:9/ingest",
+        wal_dir=tmp_path / "wal",
+        checkpoint_path=tmp_path / "cp.json",
+        timeout_s=0.5,
+        max_delay_ms=0,
+        poll_ms=10,
+    )
+    sink.start()
+    time.sleep(0.1)
+    started = time.monotonic()
+    sink.stop()
+    assert time.monotonic() - started < 3
+    assert sink.stats()["sent_records"] == 0
+    # Nothing acknowledged, nothing checkpointed.
+    assert not (tmp_path / "cp.json").exists() or all(
+        v["offset"] == 0 for v in json.loads((tmp_path / "cp.json").read_text())["segments"].values()
+    )
+
+
+def test_from_env_requires_url(monkeypatch):
+    monkeypatch.delenv("CHRONIK_INGEST_URL", raising=False)
+    with pytest.raises(ValueError):
+        ChronikSink.from_env()
@@ -0,0 +1,75 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Modules a hotkey-bound `status`/`stop` must never pay for.
+HEAVY = (
+    "mitschreiber._mitschreiber",
+    "mitschreiber.session",
+    "mitschreiber.embed",
+    "mitschreiber.worker",
+    "mitschreiber.sink",
+    "mitschreiber.vindex",
+    "mitschreiber.backends",
+    "mitschreiber.embedding",
+    "mitschreiber.wal",
+    "mitschreiber.walbin",
+    "mitschreiber.metrics",
+    "mitschreiber.rollup",
+    "numpy",
+    "torch",
+    "sentence_transformers",
+    "onnxruntime",
+    "http.server",
+    "concurrent.futures",
+)
+
+# Cumulative import time of mitschreiber.cli; generous so slow CI runners pass,
+# far below what the extension plus embedding stack cost.
+IMPORT_BUDGET_US = 120_000
+
+PROBE = """
+import json, sys
+from mitschreiber.cli import main
+sys.argv = ["mitschreiber", sys.argv[1]]
+main()
+print(json.dumps(sorted(sys.modules)))
+"""
+
+
+def _run(args, tmp_path):
+    env = dict(os.environ, HOME=str(tmp_path), PYTHONPATH=str(ROOT))
+    return subprocess.run(
+        [sys.executable, *args], cwd=tmp_path, env=env, capture_output=True, text=True, check=True
+    )
+
+
+def test_status_and_stop_skip_heavy_imports(tmp_path):
+    for cmd in ("status", "stop"):
+        out = _run(["-c", PROBE, cmd], tmp_path)
+        loaded = set(json.loads(out.stdout.splitlines()[-1]))
+        assert not loaded & set(HEAVY), cmd
+
+
+def test_cli_import_time_budget(tmp_path):
+    out = _run(["-X", "importtime", "-c", "import mitschreiber.cli"], tmp_path)
+    cumulative = {}
+    for line in out.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, total, name = line.split("|")
+            if total.strip().isdigit():
+                cumulative[name.strip()] = int(total)
+    assert cumulative["mitschreiber.cli"] < IMPORT_BUDGET_US
+
+
+def test_cli_choices_match_the_modules():
+    from mitschreiber import backends, cli, wal
+
+    assert set(cli.EMBED_BACKENDS) == set(backends.available_backends())
+    assert cli.DURABILITY_MODES == wal.DURABILITY_MODES
+    assert cli.COMPRESSION_MODES == wal.COMPRESSION_MODES
+    assert cli.WAL_FORMATS == wal.WAL_FORMATS
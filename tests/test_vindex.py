@@ -0,0 +1,189 @@
+import json
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from mitschreiber.vindex import VectorIndex
+from mitschreiber.wal import SegmentedWalWriter, WalWriter
+
+DIM = 32
+
+
+def _embed_rec(i, vec, model="test-model"):
+    return {
+        "ts": f"2025-01-01T12:{i // 60 % 60:02d}:{i % 60:02d}+00:00",
+        "source": "os.context.text.embed",
+        "session": "s1",
+        "app": "vscode",
+        "window": f"window {i}",
+        "keyphrases": [f"kp{i}"],
+        "embedding": [float(x) for x in vec],
+        "hash_id": f"sha256:{i:064x}",
+        "privacy": {"raw_retained": False},
+        "meta": {"model": model},
+    }
+
+
+def _vectors(n, seed=1):
+    rng = np.random.default_rng(seed)
+    return rng.standard_normal((n, DIM)).astype(np.float32)
+
+
+def test_update_is_incremental_and_deduplicates(tmp_path):
+    wal_dir, idx_dir = tmp_path / "wal", tmp_path / "idx"
+    wal_dir.mkdir()
+    vecs = _vectors(30)
+    wal = wal_dir / "session-s1.jsonl"
+    with WalWriter(wal) as writer:
+        for i in range(20):
+            writer.append(_embed_rec(i, vecs[i]))
+            writer.append({"ts": "2025-01-01T12:00:00+00:00", "source": "os.context.state", "app": "x"})
+
+    index = VectorIndex(idx_dir)
+    assert index.update(wal_dir) == 20
+    assert index.update(wal_dir) == 0
+
+    with WalWriter(wal) as writer:
+        writer.append(_embed_rec(3, vecs[3]))  # already indexed
+        for i in range(20, 30):
+            writer.append(_embed_rec(i, vecs[i]))
+        writer.append(_embed_rec(99, _vectors(1)[0], model="other-model"))
+
+    reopened = VectorIndex(idx_dir)
+    assert reopened.update(wal_dir) == 10
+    assert len(reopened) == 30 and reopened.model == "test-model" and reopened.dim == DIM
+
+    hit = reopened.search(vecs[25], k=1)[0]
+    assert hit["window"] == "window 25"
+    assert hit["score"] == pytest.approx(1.0, abs=1e-5)
+
+
+def test_torn_rows_after_crash_are_dropped(tmp_path):
+    wal_dir = tmp_path / "wal"
+    wal_dir.mkdir()
+    vecs = _vectors(5)
+    with WalWriter(wal_dir / "session-s1.jsonl") as writer:
+        for i in range(5):
+            writer.append(_embed_rec(i, vecs[i]))
+    index = VectorIndex(tmp_path / "idx")
+    index.update(wal_dir)
+    # Rows written but state.json never updated.
+    with open(index.vectors_path, "ab") as fp:
+        fp.write(b"\0" * (DIM * 4 * 2 + 3))
+    with open(index.meta_path, "ab") as fp:
+        fp.write(b'{"window": "torn"}\n{"win')
+
+    again = VectorIndex(tmp_path / "idx")
+    assert again.update(wal_dir) == 0
+    assert again.vectors_path.stat().st_size == 5 * DIM * 4
+    assert [h["window"] for h in again.search(vecs[4], k=1)] == ["window 4"]
+
+
+def test_sealed_segments_keep_their_offsets(tmp_path):
+    vecs = _vectors(10)
+    index = VectorIndex(tmp_path / "idx")
+    with SegmentedWalWriter(tmp_path, "session-s1", compression="gzip") as writer:
+        for i in range(5):
+            writer.append(_embed_rec(i, vecs[i]))
+        assert index.update(tmp_path) == 5
+        for i in range(5, 10):
+            writer.append(_embed_rec(i, vecs[i]))
+    assert index.update(tmp_path) == 5
+    state = json.loads(index.state_path.read_text())
+    assert all(seg["done"] for seg in state["segments"].values())
+
+
+def test_top_k_matches_brute_force_and_ivf_recall(tmp_path):
+    wal_dir = tmp_path / "wal"
+    wal_dir.mkdir()
+    # Clustered data, like repeated windows of a few apps.
+    rng = np.random.default_rng(7)
+    centers = rng.standard_normal((20, DIM))
+    vecs = (centers[rng.integers(0, 20, 2000)] + 0.3 * rng.standard_normal((2000, DIM))).astype(np.float32)
+    with WalWriter(wal_dir / "session-s1.mwal", fmt="binary", group_commit=True) as writer:
+        for i, vec in enumerate(vecs):
+            writer.append(_embed_rec(i, vec))
+
+    index = VectorIndex(tmp_path / "idx")
+    index.update(wal_dir)
+    normed = vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+    queries = (vecs[rng.integers(0, 2000, 20)] + 0.3 * rng.standard_normal((20, DIM))).astype(np.float32)
+    exact = [index.search_rows(q, k=10) for q in queries]
+    for q, hits in zip(queries, exact):
+        expected = np.argsort(-(normed @ (q / np.linalg.norm(q))))[:10]
+        assert [row for (row, _) in hits] == list(expected)
+
+    index.build_ivf(nlist=20)
+    recall = np.mean([
+        len({r for (r, _) in index.search_rows(q, k=10, nprobe=4)} & {r for (r, _) in hits}) / 10
+        for q, hits in zip(queries, exact)
+    ])
+    assert recall >= 0.9
+
+
+def test_rows_added_after_ivf_build_are_found(tmp_path):
+    wal_dir = tmp_path / "wal"
+    wal_dir.mkdir()
+    vecs = _vectors(200)
+    wal = wal_dir / "session-s1.jsonl"
+    with WalWriter(wal) as writer:
+        for i in range(150):
+            writer.append(_embed_rec(i, vecs[i]))
+    index = VectorIndex(tmp_path / "idx")
+    index.update(wal_dir)
+    index.build_ivf(nlist=8)
+    with WalWriter(wal) as writer:
+        for i in range(150, 200):
+            writer.append(_embed_rec(i, vecs[i]))
+    index.update(wal_dir)
+    assert index.search(vecs[180], k=1, nprobe=1)[0]["window"] == "window 180"
+
+
+def test_search_rejects_wrong_dimension(tmp_path):
+    wal_dir = tmp_path / "wal"
+    wal_dir.mkdir()
+    with WalWriter(wal_dir / "session-s1.jsonl") as writer:
+        writer.append(_embed_rec(0, _vectors(1)[0]))
+    index = VectorIndex(tmp_path / "idx")
+    index.update(wal_dir)
+    with pytest.raises(ValueError):
+        index.search(np.ones(DIM + 1), k=1)
+
+
+def test_for_model_indexes_only_its_own_model(tmp_path):
+    wal_dir, root = tmp_path / "wal", tmp_path / "idx"
+    wal_dir.mkdir()
+    vecs = _vectors(6)
+    with WalWriter(wal_dir / "session-s1.jsonl") as writer:
+        # Another backend's records come first in the WAL.
+        writer.append(_embed_rec(100, [0.6, 0.8], model="hash32-demo"))
+        for i in range(6):
+            writer.append(_embed_rec(i, vecs[i], model="modelX" if i % 2 else "hash32-demo"))
+
+    index = VectorIndex.for_model("modelX", root=root)
+    assert index.update(wal_dir) == 3
+    assert (index.model, index.dim) == ("modelX", DIM)
+    assert index.search(vecs[3], k=1)[0]["window"] == "window 3"
+    reopened = VectorIndex.for_model("modelX", root=root)
+    assert reopened.model == "modelX" and len(reopened) == 3
+
+
+def test_for_model_rebuilds_an_index_of_another_model(tmp_path):
+    wal_dir, root = tmp_path / "wal", tmp_path / "idx"
+    wal_dir.mkdir()
+    vecs = _vectors(4)
+    with WalWriter(wal_dir / "session-s1.jsonl") as writer:
+        writer.append(_embed_rec(100, [0.6, 0.8], model="hash32-demo"))
+        for i in range(4):
+            writer.append(_embed_rec(i, vecs[i], model="modelX"))
+    # Left behind by an update that took its model from the first WAL record.
+    stale = VectorIndex(root / "modelX")
+    stale.update(wal_dir)
+    assert stale.model == "hash32-demo"
+
+    index = VectorIndex.for_model("modelX", root=root)
+    assert index.update(wal_dir) == 4
+    assert (index.model, index.dim, len(index)) == ("modelX", DIM, 4)
+    assert index.vectors_path.stat().st_size == 4 * DIM * 4
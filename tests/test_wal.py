@@ -0,0 +1,108 @@
+import json
+
+import pytest
+
+from mitschreiber.wal import WalWriter
+
+
+def test_append_raw_and_append_produce_one_record_per_line(tmp_path):
+    wal = tmp_path / "wal" / "session-x.jsonl"
+    raw = (
+        b'{"ts":"2025-01-01T12:00:00+00:00","app":"vscode","window":"m\xc3\xa4in.rs","clipboard":null,'
+        b'"source":"os.context.state","session":"x"}\n'
+    )
+    with WalWriter(wal) as writer:
+        writer.append_raw(raw)
+        writer.append_raw(b"")
+        writer.append({"source": "os.context.text.embed", "window": "mäin.rs"})
+
+    lines = wal.read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 2
+    assert json.loads(lines[0])["window"] == "mäin.rs"
+    assert json.loads(lines[1])["source"] == "os.context.text.embed"
+
+
+def test_group_commit_buffers_until_commit(tmp_path):
+    wal = tmp_path / "session-g.jsonl"
+    with WalWriter(wal, group_commit=True) as writer:
+        for n in range(5):
+            writer.append({"n": n})
+        assert wal.read_bytes() == b""
+        writer.commit()
+        assert len(wal.read_bytes().splitlines()) == 5
+        writer.append({"n": 5})
+    # close() commits the rest
+    assert [json.loads(l)["n"] for l in wal.read_text().splitlines()] == list(range(6))
+
+
+def test_group_commit_uses_one_write_per_commit(tmp_path, monkeypatch):
+    wal = tmp_path / "session-w.jsonl"
+    with WalWriter(wal, group_commit=True, durability="none") as writer:
+        writes = []
+        monkeypatch.setattr(writer, "file", _Spy(writer.file, writes))
+        for n in range(100):
+            writer.append({"n": n})
+        writer.commit()
+        assert len(writes) == 1
+        assert writes[0].count(b"\n") == 100
+
+
+def test_fdatasync_honours_record_budget(tmp_path, monkeypatch):
+    syncs = []
+    monkeypatch.setattr("mitschreiber.wal.os.fdatasync", lambda fd: syncs.append(fd))
+    wal = tmp_path / "session-s.jsonl"
+    with WalWriter(wal, durability="fdatasync", sync_interval_ms=3_600_000, sync_every=10) as writer:
+        for n in range(25):
+            writer.append({"n": n})
+        assert len(syncs) == 2
+    # The unsynced tail is synced on close.
+    assert len(syncs) == 3
+
+
+def test_rejects_unknown_durability(tmp_path):
+    with pytest.raises(ValueError):
+        WalWriter(tmp_path / "x.jsonl", durability="sometimes")
+
+
+class _Spy:
+    def __init__(self, inner, writes):
+        self._inner = inner
+        self._writes = writes
+
+    def write(self, data):
+        self._writes.append(data)
+        return self._inner.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._inner, name)
+
+
+def test_segmented_writer_rotates_and_compresses(tmp_path):
+    import gzip
+    from mitschreiber.wal import SegmentedWalWriter
+
+    sealed = []
+    with SegmentedWalWriter(
+        tmp_path, "session-abc", max_segment_bytes=200, max_segment_age_s=0, on_sealed=sealed.append
+    ) as writer:
+        for n in range(20):
+            writer.append({"n": n, "pad": "x" * 20})
+
+    names = sorted(p.name for p in tmp_path.iterdir())
+    assert names[0] == "session-abc-00000.jsonl.gz"
+    assert all(name.endswith(".jsonl.gz") for name in names)
+    assert len(sealed) == len(names) > 1
+
+    records = []
+    for name in names:
+        with gzip.open(tmp_path / name, "rt", encoding="utf-8") as fh:
+            records.extend(json.loads(line)["n"] for line in fh)
+    assert records == list(range(20))
+
+
+def test_segmented_writer_continues_sequence(tmp_path):
+    from mitschreiber.wal import SegmentedWalWriter
+
+    (tmp_path / "session-abc-00003.jsonl.gz").write_bytes(b"")
+    writer = SegmentedWalWriter(tmp_path, "session-abc", compression="none")
+    assert writer.path.name == "session-abc-00004.jsonl"
@@ -0,0 +1,66 @@
+import io
+import json
+import math
+
+import pytest
+
+from mitschreiber import walbin
+from mitschreiber.wal import WalWriter
+from mitschreiber.walio import iter_records
+
+
+def _embed_evt(dim=384):
+    return {
+        "ts": "2025-01-01T12:00:05Z",
+        "source": "os.context.text.embed",
+        "session": "s",
+        "app": "vscode",
+        "window": "README.md — mitschreiber",
+        "keyphrases": ["mitschreiber", "readme"],
+        "embedding": [math.sin(i) / math.sqrt(dim) for i in range(dim)],
+        "hash_id": "sha256:" + "ab" * 32,
+        "privacy": {"raw_retained": False},
+        "meta": {"model": "test"},
+    }
+
+
+def test_roundtrip_through_binary_writer(tmp_path):
+    wal = tmp_path / "session-x-00000.mwal"
+    state_line = b'{"ts":"2025-01-01T12:00:00+00:00","app":"vscode","window":"w","source":"os.context.state","session":"s"}\n'
+    with WalWriter(wal, fmt="binary") as writer:
+        writer.append_raw(state_line * 2)
+        writer.append(_embed_evt())
+
+    records = list(iter_records(wal))
+    assert [r["source"] for r in records] == ["os.context.state"] * 2 + ["os.context.text.embed"]
+    assert records[2]["embedding"] == pytest.approx(_embed_evt()["embedding"], abs=1e-7)
+    assert records[2]["keyphrases"] == ["mitschreiber", "readme"]
+
+
+def test_binary_embed_is_much_smaller_than_json():
+    evt = _embed_evt()
+    binary = len(walbin.encode_record(evt))
+    text = len(json.dumps(evt).encode("utf-8"))
+    assert text / binary > 3
+
+
+def test_to_jsonl_produces_plain_json_numbers():
+    evt = _embed_evt(dim=8)
+    evt["embedding"] = [0.1, -0.063, 0.026, 0.5, 0.0, 1.0, -1.0, 0.333]
+    src = io.BytesIO(walbin.MAGIC + walbin.encode_record(evt))
+    dst = io.BytesIO()
+    assert walbin.to_jsonl(src, dst) == 1
+    obj = json.loads(dst.getvalue())
+    assert obj["embedding"] == [0.1, -0.063, 0.026, 0.5, 0.0, 1.0, -1.0, 0.333]
+    assert "embedding" in obj and obj["privacy"] == {"raw_retained": False}
+
+
+def test_truncated_tail_is_ignored():
+    data = walbin.MAGIC + walbin.encode_record({"n": 1}) + walbin.encode_record({"n": 2})
+    records = list(walbin.iter_records(io.BytesIO(data[:-3])))
+    assert records == [{"n": 1}]
+
+
+def test_bad_magic_is_rejected():
+    with pytest.raises(ValueError):
+        list(walbin.iter_records(io.BytesIO(b"{}\n")))
@@ -0,0 +1,84 @@
+import threading
+import time
+
+from mitschreiber.worker import EmbedWorker
+
+
+class ListWriter:
+    def __init__(self):
+        self.records = []
+        self.lock = threading.Lock()
+
+    def append(self, obj):
+        with self.lock:
+            self.records.append(obj)
+
+    def commit(self):
+        pass
+
+
+def _fake_batch(calls):
+    def build(evts):
+        calls.append(len(evts))
+        return [{"source": "os.context.text.embed", "n": e["n"]} for e in evts]
+    return build
+
+
+def test_worker_batches_by_size_and_flushes_on_close():
+    writer, calls = ListWriter(), []
+    worker = EmbedWorker(writer, _fake_batch(calls), max_batch=4, max_delay_ms=10_000)
+    with worker:
+        for n in range(10):
+            assert worker.submit({"n": n})
+    # Two full batches by size, the remainder flushed on close.
+    assert calls == [4, 4, 2]
+    assert [r["n"] for r in writer.records] == list(range(10))
+    stats = worker.stats()
+    assert stats["batches"] == 3
+    assert stats["embedded"] == 10
+    assert stats["queue_depth"] == 0
+
+
+def test_worker_flushes_partial_batch_after_deadline():
+    writer, calls = ListWriter(), []
+    with EmbedWorker(writer, _fake_batch(calls), max_batch=100, max_delay_ms=20) as worker:
+        worker.submit({"n": 1})
+        deadline = time.monotonic() + 2
+        while not writer.records and time.monotonic() < deadline:
+            time.sleep(0.005)
+        assert calls == [1]
+
+
+def test_slow_model_does_not_block_submit_and_drops_when_full():
+    release = threading.Event()
+
+    def slow_build(evts):
+        release.wait(5)
+        return [None for _ in evts]
+
+    worker = EmbedWorker(ListWriter(), slow_build, max_batch=1, max_delay_ms=0, queue_size=2)
+    worker.start()
+    try:
+        t0 = time.perf_counter()
+        accepted = [worker.submit({"n": n}) for n in range(20)]
+        assert time.perf_counter() - t0 < 0.5
+        assert not all(accepted)
+        assert worker.stats()["dropped"] > 0
+    finally:
+        release.set()
+        worker.close()
+
+
+def test_failing_batch_is_counted_and_worker_survives():
+    writer = ListWriter()
+
+    def build(evts):
+        if evts[0]["n"] == 0:
+            raise RuntimeError("model exploded")
+        return [{"n": e["n"]} for e in evts]
+
+    with EmbedWorker(writer, build, max_batch=1, max_delay_ms=0) as worker:
+        worker.submit({"n": 0})
+        worker.submit({"n": 1})
+    assert worker.stats()["errors"] == 1
+    assert writer.records == [{"n": 1}]